@@ -0,0 +1,130 @@
+import asyncio
+import os
+import random
+import time
+import bson
+import motor.motor_asyncio
+from dotenv import load_dotenv
+from generate_test_data import generate_user_data
+from models import User
+from services import build_potential_matches_pipeline
+
+load_dotenv()
+
+BENCHMARK_DB_NAME = "roommate_benchmark"
+NUM_PROBES = 50
+
+def build_legacy_pipeline(user: User):
+    """Pipeline used before the reciprocal-radius check moved into the database"""
+    return [
+        {
+            "$geoNear": {
+                "near": {
+                    "type": "Point",
+                    "coordinates": user.location.coordinates
+                },
+                "distanceField": "distance",
+                "maxDistance": user.search_radius * 1000,
+                "spherical": True
+            }
+        },
+        {
+            "$match": {
+                "telegram_id": {"$ne": user.telegram_id},
+                "is_active": True,
+                "$or": [
+                    {
+                        "price_range_min": {"$lte": user.price_range_max},
+                        "price_range_max": {"$gte": user.price_range_min}
+                    }
+                ]
+            }
+        }
+    ]
+
+async def seed_users(db, num_users: int):
+    """Fill the benchmark database with generated users"""
+    existing = await db.users.count_documents({})
+    if existing >= num_users:
+        print(f"📊 Using {existing} existing users")
+        return
+
+    await db.users.delete_many({})
+    print(f"Generating {num_users} users...")
+    telegram_ids = set()
+    batch = []
+    for i in range(num_users):
+        user = generate_user_data()
+        while user.telegram_id in telegram_ids:
+            user.telegram_id = random.randint(1000000000, 9999999999)
+        telegram_ids.add(user.telegram_id)
+        batch.append(user.model_dump())
+        if len(batch) == 10000:
+            await db.users.insert_many(batch, ordered=False)
+            batch = []
+            print(f"Inserted {i + 1} users")
+    if batch:
+        await db.users.insert_many(batch, ordered=False)
+
+    await db.users.create_index([("location", "2dsphere")])
+    await db.users.create_index("telegram_id", unique=True)
+
+async def run_pipeline(collection, pipeline, keep):
+    """Run a pipeline and return (documents, bytes, kept documents, seconds)"""
+    start = time.perf_counter()
+    docs = await collection.aggregate(pipeline).to_list(length=None)
+    elapsed = time.perf_counter() - start
+    num_bytes = sum(len(bson.encode(doc)) for doc in docs)
+    kept = sum(1 for doc in docs if keep(doc))
+    return len(docs), num_bytes, kept, elapsed
+
+async def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare transfer volume of the potential matches query.")
+    parser.add_argument("--users", type=int, default=100000, help="Number of users in the benchmark database.")
+    parser.add_argument("--probes", type=int, default=NUM_PROBES, help="Number of users to run the query for.")
+    args = parser.parse_args()
+
+    client = motor.motor_asyncio.AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[BENCHMARK_DB_NAME]
+    await seed_users(db, args.users)
+
+    probes = await db.users.aggregate([{"$sample": {"size": args.probes}}]).to_list(length=None)
+
+    totals = {
+        "legacy": {"docs": 0, "bytes": 0, "kept": 0, "seconds": 0.0},
+        "pushdown": {"docs": 0, "bytes": 0, "kept": 0, "seconds": 0.0}
+    }
+    for probe in probes:
+        user = User(**probe)
+        legacy = await run_pipeline(
+            db.users,
+            build_legacy_pipeline(user),
+            lambda doc: doc.get("distance", 0) <= doc["search_radius"] * 1000
+        )
+        pushdown = await run_pipeline(db.users, build_potential_matches_pipeline(user), lambda doc: True)
+        for name, (docs, num_bytes, kept, seconds) in (("legacy", legacy), ("pushdown", pushdown)):
+            totals[name]["docs"] += docs
+            totals[name]["bytes"] += num_bytes
+            totals[name]["kept"] += kept
+            totals[name]["seconds"] += seconds
+
+    print(f"\n📈 Potential matches over {len(probes)} probes, {args.users} users")
+    print(f"{'pipeline':<10} {'docs/query':>12} {'KB/query':>10} {'results':>10} {'ms/query':>10}")
+    for name, total in totals.items():
+        n = max(len(probes), 1)
+        print(
+            f"{name:<10} {total['docs'] / n:>12.1f} {total['bytes'] / n / 1024:>10.1f} "
+            f"{total['kept'] / n:>10.1f} {total['seconds'] / n * 1000:>10.2f}"
+        )
+
+    if totals["pushdown"]["kept"] != totals["legacy"]["kept"]:
+        print("❌ Result counts differ between pipelines")
+    else:
+        print("✅ Both pipelines return the same matches")
+
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+import argparse
+import gzip
+import random
+import time
+from typing import Callable, List
+
+import msgpack
+import orjson
+import generate_test_data
+from generate_test_data import generate_property_data, generate_user_data
+from serialization import (
+    dumps,
+    packb,
+    property_listing_from_doc,
+    property_response_from_doc,
+    user_response_from_doc
+)
+
+NUM_ITEMS = 2000
+NUM_ROUNDS = 5
+SEED = 42
+
+def measure(func: Callable, arg, rounds: int) -> float:
+    """Best time per call in milliseconds"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+def build_datasets(num_items: int) -> dict:
+    """Response payloads for the list endpoints, built from generated Moscow data"""
+    properties = [generate_property_data().model_dump() for _ in range(num_items)]
+    users = [generate_user_data().model_dump() for _ in range(num_items)]
+    return {
+        "properties": [property_response_from_doc(prop) for prop in properties],
+        "tile": [property_listing_from_doc(prop) for prop in properties[:500]],
+        "matches": [user_response_from_doc(user) for user in users]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and MessagePack response size and speed.")
+    parser.add_argument("--items", type=int, default=NUM_ITEMS, help="Number of properties and users.")
+    parser.add_argument("--rounds", type=int, default=NUM_ROUNDS, help="Number of timed rounds.")
+    parser.add_argument("--seed", type=int, default=SEED, help="Seed for the generated data.")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    generate_test_data.fake.seed_instance(args.seed)
+    datasets = build_datasets(args.items)
+
+    print(f"📈 Response formats (best of {args.rounds})")
+    print(f"{'payload':<12}{'format':<9}{'bytes':>10}{'gzip':>10}{'encode ms':>11}{'decode ms':>11}")
+    for name, content in datasets.items():
+        json_body = dumps(content)
+        msgpack_body = packb(content)
+        if orjson.loads(json_body) != msgpack.unpackb(msgpack_body):
+            print(f"❌ {name}: decoded data differs between formats")
+            return
+
+        rows = [
+            ("json", json_body, dumps, orjson.loads),
+            ("msgpack", msgpack_body, packb, msgpack.unpackb)
+        ]
+        for format_name, body, encode, decode in rows:
+            print(
+                f"{name:<12}{format_name:<9}{len(body):>10}{len(gzip.compress(body)):>10}"
+                f"{measure(encode, content, args.rounds):>11.2f}{measure(decode, body, args.rounds):>11.2f}"
+            )
+
+if __name__ == "__main__":
+    main()
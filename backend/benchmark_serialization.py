@@ -0,0 +1,76 @@
+import argparse
+import json
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+from generate_test_data import generate_property_data
+from models import PropertyResponse
+from serialization import dumps, property_response_from_doc
+
+NUM_ITEMS = 2000
+NUM_ROUNDS = 5
+
+property_list_adapter = TypeAdapter(List[PropertyResponse])
+
+def legacy_serialize(docs: List[dict]) -> bytes:
+    """Field-by-field validation, then FastAPI's response_model pass and json.dumps"""
+    items = [
+        PropertyResponse(
+            id=prop["id"],
+            title=prop["title"],
+            description=prop["description"],
+            price=prop["price"],
+            address=prop["address"],
+            metro_station=prop["metro_station"],
+            latitude=prop["location"]["coordinates"][1],
+            longitude=prop["location"]["coordinates"][0],
+            rooms=prop["rooms"],
+            area=prop["area"],
+            floor=prop["floor"],
+            total_floors=prop["total_floors"],
+            property_type=prop["property_type"],
+            photos=prop.get("photos", []),
+            amenities=prop.get("amenities", []),
+            created_at=prop["created_at"],
+            is_liked=False
+        )
+        for prop in docs
+    ]
+    validated = property_list_adapter.validate_python(items)
+    content = property_list_adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def fast_serialize(docs: List[dict]) -> bytes:
+    """model_construct mapping rendered by FastJSONResponse"""
+    return dumps([property_response_from_doc(prop) for prop in docs])
+
+def measure(serialize, docs: List[dict], rounds: int) -> float:
+    """Best time per item in microseconds"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        serialize(docs)
+        best = min(best, time.perf_counter() - start)
+    return best / len(docs) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-item cost of list response serialization.")
+    parser.add_argument("--items", type=int, default=NUM_ITEMS, help="Number of properties in the list.")
+    parser.add_argument("--rounds", type=int, default=NUM_ROUNDS, help="Number of timed rounds.")
+    args = parser.parse_args()
+
+    docs = [generate_property_data().model_dump() for _ in range(args.items)]
+
+    if json.loads(legacy_serialize(docs)) != json.loads(fast_serialize(docs)):
+        print("❌ Serialized output differs between paths")
+        return
+
+    legacy = measure(legacy_serialize, docs, args.rounds)
+    fast = measure(fast_serialize, docs, args.rounds)
+    print(f"📈 Serializing {args.items} properties (best of {args.rounds})")
+    print(f"legacy: {legacy:8.2f} µs/item")
+    print(f"fast:   {fast:8.2f} µs/item  ({legacy / fast:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+from benchmark_stats import percentile
+from cache import liked_cache, profile_cache
+from database import close_mongo_connection, connect_to_mongo, get_database
+from generate_test_data import generate_parallel, generator_config
+from indexes import apply_index_spec
+from serialization import dumps
+from services import (
+    get_potential_matches_service,
+    get_properties_near_user_service,
+    get_user_matches_service
+)
+import spatial_index
+from spatial_index import get_property_index, start_property_index, stop_property_index
+
+DEFAULT_SIZES = "10000,100000,1000000"
+NUM_PROBES = 30
+SEED = 42
+# Fail when p95 latency or documents examined grow by more than this fraction
+REGRESSION_THRESHOLD = 0.25
+# Mean likes per user asked of the generator; with its heavy tail and
+# rounding down, about as many likes as users are generated
+LIKES_PER_USER = 1
+# Bumped when generate_test_data changes the rows it produces, so older
+# benchmark datasets are seeded again
+DATASET_GENERATOR = 2
+
+SERVICES = {
+    "properties_near_user": get_properties_near_user_service,
+    "potential_matches": get_potential_matches_service,
+    "user_matches": get_user_matches_service
+}
+
+def benchmark_db_name(size: int) -> str:
+    return f"roommate_benchmark_{size}"
+
+async def seed_dataset(size: int, density: float, seed: int, likes_per_user: int, workers: int):
+    """Fill the size's benchmark database with users, properties, likes and matches.
+
+    Rows come from the chunked process-pool generator of generate_test_data,
+    so even the largest sizes are never held in memory. The same parameters
+    always produce the same documents, so an existing dataset with matching
+    parameters is reused.
+    """
+    db = get_database()
+    dataset = {
+        "size": size,
+        "density": density,
+        "seed": seed,
+        "likes_per_user": likes_per_user,
+        "generator": DATASET_GENERATOR
+    }
+    existing = await db.meta.find_one({"_id": "benchmark_dataset"})
+    if existing and {key: existing.get(key) for key in dataset} == dataset:
+        print(f"📊 Using existing dataset in {db.name}")
+        return
+
+    print(f"Seeding {db.name}: {size} users and properties (density {density}, {workers} workers)...")
+    for name in ("users", "properties", "likes", "matches", "meta"):
+        await db[name].delete_many({})
+
+    config = generator_config(size, size, likes_per_user=likes_per_user, density=density)
+    started = time.perf_counter()
+    counts = await generate_parallel(db, config, seed, workers)
+    print(
+        f"Inserted {counts.get('users', 0)} users, {counts.get('properties', 0)} properties, "
+        f"{counts.get('likes', 0)} likes and {counts.get('matches', 0)} matches "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+    await apply_index_spec(db)
+    await db.meta.insert_one({"_id": "benchmark_dataset", **dataset})
+
+async def query_executor_counters() -> Dict[str, int]:
+    status = await get_database().client.admin.command("serverStatus")
+    executor = status["metrics"]["queryExecutor"]
+    return {"docs": executor["scannedObjects"], "keys": executor["scanned"]}
+
+async def measure_service(service, probes: List[dict]) -> Dict[str, float]:
+    """Latency, documents/keys examined and response bytes over the probe users.
+
+    Caches are cleared before every call, so each one measures the database path.
+    """
+    latencies, docs_examined, keys_examined, response_bytes, results = [], [], [], [], []
+    await service(probes[0]["telegram_id"])  # warm up connections
+
+    for probe in probes:
+        profile_cache.invalidate(probe["telegram_id"], notify=False)
+        liked_cache.invalidate(probe["id"])
+        before = await query_executor_counters()
+        start = time.perf_counter()
+        result = await service(probe["telegram_id"])
+        latencies.append(time.perf_counter() - start)
+        after = await query_executor_counters()
+        docs_examined.append(after["docs"] - before["docs"])
+        keys_examined.append(after["keys"] - before["keys"])
+        response_bytes.append(len(dumps(result)))
+        results.append(len(result))
+
+    latencies.sort()
+    n = len(probes)
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "mean_ms": sum(latencies) / n * 1000,
+        "docs_examined": sum(docs_examined) / n,
+        "keys_examined": sum(keys_examined) / n,
+        "bytes_returned": sum(response_bytes) / n,
+        "results": sum(results) / n
+    }
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> List[str]:
+    regressions = []
+    for size, services in results.items():
+        for name, stats in services.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base:
+                continue
+            for metric in ("p95_ms", "docs_examined"):
+                if base[metric] and stats[metric] > base[metric] * (1 + threshold):
+                    regressions.append(
+                        f"{name} @ {size}: {metric} {base[metric]:.1f} -> {stats[metric]:.1f} "
+                        f"(+{(stats[metric] / base[metric] - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the read services over scaled datasets.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated dataset sizes (users = properties, about as many likes).")
+    parser.add_argument("--density", type=float, default=1.0, help="Fraction of the Moscow bounding box to place data in (0.1 = central Moscow).")
+    parser.add_argument("--likes-per-user", type=int, default=LIKES_PER_USER, help="Mean likes per user asked of the generator.")
+    parser.add_argument("--workers", type=int, default=None, help="Generator processes (default: one per CPU).")
+    parser.add_argument("--probes", type=int, default=NUM_PROBES, help="Number of users to call each service for.")
+    parser.add_argument("--seed", type=int, default=SEED, help="Seed for the generated datasets.")
+    parser.add_argument("--spatial-index", action="store_true", help="Serve property search from the in-process index.")
+    parser.add_argument("--output", help="Write results to this JSON file.")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run; exit with status 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Allowed relative growth before a regression fails the run.")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = {}
+    await connect_to_mongo()
+    for size in sizes:
+        os.environ["MONGODB_DB_NAME"] = benchmark_db_name(size)
+        await seed_dataset(size, args.density, args.seed, args.likes_per_user, args.workers or os.cpu_count() or 1)
+        db = get_database()
+        if args.spatial_index:
+            spatial_index.SPATIAL_INDEX_ENABLED = True
+            await start_property_index(db.properties)
+            while get_property_index() is None:
+                await asyncio.sleep(0.1)
+
+        # Generated ids are hashes of the row index, unlike telegram_ids, which
+        # grow with it and would pick the most liked users
+        probes = await db.users.find(
+            {"is_active": True},
+            {"_id": 0, "id": 1, "telegram_id": 1}
+        ).sort("id", 1).limit(args.probes).to_list(length=None)
+
+        results[str(size)] = {}
+        print(f"\n📈 {size} documents per collection, {len(probes)} probes")
+        print(f"{'service':<22}{'p50 ms':>9}{'p95 ms':>9}{'docs exam.':>12}{'keys exam.':>12}{'KB':>9}{'results':>9}")
+        for name, service in SERVICES.items():
+            stats = await measure_service(service, probes)
+            results[str(size)][name] = stats
+            print(
+                f"{name:<22}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['docs_examined']:>12.0f}"
+                f"{stats['keys_examined']:>12.0f}{stats['bytes_returned'] / 1024:>9.1f}{stats['results']:>9.1f}"
+            )
+
+        if args.spatial_index:
+            await stop_property_index()
+    await close_mongo_connection()
+
+    report = {
+        "config": {
+            "sizes": sizes,
+            "density": args.density,
+            "probes": args.probes,
+            "seed": args.seed,
+            "spatial_index": args.spatial_index
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions over {args.threshold * 100:.0f}%:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regressions over {args.threshold * 100:.0f}%")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,9 @@
+"""Summary statistics shared by the benchmark and load-test scripts"""
+from typing import List
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list; 0.0 when it is empty"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
@@ -0,0 +1,371 @@
+"""In-process caches for hot per-user data.
+
+Each uvicorn worker keeps its own caches. When CACHE_BUS_DIR is set, workers
+on the same host share invalidations over Unix datagram sockets in that
+directory, so a profile update in one worker evicts it in the others.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+LIKED_CACHE_MAX_BYTES = int(os.getenv("LIKED_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LIKED_CACHE_TTL_SECONDS = float(os.getenv("LIKED_CACHE_TTL_SECONDS", "300"))
+LIKED_CACHE_MAX_ITEMS = int(os.getenv("LIKED_CACHE_MAX_ITEMS", "5000"))
+
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "50000"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+CACHE_BUS_DIR = os.getenv("CACHE_BUS_DIR")
+
+LIKE_TARGET_TYPES = ("user", "property")
+
+# Rough footprint of one cached id (a 36-char str plus its set slot) and of an entry
+BYTES_PER_ID = 120
+BYTES_PER_ENTRY = 400
+
+class _LoadGenerations:
+    """Generation counters of the keys being loaded from the database.
+
+    begin() returns the key's current generation and invalidate() bumps it,
+    so a load whose generation is no longer current may have read stale data.
+    A key is only tracked while loads of it are in flight; every begin() must
+    be paired with an end().
+    """
+
+    def __init__(self):
+        # key -> [generation, loads in flight]
+        self._keys: Dict[Hashable, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def begin(self, key: Hashable) -> int:
+        state = self._keys.setdefault(key, [0, 0])
+        state[1] += 1
+        return state[0]
+
+    def is_current(self, key: Hashable, generation: int) -> bool:
+        state = self._keys.get(key)
+        return state is not None and state[0] == generation
+
+    def end(self, key: Hashable):
+        state = self._keys.get(key)
+        if state is None:
+            return
+        state[1] -= 1
+        if state[1] <= 0:
+            del self._keys[key]
+
+    def invalidate(self, key: Hashable):
+        state = self._keys.get(key)
+        if state is not None:
+            state[0] += 1
+
+class _LikedEntry:
+    __slots__ = ("target_ids", "expires_at", "size")
+
+    def __init__(self, target_ids: Optional[Set[str]], expires_at: float):
+        self.target_ids = target_ids
+        self.expires_at = expires_at
+        self.size = BYTES_PER_ENTRY + BYTES_PER_ID * (len(target_ids) if target_ids else 0)
+
+class LikedSetCache:
+    """LRU cache of the ids each user has liked, per target type.
+
+    Entries expire after a TTL and the least recently used ones are evicted
+    once the estimated size passes the memory budget. Users with more than
+    `max_items` likes are remembered as oversized and not cached; callers
+    then fall back to looking likes up in the database.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = LIKED_CACHE_MAX_BYTES,
+        ttl_seconds: float = LIKED_CACHE_TTL_SECONDS,
+        max_items: int = LIKED_CACHE_MAX_ITEMS
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self._entries: "OrderedDict[Tuple[str, str], _LikedEntry]" = OrderedDict()
+        self._bytes = 0
+        # Bumped by every like or invalidation while a key is being loaded
+        self._loads = _LoadGenerations()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        # Called with the user id after a write-through, e.g. to notify other workers
+        self.on_write: Optional[Callable[[str], None]] = None
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[_LikedEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def get(self, user_id: str, target_type: str) -> Optional[Set[str]]:
+        """Return the user's liked ids, or None if they are not cached"""
+        key = (user_id, target_type)
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.target_ids is None:
+            self.bypasses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry.target_ids
+
+    def needs_load(self, user_id: str, target_type: str) -> bool:
+        """Whether the user's likes are neither cached nor known to be oversized"""
+        return self._lookup((user_id, target_type)) is None
+
+    def begin_load(self, user_id: str, target_type: str) -> int:
+        """Mark the start of a database read whose result will be passed to put().
+
+        Returns the generation to pass to put(); end_load() must follow, e.g.
+        in a finally block.
+        """
+        return self._loads.begin((user_id, target_type))
+
+    def end_load(self, user_id: str, target_type: str):
+        self._loads.end((user_id, target_type))
+
+    def put(self, user_id: str, target_type: str, target_ids: Iterable[str], generation: int) -> bool:
+        """Cache the full set of ids the user has liked.
+
+        The result is dropped if a like was written or the user invalidated
+        after the begin_load() that returned `generation`, since the read may
+        not have seen it. Returns whether the ids were cached.
+        """
+        key = (user_id, target_type)
+        if not self._loads.is_current(key, generation):
+            return False
+        target_ids = set(target_ids)
+        if len(target_ids) > self.max_items:
+            target_ids = None
+        self._store(key, _LikedEntry(target_ids, time.monotonic() + self.ttl_seconds))
+        return target_ids is not None
+
+    def _store(self, key: Tuple[str, str], entry: _LikedEntry):
+        self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    def add(self, user_id: str, target_type: str, target_id: str):
+        """Write-through for a new like; only cached sets are updated"""
+        key = (user_id, target_type)
+        self._loads.invalidate(key)
+        if self.on_write is not None:
+            self.on_write(user_id)
+        entry = self._lookup(key)
+        if entry is None or entry.target_ids is None or target_id in entry.target_ids:
+            return
+        if len(entry.target_ids) >= self.max_items:
+            self._store(key, _LikedEntry(None, entry.expires_at))
+            return
+        entry.target_ids.add(target_id)
+        entry.size += BYTES_PER_ID
+        self._bytes += BYTES_PER_ID
+
+    def invalidate(self, user_id: str):
+        """Forget everything cached for a user"""
+        for target_type in LIKE_TARGET_TYPES:
+            key = (user_id, target_type)
+            self._remove(key)
+            self._loads.invalidate(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "loading": len(self._loads),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "evictions": self.evictions
+        }
+
+class TTLCache:
+    """LRU cache with a bounded number of entries that expire after a TTL.
+
+    Loads follow the same protocol as LikedSetCache: begin_load() before the
+    database read, put() with the generation it returned, and end_load()
+    whatever the read found, so a value invalidated mid-read is not stored.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._loads = _LoadGenerations()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Called with the key of every local invalidation, e.g. to notify other workers
+        self.on_invalidate: Optional[Callable[[Hashable], None]] = None
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._entries.get(key)
+        if item is None or item[1] <= time.monotonic():
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return item[0]
+
+    def begin_load(self, key: Hashable) -> int:
+        return self._loads.begin(key)
+
+    def end_load(self, key: Hashable):
+        self._loads.end(key)
+
+    def put(self, key: Hashable, value: Any, generation: int):
+        if not self._loads.is_current(key, generation):
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable, notify: bool = True):
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+        self._loads.invalidate(key)
+        if notify and self.on_invalidate is not None:
+            self.on_invalidate(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "loading": len(self._loads),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+class _BusProtocol(asyncio.DatagramProtocol):
+    def __init__(self, bus: "CacheInvalidationBus"):
+        self.bus = bus
+
+    def datagram_received(self, data: bytes, addr):
+        self.bus._dispatch(data)
+
+class CacheInvalidationBus:
+    """Broadcasts cache invalidations between workers on the same host.
+
+    Every worker binds a Unix datagram socket named after its pid in a shared
+    directory; publishing sends one datagram to every other socket there.
+    Sockets of workers that have exited are removed when a send to them fails.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        self._handlers: Dict[str, Callable[[str], None]] = {}
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._sender: Optional[socket.socket] = None
+        self._path: Optional[str] = None
+        self.sent = 0
+        self.received = 0
+
+    def register(self, name: str, handler: Callable[[str], None]):
+        """Call handler(key) when another worker publishes an invalidation for `name`"""
+        self._handlers[name] = handler
+
+    async def start(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = os.path.join(self.directory, f"{os.getpid()}.sock")
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _BusProtocol(self),
+            local_addr=self._path,
+            family=socket.AF_UNIX
+        )
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        logger.info("Cache invalidation bus listening on %s", self._path)
+
+    async def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
+        if self._path and os.path.exists(self._path):
+            os.unlink(self._path)
+        self._path = None
+
+    def publish(self, name: str, key: Hashable):
+        if self._sender is None:
+            return
+        message = f"{name} {key}".encode()
+        for entry in os.scandir(self.directory):
+            if entry.path == self._path or not entry.name.endswith(".sock"):
+                continue
+            try:
+                self._sender.sendto(message, entry.path)
+                self.sent += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                # The peer's queue is full; its entry will still expire by TTL
+                logger.warning("Dropped cache invalidation for %s", entry.path)
+
+    def _dispatch(self, data: bytes):
+        name, _, key = data.decode().partition(" ")
+        handler = self._handlers.get(name)
+        if handler is not None:
+            self.received += 1
+            handler(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {"sent": self.sent, "received": self.received}
+
+liked_cache = LikedSetCache()
+profile_cache = TTLCache(PROFILE_CACHE_MAX_ENTRIES, PROFILE_CACHE_TTL_SECONDS)
+cache_bus = CacheInvalidationBus(CACHE_BUS_DIR)
+
+async def start_cache_bus():
+    """Share profile and liked-set invalidations with the other workers"""
+    profile_cache.on_invalidate = lambda telegram_id: cache_bus.publish("profile", telegram_id)
+    liked_cache.on_write = lambda user_id: cache_bus.publish("liked", user_id)
+    cache_bus.register("profile", lambda key: profile_cache.invalidate(int(key), notify=False))
+    cache_bus.register("liked", liked_cache.invalidate)
+    await cache_bus.start()
+
+async def stop_cache_bus():
+    await cache_bus.stop()
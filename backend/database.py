@@ -2,6 +2,8 @@ import motor.motor_asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
+from metrics import mongo_event_listeners
+from slow_queries import slow_query_recorder
 
 load_dotenv()
 
@@ -12,9 +14,13 @@ client: AsyncIOMotorClient = None
 async def connect_to_mongo():
     global client
     try:
-        client = AsyncIOMotorClient(MONGO_URL)
+        client = AsyncIOMotorClient(
+            MONGO_URL,
+            event_listeners=mongo_event_listeners() + [slow_query_recorder]
+        )
         # Test connection
         await client.admin.command('ping')
+        slow_query_recorder.attach(client)
         print("✅ Connected to MongoDB successfully")
     except Exception as e:
         print(f"❌ Failed to connect to MongoDB: {e}")
@@ -22,6 +28,7 @@ async def connect_to_mongo():
 
 async def close_mongo_connection():
     global client
+    await slow_query_recorder.detach()
     if client:
         client.close()
         client = None
@@ -49,19 +56,14 @@ def get_matches_collection():
     db = get_database()
     return db.matches
 
-async def create_indexes():
-    """Create necessary indexes for geospatial queries"""
-    users_collection = get_users_collection()
-    properties_collection = get_properties_collection()
-    likes_collection = get_likes_collection()
-    
-    # Create geospatial indexes
-    await users_collection.create_index([("location", "2dsphere")])
-    await properties_collection.create_index([("location", "2dsphere")])
-    
-    # Create regular indexes
-    await users_collection.create_index("telegram_id", unique=True)
-    await likes_collection.create_index([("user_id", 1), ("target_id", 1), ("target_type", 1)], unique=True)
-    await users_collection.create_index("created_at")
-    await properties_collection.create_index("created_at")
-    
\ No newline at end of file
+def get_meta_collection():
+    db = get_database()
+    return db.meta
+
+async def bump_properties_version():
+    """Mark property data as changed; cached property tiles are revalidated"""
+    await get_meta_collection().update_one(
+        {"_id": "properties"},
+        {"$inc": {"version": 1}},
+        upsert=True
+    )
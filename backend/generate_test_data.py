@@ -1,17 +1,50 @@
 import asyncio
+import bisect
+import hashlib
+import math
+import multiprocessing
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 from faker import Faker
 import motor.motor_asyncio
-from models import User, Property, Location
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from models import User, Property, Location, Like, Match
+from indexes import apply_index_spec
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+from typing import Dict, List, Sequence, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
 fake = Faker('ru_RU')
 
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/roommate_app")
+DB_NAME = "roommate_app"
+# Rows generated and inserted per task of the process pool
+CHUNK_SIZE = 5000
+# Distinct fake names, texts and addresses each generator process draws from
+FAKER_POOL_SIZE = 2000
+TELEGRAM_ID_MIN = 1000000000
+TELEGRAM_ID_MAX = 9999999999
+
+# Defaults of the clustered placement and of the likes graph
+CLUSTER_SHARE = 0.8
+CLUSTER_RADIUS_KM = 0.7
+STATION_SKEW = 0.8
+LIKES_PER_USER = 20
+LIKES_ALPHA = 1.5
+MAX_LIKES_PER_USER = 10000
+PROPERTY_LIKE_SHARE = 0.5
+POPULARITY_SKEW = 2.0
+RECIPROCITY = 0.15
+
+# Per-process state of pool workers, set up by _init_worker
+_worker = {}
+
 # Moscow coordinates bounds
 MOSCOW_BOUNDS = {
     'lat_min': 55.5900,
@@ -35,6 +68,39 @@ METRO_STATIONS = [
     "Парк культуры", "Киевская", "Смоленская", "Арбатская", "Александровский сад"
 ]
 
+# Approximate (latitude, longitude) of the stations above
+METRO_STATION_COORDINATES = {
+    "Сокольники": (55.7893, 37.6799), "Красносельская": (55.7800, 37.6662),
+    "Комсомольская": (55.7745, 37.6550), "Красные ворота": (55.7690, 37.6484),
+    "Чистые пруды": (55.7650, 37.6387), "Лубянка": (55.7597, 37.6253),
+    "Охотный ряд": (55.7572, 37.6156), "Библиотека им. Ленина": (55.7522, 37.6101),
+    "Кропоткинская": (55.7454, 37.6035), "Парк культуры": (55.7355, 37.5935),
+    "Фрунзенская": (55.7274, 37.5801), "Спортивная": (55.7225, 37.5621),
+    "Воробьевы горы": (55.7102, 37.5593), "Университет": (55.6926, 37.5343),
+    "Проспект Вернадского": (55.6765, 37.5054), "Юго-Западная": (55.6635, 37.4830),
+    "Тропарево": (55.6459, 37.4725), "Румянцево": (55.6330, 37.4419),
+    "Саларьево": (55.6227, 37.4240), "Бульвар Дмитрия Донского": (55.5687, 37.5771),
+    "Речной вокзал": (55.8549, 37.4763), "Водный стадион": (55.8399, 37.4869),
+    "Войковская": (55.8187, 37.4977), "Сокол": (55.8057, 37.5149),
+    "Аэропорт": (55.8004, 37.5330), "Белорусская": (55.7774, 37.5822),
+    "Маяковская": (55.7699, 37.5962), "Тверская": (55.7646, 37.6058),
+    "Театральная": (55.7576, 37.6188), "Новокузнецкая": (55.7424, 37.6293),
+    "Павелецкая": (55.7296, 37.6386), "Автозаводская": (55.7069, 37.6577),
+    "Технопарк": (55.6950, 37.6640), "Коломенская": (55.6776, 37.6634),
+    "Каширская": (55.6549, 37.6496), "Кантемировская": (55.6361, 37.6563),
+    "Царицыно": (55.6210, 37.6697), "Орехово": (55.6129, 37.6952),
+    "Домодедовская": (55.6101, 37.7174), "Красногвардейская": (55.6138, 37.7447),
+    "Алма-Атинская": (55.6338, 37.7658), "Новокосино": (55.7451, 37.8641),
+    "Новогиреево": (55.7519, 37.8169), "Перово": (55.7510, 37.7866),
+    "Шоссе Энтузиастов": (55.7581, 37.7519), "Авиамоторная": (55.7518, 37.7172),
+    "Площадь Ильича": (55.7470, 37.6807), "Марксистская": (55.7408, 37.6562),
+    "Третьяковская": (55.7407, 37.6258), "Октябрьская": (55.7293, 37.6111),
+    "Киевская": (55.7436, 37.5654), "Смоленская": (55.7475, 37.5839),
+    "Арбатская": (55.7522, 37.6033), "Александровский сад": (55.7523, 37.6086)
+}
+MOSCOW_CENTER = (55.7520, 37.6175)
+KM_PER_DEGREE_LAT = 111.32
+
 PROPERTY_TYPES = ["apartment", "room", "studio"]
 AMENITIES = [
     "WiFi", "Кондиционер", "Стиральная машина", "Посудомоечная машина", 
@@ -45,12 +111,36 @@ AMENITIES = [
 
 
 async def connect_to_database():
-    MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/roommate_app")
     client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
-    return client.roommate_app
+    return client[DB_NAME]
+
+# Stations ordered from the centre outwards; central ones get the largest clusters
+STATIONS_BY_CENTRALITY = sorted(
+    METRO_STATION_COORDINATES,
+    key=lambda name: math.dist(METRO_STATION_COORDINATES[name], MOSCOW_CENTER)
+)
+
+def station_cum_weights(skew: float) -> List[float]:
+    """Cumulative Zipf weights of STATIONS_BY_CENTRALITY"""
+    weights = [1 / (rank + 1) ** skew for rank in range(len(STATIONS_BY_CENTRALITY))]
+    return [sum(weights[:i + 1]) for i in range(len(weights))]
+
+def clustered_coordinates(rng: random.Random, cum_weights: Sequence[float], radius_km: float) -> Tuple[str, float, float]:
+    """A station, picked by weight, and a point scattered normally around it"""
+    index = bisect.bisect_left(cum_weights, rng.random() * cum_weights[-1])
+    station = STATIONS_BY_CENTRALITY[index]
+    station_lat, station_lng = METRO_STATION_COORDINATES[station]
+    lat = station_lat + rng.gauss(0, radius_km / KM_PER_DEGREE_LAT)
+    lng = station_lng + rng.gauss(0, radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(station_lat))))
+    return station, lat, lng
+
+_default_station_cum_weights = station_cum_weights(STATION_SKEW)
 
 def generate_moscow_coordinates():
-    """Generate random coordinates within Moscow bounds"""
+    """Generate random coordinates in Moscow, mostly clustered around metro stations"""
+    if random.random() < CLUSTER_SHARE:
+        _, lat, lng = clustered_coordinates(random, _default_station_cum_weights, CLUSTER_RADIUS_KM)
+        return lat, lng
     lat = random.uniform(MOSCOW_BOUNDS['lat_min'], MOSCOW_BOUNDS['lat_max'])
     lng = random.uniform(MOSCOW_BOUNDS['lng_min'], MOSCOW_BOUNDS['lng_max'])
     return lat, lng
@@ -121,8 +211,331 @@ def generate_property_data():
         is_active=True
     )
 
-async def generate_test_data(num_users=1000, num_properties=1000, force=False):
-    """Generate and insert test data"""
+def _init_worker(mongo_url: str, db_name: str, seed: int, reference_time: datetime, config: dict):
+    """Set up a generator process: its own Mongo client and pools of fake text.
+
+    Faker is by far the slowest part of generating a row, so every process
+    draws names, texts and addresses from pools it builds once.
+    """
+    faker = Faker('ru_RU')
+    faker.seed_instance(seed)
+    _worker.update(
+        db=MongoClient(mongo_url)[db_name],
+        seed=seed,
+        reference_time=reference_time,
+        config=config,
+        station_cum_weights=station_cum_weights(config["station_skew"]),
+        usernames=[faker.user_name() for _ in range(FAKER_POOL_SIZE)],
+        first_names=[faker.first_name() for _ in range(FAKER_POOL_SIZE)],
+        last_names=[faker.last_name() for _ in range(FAKER_POOL_SIZE)],
+        abouts=[faker.text(max_nb_chars=200) for _ in range(FAKER_POOL_SIZE)],
+        descriptions=[faker.text(max_nb_chars=300) for _ in range(FAKER_POOL_SIZE)],
+        addresses=[faker.address() for _ in range(FAKER_POOL_SIZE)]
+    )
+
+def _random_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def _row_id(collection: str, index: int) -> str:
+    """Id of the index-th generated row, computable from any process"""
+    digest = hashlib.blake2b(f"{_worker['seed']}:{collection}:{index}".encode(), digest_size=16).digest()
+    return str(uuid.UUID(bytes=digest, version=4))
+
+def _random_location(rng: random.Random) -> Tuple[dict, str]:
+    """A location and its metro station; most fall in clusters around stations.
+
+    A density below 1.0 pulls every point towards the city centre: 0.1 packs
+    them into the central tenth of Moscow (100x denser).
+    """
+    config = _worker["config"]
+    station = None
+    if rng.random() < config["cluster_share"]:
+        station, lat, lng = clustered_coordinates(rng, _worker["station_cum_weights"], config["cluster_radius_km"])
+    else:
+        lat = rng.uniform(MOSCOW_BOUNDS['lat_min'], MOSCOW_BOUNDS['lat_max'])
+        lng = rng.uniform(MOSCOW_BOUNDS['lng_min'], MOSCOW_BOUNDS['lng_max'])
+    density = config["density"]
+    if density != 1.0:
+        center_lat, center_lng = MOSCOW_CENTER
+        lat = center_lat + (lat - center_lat) * density
+        lng = center_lng + (lng - center_lng) * density
+    return {"type": "Point", "coordinates": [lng, lat]}, station or rng.choice(METRO_STATIONS)
+
+def _random_created_at(rng: random.Random, max_age_days: int) -> datetime:
+    return _worker["reference_time"] - timedelta(seconds=rng.uniform(0, max_age_days * 86400))
+
+def _user_docs(rng: random.Random, start: int, count: int) -> Dict[str, List[dict]]:
+    """Users documents shaped like User.model_dump(), with unique telegram ids"""
+    # Give every row its own slice of the telegram id range, so ids generated
+    # by different processes never collide
+    stride = (TELEGRAM_ID_MAX - TELEGRAM_ID_MIN + 1) // max(_worker["config"]["num_users"], 1)
+    docs = []
+    for i in range(start, start + count):
+        location, station = _random_location(rng)
+        docs.append({
+            "id": _row_id("users", i),
+            "telegram_id": TELEGRAM_ID_MIN + i * stride + rng.randrange(stride),
+            "username": rng.choice(_worker["usernames"]),
+            "first_name": rng.choice(_worker["first_names"]),
+            "last_name": rng.choice(_worker["last_names"]),
+            "profile_photo_url": f"https://picsum.photos/150/150?random={rng.randint(1, 1000)}",
+            "age": rng.randint(18, 45),
+            "gender": rng.choice(["male", "female"]),
+            "about": rng.choice(_worker["abouts"]) if rng.random() < 0.5 else None,
+            "price_range_min": rng.randint(500, 8000),
+            "price_range_max": rng.randint(8000, 25000),
+            "metro_station": station,
+            "search_radius": rng.randint(3, 15),
+            "location": location,
+            "created_at": _random_created_at(rng, 365),
+            "is_active": True
+        })
+    return {"users": docs}
+
+def _property_docs(rng: random.Random, start: int, count: int) -> Dict[str, List[dict]]:
+    """Properties documents shaped like Property.model_dump()"""
+    docs = []
+    for i in range(start, start + count):
+        property_type = rng.choice(PROPERTY_TYPES)
+        rooms = 1 if property_type == "studio" else rng.randint(1, 4)
+        floor = rng.randint(1, 25)
+        if property_type == "room":
+            price = rng.randint(500, 15000)
+        elif property_type == "studio":
+            price = rng.randint(500, 20000)
+        else:
+            price = rng.randint(500, 25000)
+        location, station = _random_location(rng)
+        docs.append({
+            "id": _row_id("properties", i),
+            "title": f"{rooms}-комнатная {property_type} у метро {station}",
+            "description": rng.choice(_worker["descriptions"]),
+            "price": price,
+            "address": rng.choice(_worker["addresses"]),
+            "metro_station": station,
+            "location": location,
+            "rooms": rooms,
+            "area": float(rng.randint(25, 120)),
+            "floor": floor,
+            "total_floors": rng.randint(floor, 25),
+            "property_type": property_type,
+            "photos": [
+                f"https://picsum.photos/400/300?random={rng.randint(1, 1000)}"
+                for _ in range(rng.randint(1, 5))
+            ],
+            "amenities": rng.sample(AMENITIES, rng.randint(2, 8)),
+            "created_at": _random_created_at(rng, 182),
+            "is_active": True
+        })
+    return {"properties": docs}
+
+def _popular_index(rng: random.Random, total: int, skew: float) -> int:
+    """Row index biased towards low indices, so a few targets get most likes"""
+    return min(int(total * rng.random() ** skew), total - 1)
+
+def _pair_outcome(user_index: int, target_index: int) -> Tuple[bool, bool]:
+    """Whether a pair of users like each other, and else which one may like the other.
+
+    Decided from the pair alone, so both users' processes agree: mutual likes
+    always come with a match, and no pair ends up liking each other by chance.
+    """
+    low, high = sorted((user_index, target_index))
+    digest = hashlib.blake2b(f"{_worker['seed']}:pair:{low}:{high}".encode(), digest_size=9).digest()
+    mutual = int.from_bytes(digest[:8], "big") / 2 ** 64 < _worker["config"]["reciprocity"]
+    allowed_liker = low if digest[8] & 1 else high
+    return mutual, allowed_liker == user_index
+
+def _like_docs(rng: random.Random, start: int, count: int) -> Dict[str, List[dict]]:
+    """Likes of users start..start+count, and the matches they complete.
+
+    Activity follows a Lomax (Pareto II) distribution: most users like a few
+    targets, a few like thousands. Targets are skewed by popularity too.
+    """
+    config = _worker["config"]
+    num_users = config["num_users"]
+    num_properties = config["num_properties"]
+    alpha = config["likes_alpha"]
+    scale = config["likes_per_user"] * (alpha - 1)
+    likes, matches = [], []
+
+    def like(user_index: int, target_id: str, target_type: str):
+        likes.append({
+            "id": _random_id(rng),
+            "user_id": _row_id("users", user_index),
+            "target_id": target_id,
+            "target_type": target_type,
+            "created_at": _random_created_at(rng, 90)
+        })
+
+    for user_index in range(start, start + count):
+        num_likes = min(config["max_likes_per_user"], int(scale * (rng.paretovariate(alpha) - 1)))
+        targets = set()
+        for _ in range(num_likes):
+            if num_properties and rng.random() < config["property_like_share"]:
+                target = ("property", _popular_index(rng, num_properties, config["popularity_skew"]))
+            else:
+                target = ("user", _popular_index(rng, num_users, config["popularity_skew"]))
+            if target in targets or target == ("user", user_index):
+                continue
+            targets.add(target)
+            target_type, target_index = target
+
+            if target_type == "property":
+                like(user_index, _row_id("properties", target_index), "property")
+                continue
+            mutual, may_like = _pair_outcome(user_index, target_index)
+            if mutual:
+                like(user_index, _row_id("users", target_index), "user")
+                like(target_index, _row_id("users", user_index), "user")
+                user1_id, user2_id = sorted((_row_id("users", user_index), _row_id("users", target_index)))
+                matches.append({
+                    "id": _random_id(rng),
+                    "user1_id": user1_id,
+                    "user2_id": user2_id,
+                    "created_at": _random_created_at(rng, 90),
+                    "is_active": True
+                })
+            elif may_like:
+                like(user_index, _row_id("users", target_index), "user")
+    return {"likes": likes, "matches": matches}
+
+CHUNK_GENERATORS = {
+    "users": _user_docs,
+    "properties": _property_docs,
+    "likes": _like_docs
+}
+MODELS = {"users": User, "properties": Property, "likes": Like, "matches": Match}
+
+def _insert_chunk(collection: str, chunk_index: int, start: int, count: int, seed: int) -> Dict[str, int]:
+    """Generate one chunk in a worker process and insert it; returns rows inserted per collection.
+
+    A chunk's rows depend only on the seed and the chunk's position, not on
+    which process generates it, so runs are reproducible for any --workers.
+    """
+    rng = random.Random(f"{seed}:{collection}:{chunk_index}")
+    inserted = {}
+    for name, docs in CHUNK_GENERATORS[collection](rng, start, count).items():
+        if not docs:
+            inserted[name] = 0
+            continue
+        # Rows skip pydantic for speed; validating one per chunk keeps the shape honest
+        MODELS[name].model_validate(docs[0])
+        try:
+            inserted[name] = len(_worker["db"][name].insert_many(docs, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            # Mutual likes are generated from both users' chunks; unique indexes keep one copy
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            inserted[name] = e.details["nInserted"]
+    return inserted
+
+async def insert_parallel(executor, collection: str, total: int, chunk_size: int, seed: int, max_pending: int) -> Dict[str, int]:
+    """Generate rows for `total` source rows in chunks, keeping at most max_pending chunks in flight"""
+    loop = asyncio.get_running_loop()
+    pending = set()
+    inserted: Dict[str, int] = {}
+    done_rows = 0
+    started = time.perf_counter()
+
+    async def collect(return_when):
+        nonlocal pending, done_rows
+        done, pending = await asyncio.wait(pending, return_when=return_when)
+        for future in done:
+            rows, counts = future.result()
+            done_rows += rows
+            for name, count in counts.items():
+                inserted[name] = inserted.get(name, 0) + count
+        rate = sum(inserted.values()) / (time.perf_counter() - started)
+        progress = ", ".join(f"{count} {name}" for name, count in inserted.items())
+        print(f"Processed {done_rows}/{total}: inserted {progress} ({rate:,.0f} docs/s)")
+
+    async def run_chunk(chunk_index: int, start: int, count: int):
+        counts = await loop.run_in_executor(executor, _insert_chunk, collection, chunk_index, start, count, seed)
+        return count, counts
+
+    for chunk_index, start in enumerate(range(0, total, chunk_size)):
+        if len(pending) >= max_pending:
+            await collect(asyncio.FIRST_COMPLETED)
+        pending.add(asyncio.ensure_future(run_chunk(chunk_index, start, min(chunk_size, total - start))))
+    if pending:
+        await collect(asyncio.ALL_COMPLETED)
+    return inserted
+
+def generator_config(
+    num_users: int,
+    num_properties: int,
+    cluster_share: float = CLUSTER_SHARE,
+    cluster_radius_km: float = CLUSTER_RADIUS_KM,
+    station_skew: float = STATION_SKEW,
+    likes_per_user: int = LIKES_PER_USER,
+    likes_alpha: float = LIKES_ALPHA,
+    max_likes_per_user: int = MAX_LIKES_PER_USER,
+    property_like_share: float = PROPERTY_LIKE_SHARE,
+    popularity_skew: float = POPULARITY_SKEW,
+    reciprocity: float = RECIPROCITY,
+    density: float = 1.0
+) -> dict:
+    """Settings of the generator processes, with the defaults filled in"""
+    if likes_alpha <= 1:
+        raise ValueError("likes_alpha must be greater than 1 for the mean number of likes to exist")
+    return {
+        "num_users": num_users,
+        "num_properties": num_properties,
+        "cluster_share": cluster_share,
+        "cluster_radius_km": cluster_radius_km,
+        "station_skew": station_skew,
+        "likes_per_user": likes_per_user,
+        "likes_alpha": likes_alpha,
+        "max_likes_per_user": max_likes_per_user,
+        "property_like_share": property_like_share,
+        "popularity_skew": popularity_skew,
+        "reciprocity": reciprocity,
+        "density": density
+    }
+
+async def generate_parallel(db, config: dict, seed: int, workers: int, chunk_size: int = CHUNK_SIZE) -> Dict[str, int]:
+    """Generate the users, properties and likes of `config` into `db`; returns rows inserted per collection.
+
+    Rows are generated in a pool of processes, each inserting its own chunks
+    with unordered insert_many, so memory stays flat however many rows are
+    requested. The same seed always produces the same rows.
+    """
+    # Duplicate mutual likes and matches are dropped by their unique indexes
+    await apply_index_spec(db, collections=["likes", "matches"])
+    
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(MONGO_URL, db.name, seed, datetime.utcnow(), config)
+    )
+    max_pending = workers * 2
+    with executor:
+        counts = await insert_parallel(executor, "users", config["num_users"], chunk_size, seed, max_pending)
+        counts.update(await insert_parallel(executor, "properties", config["num_properties"], chunk_size, seed, max_pending))
+        if config["likes_per_user"] > 0:
+            users_per_chunk = max(1, chunk_size // config["likes_per_user"])
+            counts.update(await insert_parallel(executor, "likes", config["num_users"], users_per_chunk, seed, max_pending))
+    return counts
+
+async def generate_test_data(
+    num_users=1000,
+    num_properties=1000,
+    force=False,
+    workers=None,
+    chunk_size=CHUNK_SIZE,
+    seed=None,
+    cluster_share=CLUSTER_SHARE,
+    cluster_radius_km=CLUSTER_RADIUS_KM,
+    station_skew=STATION_SKEW,
+    likes_per_user=LIKES_PER_USER,
+    likes_alpha=LIKES_ALPHA,
+    max_likes_per_user=MAX_LIKES_PER_USER,
+    property_like_share=PROPERTY_LIKE_SHARE,
+    popularity_skew=POPULARITY_SKEW,
+    reciprocity=RECIPROCITY
+):
+    """Generate and insert test data with generate_parallel"""
     db = await connect_to_database()
     
     if force:
@@ -142,55 +555,45 @@ async def generate_test_data(num_users=1000, num_properties=1000, force=False):
         print("✅ Пропускаем генерацию тестовых данных")
         return
     
+    config = generator_config(
+        num_users,
+        num_properties,
+        cluster_share=cluster_share,
+        cluster_radius_km=cluster_radius_km,
+        station_skew=station_skew,
+        likes_per_user=likes_per_user,
+        likes_alpha=likes_alpha,
+        max_likes_per_user=max_likes_per_user,
+        property_like_share=property_like_share,
+        popularity_skew=popularity_skew,
+        reciprocity=reciprocity
+    )
+    workers = workers or os.cpu_count() or 1
+    if seed is None:
+        seed = random.randrange(2 ** 32)
     print(f"Generating test data for {num_users} users and {num_properties} properties...")
+    print(f"⚙️  {workers} workers, {chunk_size} rows per chunk, seed {seed}")
+    print(f"📍 {cluster_share:.0%} of locations in clusters of {cluster_radius_km} km around metro stations")
     
-    # Generate users
-    print(f"Generating {num_users} users...")
-    users = []
-    telegram_ids = set()  # Ensure unique telegram_ids
-    
-    for i in range(num_users):
-        user = generate_user_data()
-        # Ensure unique telegram_id
-        while user.telegram_id in telegram_ids:
-            user.telegram_id = random.randint(1000000000, 9999999999)
-        telegram_ids.add(user.telegram_id)
-        
-        users.append(user.model_dump())
-        if (i + 1) % 100 == 0:
-            print(f"Generated {i + 1} users")
+    started = time.perf_counter()
+    counts = await generate_parallel(db, config, seed, workers, chunk_size)
+    elapsed = time.perf_counter() - started
+    # Invalidate cached property tiles
+    await db.meta.update_one({"_id": "properties"}, {"$inc": {"version": 1}}, upsert=True)
     
-    # Insert users
-    print("Inserting users to database...")
-    result = await db.users.insert_many(users)
-    print(f"Successfully inserted {len(result.inserted_ids)} users")
-    
-    # Generate properties
-    print(f"Generating {num_properties} properties...")
-    properties = []
-    for i in range(num_properties):
-        property_data = generate_property_data()
-        properties.append(property_data.model_dump())
-        if (i + 1) % 100 == 0:
-            print(f"Generated {i + 1} properties")
-    
-    # Insert properties
-    print("Inserting properties to database...")
-    result = await db.properties.insert_many(properties)
-    print(f"Successfully inserted {len(result.inserted_ids)} properties")
-    
-    # Create indexes
+    # Create the remaining indexes after the bulk inserts
     print("Creating database indexes...")
-    await db.users.create_index([("location", "2dsphere")])
-    await db.properties.create_index([("location", "2dsphere")])
-    await db.users.create_index("telegram_id", unique=True)
-    await db.users.create_index("created_at")
-    await db.properties.create_index("created_at")
-    await db.properties.create_index("price")
-    await db.properties.create_index("metro_station")
+    index_report = await apply_index_spec(db)
+    for error in index_report["errors"]:
+        print(f"❌ Could not create index {error}")
     
+    total = sum(counts.values())
     print("Test data generation completed!")
-    print(f"✅ Generated {len(users)} users and {len(properties)} properties")
+    print(
+        f"✅ Generated {counts.get('users', 0)} users, {counts.get('properties', 0)} properties, "
+        f"{counts.get('likes', 0)} likes and {counts.get('matches', 0)} matches "
+        f"in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s)"
+    )
     print("🗄️  Database indexes created")
     print("🎯 Ready for testing!")
 
@@ -201,10 +604,38 @@ async def main():
     parser.add_argument("--users", type=int, default=1000, help="Number of users to generate.")
     parser.add_argument("--properties", type=int, default=1000, help="Number of properties to generate.")
     parser.add_argument("--force", action="store_true", help="Force regeneration, deleting existing data.")
+    parser.add_argument("--workers", type=int, default=None, help="Generator processes (default: one per CPU).")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows generated and inserted per batch.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible data (default: random).")
+    parser.add_argument("--cluster-share", type=float, default=CLUSTER_SHARE, help="Share of locations placed in clusters around metro stations (0 = uniform).")
+    parser.add_argument("--cluster-radius-km", type=float, default=CLUSTER_RADIUS_KM, help="Spread (standard deviation) of a cluster in km.")
+    parser.add_argument("--station-skew", type=float, default=STATION_SKEW, help="How strongly clusters favour central stations (0 = all stations alike).")
+    parser.add_argument("--likes-per-user", type=int, default=LIKES_PER_USER, help="Mean likes per user (0 = no likes or matches).")
+    parser.add_argument("--likes-alpha", type=float, default=LIKES_ALPHA, help="Tail exponent of likes per user; lower means heavier power users.")
+    parser.add_argument("--max-likes-per-user", type=int, default=MAX_LIKES_PER_USER, help="Cap on likes of a single user.")
+    parser.add_argument("--property-like-share", type=float, default=PROPERTY_LIKE_SHARE, help="Share of likes that target properties.")
+    parser.add_argument("--popularity-skew", type=float, default=POPULARITY_SKEW, help="How strongly likes concentrate on popular targets (1 = uniform).")
+    parser.add_argument("--reciprocity", type=float, default=RECIPROCITY, help="Probability that a liked user likes back, creating a match.")
     
     args = parser.parse_args()
 
-    await generate_test_data(num_users=args.users, num_properties=args.properties, force=args.force)
+    await generate_test_data(
+        num_users=args.users,
+        num_properties=args.properties,
+        force=args.force,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+        cluster_share=args.cluster_share,
+        cluster_radius_km=args.cluster_radius_km,
+        station_skew=args.station_skew,
+        likes_per_user=args.likes_per_user,
+        likes_alpha=args.likes_alpha,
+        max_likes_per_user=args.max_likes_per_user,
+        property_like_share=args.property_like_share,
+        popularity_skew=args.popularity_skew,
+        reciprocity=args.reciprocity
+    )
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""Import a partner's property feed (CSV or JSONL, optionally gzipped).
+
+Listings are keyed by (source, external_id). Every row is validated through
+the Property model and upserted. Listings of the source that are missing
+from the feed are deactivated at the end. Chunks of raw records are parsed,
+validated and written by a pool of processes, with a bounded number of
+chunks in flight, so memory stays flat whatever the feed size.
+
+    python import_properties.py feed.csv.gz --source cian
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import bump_properties_version, close_mongo_connection, connect_to_mongo, get_properties_collection
+from models import Location, Property
+
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/roommate_app")
+DB_NAME = os.getenv("MONGODB_DB_NAME", "roommate_app")
+# Raw records per chunk handed to a worker
+CHUNK_SIZE = 5000
+# Deactivation is skipped when more rows than this fail, e.g. for a broken feed
+MAX_ERROR_RATE = 0.05
+# Errors reported per chunk
+MAX_CHUNK_ERRORS = 20
+
+# Feed columns holding lists; in CSV they are separated by LIST_SEPARATOR
+LIST_FIELDS = ("photos", "amenities")
+LIST_SEPARATOR = "|"
+
+# Per-process state of pool workers, set up by _init_worker
+_worker = {}
+
+def _init_worker(mongo_url: str, db_name: str):
+    _worker["collection"] = MongoClient(mongo_url)[db_name].properties
+
+def _open_feed(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+def feed_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the feed format of {path}; pass --format")
+
+def read_chunks(path: str, fmt: str, chunk_size: int) -> Iterator[Tuple[int, List[str]]]:
+    """Yield (number of the chunk's first record, raw records) without parsing fields.
+
+    CSV records may span lines inside quoted fields; a record ends at a line
+    break outside quotes, i.e. once it holds an even number of quote chars.
+    """
+    with _open_feed(path) as feed:
+        chunk: List[str] = []
+        chunk_start = 1
+        record = ""
+        record_number = 0
+        for line in feed:
+            if fmt == "csv":
+                record += line
+                if record.count('"') % 2:
+                    continue
+                line, record = record, ""
+            if not line.strip():
+                continue
+            record_number += 1
+            if not chunk:
+                chunk_start = record_number
+            chunk.append(line)
+            if len(chunk) == chunk_size:
+                yield chunk_start, chunk
+                chunk = []
+        if record:
+            chunk.append(record)
+        if chunk:
+            yield chunk_start, chunk
+
+def _parse_record(fmt: str, header: Optional[List[str]], record: str) -> Dict[str, Any]:
+    """Fields of one raw record; raises ValueError or csv.Error when it is malformed"""
+    if fmt == "csv":
+        values = next(csv.reader([record]))
+        row = dict(zip(header, values))
+        for field in LIST_FIELDS:
+            value = row.get(field)
+            row[field] = [item for item in value.split(LIST_SEPARATOR) if item] if value else []
+        return row
+    row = json.loads(record)
+    if not isinstance(row, dict):
+        raise ValueError("record is not a JSON object")
+    return row
+
+def _row_to_property(row: Dict[str, Any]) -> Property:
+    row = {key: value for key, value in row.items() if value not in (None, "")}
+    row["location"] = Location(coordinates=[float(row.pop("longitude")), float(row.pop("latitude"))])
+    row["external_id"] = str(row["external_id"])
+    return Property.model_validate(row)
+
+def _import_chunk(fmt: str, header: Optional[List[str]], first_record: int, records: List[str], source: str, run_id: str, now: datetime) -> Dict[str, Any]:
+    """Parse, validate and upsert one chunk in a worker process"""
+    operations = []
+    errors = []
+    for offset, record in enumerate(records):
+        try:
+            prop = _row_to_property(_parse_record(fmt, header, record))
+        except (ValidationError, KeyError, ValueError, TypeError, csv.Error) as e:
+            if len(errors) < MAX_CHUNK_ERRORS:
+                if isinstance(e, ValidationError):
+                    message = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+                else:
+                    message = f"{type(e).__name__}: {e}"
+                errors.append(f"record {first_record + offset}: {message}")
+            continue
+        doc = prop.model_dump(exclude={"id", "created_at", "source"})
+        doc.update(last_import_id=run_id, updated_at=now)
+        operations.append(UpdateOne(
+            {"source": source, "external_id": prop.external_id},
+            {"$set": doc, "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}},
+            upsert=True
+        ))
+
+    result = {"rows": len(records), "valid": len(operations), "invalid": len(records) - len(operations), "errors": errors,
+              "inserted": 0, "updated": 0}
+    if operations:
+        try:
+            write = _worker["collection"].bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            # e.g. the same external_id twice in the feed, upserted concurrently
+            write = e.details
+            result["invalid"] += len(write["writeErrors"])
+            result["valid"] -= len(write["writeErrors"])
+            errors.extend(
+                f"record {first_record + error['index']}: {error['errmsg']}"
+                for error in write["writeErrors"][:MAX_CHUNK_ERRORS]
+            )
+        result["inserted"] = write["nUpserted"]
+        result["updated"] = write["nModified"]
+    return result
+
+async def import_feed(path: str, source: str, fmt: Optional[str] = None, workers: Optional[int] = None,
+                      chunk_size: int = CHUNK_SIZE, deactivate_missing: bool = True,
+                      max_error_rate: float = MAX_ERROR_RATE) -> Dict[str, Any]:
+    fmt = fmt or feed_format(path)
+    workers = workers or os.cpu_count() or 1
+    run_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    header = None
+    chunks = read_chunks(path, fmt, chunk_size)
+    if fmt == "csv":
+        with _open_feed(path) as feed:
+            header = next(csv.reader(feed))
+        if "external_id" not in header:
+            raise ValueError("CSV feed has no external_id column")
+
+    print(f"📥 Importing {path} ({fmt}) for source '{source}' with {workers} workers")
+    totals = {"rows": 0, "valid": 0, "invalid": 0, "inserted": 0, "updated": 0}
+    errors: List[str] = []
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    pending = set()
+
+    async def collect(return_when):
+        nonlocal pending
+        done, pending = await asyncio.wait(pending, return_when=return_when)
+        for future in done:
+            result = future.result()
+            for key in totals:
+                totals[key] += result[key]
+            errors.extend(result["errors"])
+        rate = totals["rows"] / (time.perf_counter() - started)
+        print(f"Processed {totals['rows']} rows: {totals['inserted']} new, {totals['updated']} updated, "
+              f"{totals['invalid']} invalid ({rate:,.0f} rows/s)")
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(MONGO_URL, DB_NAME)
+    )
+    with executor:
+        for index, (first_record, records) in enumerate(chunks):
+            if fmt == "csv" and index == 0:
+                first_record, records = first_record + 1, records[1:]  # header row
+            if len(pending) >= workers * 2:
+                await collect(asyncio.FIRST_COMPLETED)
+            pending.add(loop.run_in_executor(
+                executor, _import_chunk, fmt, header, first_record, records, source, run_id, now
+            ))
+        if pending:
+            await collect(asyncio.ALL_COMPLETED)
+
+    error_rate = totals["invalid"] / totals["rows"] if totals["rows"] else 1.0
+    deactivated = 0
+    await connect_to_mongo()
+    try:
+        if deactivate_missing and error_rate <= max_error_rate:
+            result = await get_properties_collection().update_many(
+                {"source": source, "is_active": True, "last_import_id": {"$ne": run_id}},
+                {"$set": {"is_active": False, "updated_at": now}}
+            )
+            deactivated = result.modified_count
+        elif deactivate_missing:
+            print(f"⚠️  {error_rate:.1%} of rows are invalid; not deactivating listings missing from the feed")
+        if totals["inserted"] or totals["updated"] or deactivated:
+            # Invalidate cached property tiles
+            await bump_properties_version()
+    finally:
+        await close_mongo_connection()
+
+    elapsed = time.perf_counter() - started
+    return {**totals, "deactivated": deactivated, "errors": errors, "elapsed_s": elapsed,
+            "rows_per_s": totals["rows"] / elapsed if elapsed else 0.0}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Import a property listing feed.")
+    parser.add_argument("path", help="CSV or JSONL feed, optionally .gz compressed.")
+    parser.add_argument("--source", required=True, help="Partner the feed comes from; external ids are unique per source.")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Feed format (default: from the file extension).")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: one per CPU).")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Records per parsing and write batch.")
+    parser.add_argument("--keep-missing", action="store_true", help="Do not deactivate listings missing from the feed.")
+    parser.add_argument("--max-error-rate", type=float, default=MAX_ERROR_RATE, help="Skip deactivation above this share of invalid rows.")
+    args = parser.parse_args()
+
+    report = await import_feed(
+        args.path,
+        args.source,
+        fmt=args.format,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        deactivate_missing=not args.keep_missing,
+        max_error_rate=args.max_error_rate
+    )
+
+    if report["errors"]:
+        print(f"\n🔍 First invalid rows:")
+        for error in report["errors"][:20]:
+            print(f"   ❌ {error}")
+    print(f"\n✅ {report['rows']} rows in {report['elapsed_s']:.1f}s ({report['rows_per_s']:,.0f} rows/s): "
+          f"{report['inserted']} new, {report['updated']} updated, {report['invalid']} invalid, "
+          f"{report['deactivated']} deactivated")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,289 @@
+"""Declarative MongoDB index spec, and a check of the service queries' plans.
+
+INDEX_SPEC lists every index the services rely on. apply_index_spec creates
+the missing ones and drops OBSOLETE_INDEXES once their replacements exist;
+indexes that are already there are left alone, so applying it again is
+cheap. The server applies it in a background task at startup, so requests
+are served while a build runs.
+
+    python indexes.py apply    # create missing indexes now
+    python indexes.py check    # explain the service queries, fail on COLLSCAN
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, GEOSPHERE, IndexModel
+from pymongo.errors import OperationFailure
+
+from database import close_mongo_connection, connect_to_mongo, get_database
+from models import Location, User
+from services import bbox_filter, build_potential_matches_pipeline, build_properties_near_pipeline
+from slow_queries import summarize_plan
+
+logger = logging.getLogger(__name__)
+
+INDEX_SPEC: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("location", GEOSPHERE)]),
+        IndexModel([("telegram_id", ASCENDING)], unique=True),
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", ASCENDING)])
+    ],
+    "properties": [
+        # $geoNear filters on is_active and a price range next to the location
+        IndexModel([("location", GEOSPHERE), ("is_active", ASCENDING), ("price", ASCENDING)]),
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", ASCENDING)]),
+        # Imported listings are upserted by their partner's key
+        IndexModel(
+            [("source", ASCENDING), ("external_id", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"external_id": {"$type": "string"}}
+        ),
+        # The partial index above cannot serve the import's deactivation query
+        IndexModel([("source", ASCENDING), ("is_active", ASCENDING)])
+    ],
+    "likes": [
+        IndexModel([("user_id", ASCENDING), ("target_id", ASCENDING), ("target_type", ASCENDING)], unique=True)
+    ],
+    "matches": [
+        # Matches store the user pair in canonical (sorted) order; the
+        # compound index also serves lookups by user1_id alone
+        IndexModel([("user1_id", ASCENDING), ("user2_id", ASCENDING)], unique=True),
+        IndexModel([("user2_id", ASCENDING)])
+    ],
+    "match_notifications": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+    ]
+}
+
+# Indexes replaced by ones in INDEX_SPEC. $geoNear refuses to pick between
+# two 2dsphere indexes, so the old location index must go once the compound
+# one is built. price_1 and metro_station_1 came from the test data generator
+# and no query uses them.
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    "properties": ["location_2dsphere", "price_1", "metro_station_1"]
+}
+
+# Index build errors that need a person: an index with the same name or keys
+# but other options exists, or existing data violates a unique index
+INDEX_CONFLICT_CODES = {85, 86, 11000}
+
+async def apply_index_spec(db, collections: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Create the missing indexes of INDEX_SPEC and drop obsolete ones.
+
+    Returns the names of created and dropped indexes and the errors of those
+    that could not be built. A collection's obsolete indexes are only dropped
+    when all of its spec indexes exist.
+    """
+    report = {"created": [], "dropped": [], "errors": []}
+    for collection_name, models in INDEX_SPEC.items():
+        if collections is not None and collection_name not in collections:
+            continue
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        missing = [model for model in models if model.document["name"] not in existing]
+        complete = True
+        for model in missing:
+            name = model.document["name"]
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                if e.code not in INDEX_CONFLICT_CODES:
+                    raise
+                complete = False
+                report["errors"].append(f"{collection_name}.{name}: {e.details.get('errmsg', e)}")
+                continue
+            report["created"].append(f"{collection_name}.{name}")
+
+        if not complete:
+            continue
+        for name in OBSOLETE_INDEXES.get(collection_name, []):
+            if name in existing:
+                await collection.drop_index(name)
+                report["dropped"].append(f"{collection_name}.{name}")
+    return report
+
+_index_task: Optional[asyncio.Task] = None
+
+async def _apply_in_background(db):
+    try:
+        report = await apply_index_spec(db)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error("Applying the index spec failed: %s", e)
+        return
+    for name in report["created"]:
+        logger.info("Created index %s", name)
+    for name in report["dropped"]:
+        logger.info("Dropped obsolete index %s", name)
+    for error in report["errors"]:
+        logger.error("Could not create index %s", error)
+
+async def start_index_build(db):
+    """Apply the index spec in the background; queries run meanwhile"""
+    global _index_task
+    _index_task = asyncio.create_task(_apply_in_background(db))
+
+async def stop_index_build():
+    """Stop waiting for index builds; builds already sent finish on the server"""
+    global _index_task
+    if _index_task is not None:
+        _index_task.cancel()
+        try:
+            await _index_task
+        except asyncio.CancelledError:
+            pass
+        _index_task = None
+
+# Stand-in values for the check when the database has no users yet
+SAMPLE_ID = "00000000-0000-4000-8000-000000000000"
+SAMPLE_BBOX = (37.55, 55.70, 37.70, 55.80)
+
+def _sample_user() -> User:
+    return User(
+        id=SAMPLE_ID,
+        telegram_id=0,
+        first_name="Check",
+        age=25,
+        gender="female",
+        price_range_min=30000,
+        price_range_max=60000,
+        metro_station="Арбатская",
+        search_radius=5,
+        location=Location(coordinates=[37.6173, 55.7558])
+    )
+
+def canonical_queries(user: User) -> List[Tuple[str, str, dict]]:
+    """(name, collection, command) of the queries the services send, ready to explain.
+
+    $lookup sub-queries do not show in an aggregate's plan, so the like probe
+    of build_liked_lookup_stages is listed as its own find.
+    """
+    other_id = SAMPLE_ID
+    return [
+        ("user by telegram_id", "users", {"find": "users", "filter": {"telegram_id": user.telegram_id}, "limit": 1}),
+        ("users by id", "users", {"find": "users", "filter": {"id": {"$in": [other_id]}}}),
+        ("properties near user", "properties", {
+            "aggregate": "properties",
+            "pipeline": build_properties_near_pipeline(user, limit=20),
+            "cursor": {}
+        }),
+        ("properties by id", "properties", {"find": "properties", "filter": {"id": {"$in": [other_id]}, "is_active": True}}),
+        ("property clusters", "properties", {
+            "aggregate": "properties",
+            "pipeline": [{"$match": bbox_filter(*SAMPLE_BBOX)}],
+            "cursor": {}
+        }),
+        ("property tile", "properties", {"find": "properties", "filter": bbox_filter(*SAMPLE_BBOX), "limit": 500}),
+        ("import upsert", "properties", {"find": "properties", "filter": {"source": "check", "external_id": "1"}}),
+        ("import deactivation", "properties", {
+            "find": "properties",
+            "filter": {"source": "check", "is_active": True, "last_import_id": {"$ne": SAMPLE_ID}}
+        }),
+        ("potential matches", "users", {
+            "aggregate": "users",
+            "pipeline": build_potential_matches_pipeline(user),
+            "cursor": {}
+        }),
+        ("liked lookup probe", "likes", {
+            "find": "likes",
+            "filter": {"target_id": other_id, "user_id": user.id, "target_type": "property"},
+            "limit": 1
+        }),
+        ("liked ids", "likes", {
+            "find": "likes",
+            "filter": {"user_id": user.id, "target_type": "user", "target_id": {"$in": [other_id]}}
+        }),
+        ("liked list", "likes", {"find": "likes", "filter": {"user_id": user.id, "target_type": "property"}}),
+        ("mutual likes", "likes", {
+            "find": "likes",
+            "filter": {"$or": [
+                {"user_id": user.id, "target_id": other_id, "target_type": "user"},
+                {"user_id": other_id, "target_id": user.id, "target_type": "user"}
+            ]},
+            "projection": {"_id": 0, "user_id": 1}
+        }),
+        ("reciprocal likes", "likes", {
+            "find": "likes",
+            "filter": {"user_id": {"$in": [other_id]}, "target_id": user.id, "target_type": "user"}
+        }),
+        ("match by pair", "matches", {"find": "matches", "filter": {"user1_id": user.id, "user2_id": other_id}}),
+        ("user matches", "matches", {
+            "find": "matches",
+            "filter": {"$or": [{"user1_id": user.id}, {"user2_id": user.id}], "is_active": True}
+        }),
+        ("pending notifications", "match_notifications", {
+            "find": "match_notifications",
+            "filter": {"status": "pending", "next_attempt_at": {"$lte": datetime.utcnow()}},
+            "sort": {"next_attempt_at": 1},
+            "limit": 200
+        })
+    ]
+
+async def check_query_plans(db) -> List[Dict[str, Any]]:
+    """Explain every canonical query; each result says whether it passed"""
+    user_doc = await db.users.find_one({"is_active": True}, {"_id": 0})
+    user = User(**user_doc) if user_doc else _sample_user()
+
+    results = []
+    for name, collection, command in canonical_queries(user):
+        result = {"query": name, "collection": collection}
+        try:
+            explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        except OperationFailure as e:
+            # e.g. $geoNear without its 2dsphere index
+            result.update(ok=False, error=e.details.get("errmsg", str(e)))
+        else:
+            plan = summarize_plan(explain)
+            result.update(ok=not plan["collscan"], stages=plan["stages"], indexes=plan["indexes"])
+        results.append(result)
+    return results
+
+async def main():
+    parser = argparse.ArgumentParser(description="Apply the index spec or check the query plans of the services.")
+    parser.add_argument("command", choices=["apply", "check"], help="apply: create missing indexes; check: fail on COLLSCAN.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    db = get_database()
+    try:
+        if args.command == "apply":
+            report = await apply_index_spec(db)
+            failed = bool(report["errors"])
+            if args.json:
+                print(json.dumps(report, indent=2))
+            else:
+                for name in report["created"]:
+                    print(f"✅ Created {name}")
+                for name in report["dropped"]:
+                    print(f"🗑️  Dropped {name}")
+                for error in report["errors"]:
+                    print(f"❌ {error}")
+                if not any(report.values()):
+                    print("✅ All indexes are in place")
+        else:
+            results = await check_query_plans(db)
+            failed = not all(result["ok"] for result in results)
+            if args.json:
+                print(json.dumps(results, indent=2, ensure_ascii=False))
+            else:
+                for result in results:
+                    mark = "✅" if result["ok"] else "❌"
+                    detail = result.get("error") or f"{' > '.join(result['stages'])} [{', '.join(result['indexes']) or 'no index'}]"
+                    print(f"{mark} {result['query']:<22} {result['collection']:<11} {detail}")
+                print(f"\n{'❌ Some queries scan a whole collection' if failed else '✅ Every query uses an index'}")
+    finally:
+        await close_mongo_connection()
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
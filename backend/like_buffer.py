@@ -0,0 +1,235 @@
+"""Write-behind buffer for likes.
+
+With LIKE_WRITE_BEHIND set, create_like_service acknowledges a like once it
+is in this buffer. A background task upserts the buffered likes with one
+unordered bulk_write every LIKE_FLUSH_INTERVAL_MS, or sooner once
+LIKE_FLUSH_MAX_ITEMS are waiting. Likes stay visible through liked_ids() and
+contains() until their write has finished, so the services' read paths can
+merge them with what they read from the database. Stopping the buffer flushes
+what is left.
+
+Each worker has its own buffer. Other workers see a like once it is flushed;
+their cached liked sets are invalidated over the cache bus at that point.
+Because a request's match check only sees its own worker's buffer, every
+flush also hands the written likes to on_written, which looks for the
+reciprocal likes the requests missed.
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from cache import cache_bus
+from models import Like
+
+logger = logging.getLogger(__name__)
+
+LIKE_WRITE_BEHIND = os.getenv("LIKE_WRITE_BEHIND", "false").lower() == "true"
+LIKE_FLUSH_INTERVAL_MS = float(os.getenv("LIKE_FLUSH_INTERVAL_MS", "50"))
+LIKE_FLUSH_MAX_ITEMS = int(os.getenv("LIKE_FLUSH_MAX_ITEMS", "500"))
+# Acknowledging a like waits for a flush once this many are buffered
+LIKE_BUFFER_MAX_ITEMS = int(os.getenv("LIKE_BUFFER_MAX_ITEMS", "20000"))
+# Likes still buffered this long after shutdown began are given up on
+LIKE_DRAIN_TIMEOUT_SECONDS = float(os.getenv("LIKE_DRAIN_TIMEOUT_SECONDS", "10"))
+
+LikeKey = Tuple[str, str, str]  # (user_id, target_id, target_type)
+
+class LikeWriteBuffer:
+    """Deduplicated likes waiting to be written, flushed in bulk by a background task"""
+
+    def __init__(
+        self,
+        flush_interval_ms: float = LIKE_FLUSH_INTERVAL_MS,
+        flush_max_items: int = LIKE_FLUSH_MAX_ITEMS,
+        max_items: int = LIKE_BUFFER_MAX_ITEMS
+    ):
+        self.flush_interval_ms = flush_interval_ms
+        self.flush_max_items = flush_max_items
+        self.max_items = max_items
+        self._pending: Dict[LikeKey, Like] = {}
+        # The batch being written; still buffered as far as readers are concerned
+        self._flushing: Dict[LikeKey, Like] = {}
+        # (user_id, target_type) -> target ids in _pending or _flushing
+        self._by_user: Dict[Tuple[str, str], Set[str]] = {}
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._flushed: Optional[asyncio.Event] = None
+        self._closing = False
+        # Called with the user id of every flushed like, e.g. to notify other workers
+        self.on_flush: Optional[Callable[[str], None]] = None
+        # Awaited with the likes of every flush once they are written
+        self.on_written: Optional[Callable[[List[Like]], Awaitable[None]]] = None
+        # Written likes whose on_written call failed, retried after the next flush
+        self._unhandled: List[Like] = []
+        self.acknowledged = 0
+        self.duplicates = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._flushing)
+
+    def contains(self, user_id: str, target_id: str, target_type: str) -> bool:
+        return target_id in self._by_user.get((user_id, target_type), ())
+
+    def liked_ids(self, user_id: str, target_type: str) -> Set[str]:
+        """Buffered target ids the user liked (a copy)"""
+        return set(self._by_user.get((user_id, target_type), ()))
+
+    def likers_of(self, user_ids: Iterable[str], target_id: str, target_type: str) -> Set[str]:
+        """Which of `user_ids` have a buffered like of the target"""
+        return {user_id for user_id in user_ids if self.contains(user_id, target_id, target_type)}
+
+    async def add(self, like: Like) -> bool:
+        """Buffer a like; False if the same like is already buffered"""
+        key = (like.user_id, like.target_id, like.target_type)
+        while len(self) >= self.max_items and self.enabled:
+            await self._flushed.wait()
+        if not self.enabled:
+            raise RuntimeError("The like buffer is stopped")
+        if key in self._pending or key in self._flushing:
+            self.duplicates += 1
+            return False
+        self._pending[key] = like
+        self._by_user.setdefault((like.user_id, like.target_type), set()).add(like.target_id)
+        self.acknowledged += 1
+        if len(self._pending) >= self.flush_max_items:
+            self._wake.set()
+        return True
+
+    async def start(self, collection):
+        self._collection = collection
+        self._wake = asyncio.Event()
+        self._flushed = asyncio.Event()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush the remaining likes and stop"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), LIKE_DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            logger.error("Gave up on %d buffered likes at shutdown", len(self))
+        self._task = None
+        # Release requests still waiting for room
+        self._flushed.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._pending:
+                if not await self._flush():
+                    break
+            if self._unhandled:
+                await self._handle_written([])
+            if self._closing and not self._pending:
+                if self._unhandled:
+                    logger.error("Gave up on matching %d written likes at shutdown", len(self._unhandled))
+                return
+
+    async def _flush(self) -> bool:
+        """Write the pending likes; on failure they are kept for the next flush"""
+        self._flushing, self._pending = self._pending, {}
+        requests = [
+            UpdateOne(
+                {"user_id": like.user_id, "target_id": like.target_id, "target_type": like.target_type},
+                {"$setOnInsert": like.model_dump()},
+                upsert=True
+            )
+            for like in self._flushing.values()
+        ]
+        try:
+            await self._collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate keys are likes written meanwhile by another worker or a batch
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                return self._requeue(e)
+        except Exception as e:
+            return self._requeue(e)
+
+        for user_id, target_id, target_type in self._flushing:
+            targets = self._by_user.get((user_id, target_type))
+            if targets is not None:
+                targets.discard(target_id)
+                if not targets:
+                    del self._by_user[(user_id, target_type)]
+        if self.on_flush is not None:
+            for user_id in {user_id for user_id, _, _ in self._flushing}:
+                self.on_flush(user_id)
+        written = list(self._flushing.values())
+        self.written += len(written)
+        self.flushes += 1
+        self._flushing = {}
+        self._flushed.set()
+        self._flushed = asyncio.Event()
+        await self._handle_written(written)
+        return True
+
+    async def _handle_written(self, likes: List[Like]):
+        if self.on_written is None:
+            return
+        likes = self._unhandled + likes
+        self._unhandled = []
+        try:
+            await self.on_written(likes)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Handling %d written likes failed: %s", len(likes), e)
+            self._unhandled = likes
+
+    def _requeue(self, error: Exception) -> bool:
+        self.errors += 1
+        logger.warning("Flushing %d buffered likes failed: %s", len(self._flushing), error)
+        self._flushing.update(self._pending)
+        self._pending, self._flushing = self._flushing, {}
+        return False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "enabled": self.enabled,
+            "buffered": len(self),
+            "acknowledged": self.acknowledged,
+            "duplicates": self.duplicates,
+            "written": self.written,
+            "flushes": self.flushes,
+            "errors": self.errors
+        }
+
+like_buffer = LikeWriteBuffer()
+
+async def start_like_buffer(collection, on_written: Optional[Callable[[List[Like]], Awaitable[None]]] = None):
+    """Buffer likes written by create_like_service if LIKE_WRITE_BEHIND is set.
+
+    on_written is awaited with the likes of every flush, e.g. to create the
+    matches they complete.
+    """
+    if not LIKE_WRITE_BEHIND:
+        return
+    like_buffer.on_flush = lambda user_id: cache_bus.publish("liked", user_id)
+    like_buffer.on_written = on_written
+    await like_buffer.start(collection)
+
+async def stop_like_buffer():
+    await like_buffer.stop()
@@ -0,0 +1,192 @@
+"""Prometheus metrics for HTTP requests and MongoDB commands.
+
+Requests are timed per route template by PrometheusMiddleware. MongoDB
+command and connection-pool timings come from pymongo event listeners,
+which connect_to_mongo registers on the client. With several uvicorn
+workers, set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates all of them.
+"""
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+from pymongo import monitoring
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Buckets in seconds; Mongo commands and pool waits are mostly sub-millisecond
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=HTTP_BUCKETS
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being handled",
+    multiprocess_mode="livesum"
+)
+mongo_command_duration = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command latency by collection and command",
+    ["collection", "command", "status"],
+    buckets=MONGO_BUCKETS
+)
+mongo_pool_checkout_wait = Histogram(
+    "mongodb_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    buckets=MONGO_BUCKETS
+)
+mongo_pool_checkout_failures = Counter(
+    "mongodb_pool_checkout_failures_total",
+    "Connection checkouts that failed, by reason",
+    ["reason"]
+)
+mongo_connections_checked_out = Gauge(
+    "mongodb_connections_checked_out",
+    "Pooled connections currently checked out",
+    multiprocess_mode="livesum"
+)
+
+def command_collection(command_name: str, command: dict) -> str:
+    """Name of the collection a command targets, or "" for commands without one"""
+    target = command.get(command_name)
+    if isinstance(target, str):
+        return target
+    # getMore names the collection separately from its cursor id
+    collection = command.get("collection")
+    return collection if isinstance(collection, str) else ""
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command sent to MongoDB.
+
+    Succeeded/failed events carry the duration but not the command body, so
+    the collection is remembered from the started event until then.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[object, int], Tuple[str, str]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        key = (event.connection_id, event.request_id)
+        self._pending[key] = (command_collection(event.command_name, event.command), event.command_name)
+
+    def _finish(self, event, status: str):
+        collection, command = self._pending.pop(
+            (event.connection_id, event.request_id),
+            ("", event.command_name)
+        )
+        mongo_command_duration.labels(collection, command, status).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, "error")
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Records how long callers wait for a pooled connection.
+
+    A checkout happens on a single thread (Motor runs pymongo in a thread
+    pool), so the start time is kept per thread.
+    """
+
+    def __init__(self):
+        self._checkout_started: Dict[int, float] = {}
+
+    def connection_check_out_started(self, event):
+        self._checkout_started[threading.get_ident()] = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = self._checkout_started.pop(threading.get_ident(), None)
+        if started is not None:
+            mongo_pool_checkout_wait.observe(time.perf_counter() - started)
+        mongo_connections_checked_out.inc()
+
+    def connection_check_out_failed(self, event):
+        self._checkout_started.pop(threading.get_ident(), None)
+        mongo_pool_checkout_failures.labels(event.reason).inc()
+
+    def connection_checked_in(self, event):
+        mongo_connections_checked_out.dec()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+def mongo_event_listeners() -> list:
+    """Listeners to pass as event_listeners when creating the Mongo client"""
+    return [MongoCommandMetrics(), MongoPoolMetrics()]
+
+class PrometheusMiddleware:
+    """ASGI middleware recording latency and in-flight count of HTTP requests.
+
+    Requests are labelled with the route template (e.g. /api/properties/tiles/{z}/{x}/{y}),
+    which routing stores in the scope, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_duration.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status_code)
+            ).observe(time.perf_counter() - start)
+            http_requests_in_progress.dec()
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, and its content type"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
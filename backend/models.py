@@ -42,6 +42,9 @@ class Property(BaseModel):
     amenities: List[str] = []
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
+    # Partner feed and its listing id, for imported listings
+    source: Optional[str] = None
+    external_id: Optional[str] = None
 
 class Like(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -86,7 +89,8 @@ class UserUpdate(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
 
-class PropertyResponse(BaseModel):
+class PropertyListing(BaseModel):
+    """Property fields shared by every client, without per-user data"""
     id: str
     title: str
     description: str
@@ -103,6 +107,8 @@ class PropertyResponse(BaseModel):
     photos: List[str]
     amenities: List[str]
     created_at: datetime
+
+class PropertyResponse(PropertyListing):
     is_liked: bool = False
 
 class UserResponse(BaseModel):
@@ -122,3 +128,50 @@ class UserResponse(BaseModel):
     longitude: float
     created_at: datetime
     is_liked: bool = False
+
+class LikeBatchItem(BaseModel):
+    target_id: str
+    target_type: str  # "user" or "property"
+
+class LikeBatchRequest(BaseModel):
+    telegram_id: int
+    likes: List[LikeBatchItem] = Field(..., max_length=200)
+
+class LikeBatchItemResult(BaseModel):
+    target_id: str
+    target_type: str
+    status: str  # "created", "exists" or "invalid"
+    like_id: Optional[str] = None
+    match: Optional[str] = None
+    is_match: bool = False
+
+class LikeBatchResponse(BaseModel):
+    results: List[LikeBatchItemResult]
+    matches: List[str] = []
+
+class PropertyCluster(BaseModel):
+    latitude: float  # centroid
+    longitude: float
+    count: int
+    min_price: int
+    max_price: int
+
+class PropertyPoint(BaseModel):
+    id: str
+    latitude: float
+    longitude: float
+    price: int
+
+class PropertyClustersResponse(BaseModel):
+    zoom: int
+    cell_size: float  # degrees
+    clusters: List[PropertyCluster]
+    points: List[PropertyPoint]
+
+class LikeLookupRequest(BaseModel):
+    telegram_id: int
+    target_type: str  # "user" or "property"
+    target_ids: List[str] = Field(..., max_length=1000)
+
+class LikeLookupResponse(BaseModel):
+    liked_ids: List[str]
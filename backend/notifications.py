@@ -0,0 +1,286 @@
+"""Match notifications sent through the Telegram bot.
+
+Creating a match writes an event to the match_notifications collection;
+nothing talks to Telegram on the request path. NotificationWorker, which
+runs inside telegram_bot.py, drains pending events in batches and tells
+both users about their new matches, one message per user per batch.
+Messages go through RateLimitedSender, which keeps under Telegram's limits
+with token buckets: one per chat and a global one for the bot.
+"""
+import asyncio
+import html
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from database import get_database
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "200"))
+NOTIFY_POLL_INTERVAL_SECONDS = float(os.getenv("NOTIFY_POLL_INTERVAL_SECONDS", "1"))
+# Telegram allows about 30 messages per second overall and one per second per chat
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+NOTIFY_CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", "1"))
+# Events that still could not be delivered after this many rounds are given up on
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+# Delay before the first retry of an event; doubled for every later one
+NOTIFY_RETRY_DELAY_SECONDS = 10
+# Retries of one message after Telegram asked to slow down
+MAX_RETRY_AFTER_RETRIES = 3
+# Idle chat buckets are dropped once there are more than this many
+MAX_CHAT_BUCKETS = 10000
+
+def get_notifications_collection():
+    return get_database().match_notifications
+
+async def enqueue_match_notification(match_id: str, user1_id: str, user2_id: str):
+    """Record that a new match needs to be announced to both users.
+
+    Keyed by the match id, so enqueuing the same match twice is harmless.
+    A failure is logged rather than failing the like that made the match.
+    """
+    now = datetime.utcnow()
+    try:
+        await get_notifications_collection().update_one(
+            {"_id": match_id},
+            {"$setOnInsert": {
+                "user_ids": [user1_id, user2_id],
+                "notified": [],
+                "attempts": 0,
+                "status": "pending",
+                "created_at": now,
+                "next_attempt_at": now
+            }},
+            upsert=True
+        )
+    except PyMongoError as e:
+        logger.error("Could not enqueue the notification of match %s: %s", match_id, e)
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, in bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class _ChatBucket(TokenBucket):
+    """A chat's bucket, with a lock so its messages are sent one at a time"""
+
+    def __init__(self, rate: float):
+        super().__init__(rate)
+        self.lock = asyncio.Lock()
+
+    def is_idle(self) -> bool:
+        return not self.lock.locked() and self.is_full()
+
+class RateLimitedSender:
+    """Sends messages within Telegram's per-chat and global rate limits.
+
+    `send` is a coroutine function taking (chat_id, text). An exception with a
+    `retry_after` attribute (aiogram's TelegramRetryAfter has one) pauses all
+    sending for that many seconds before the message is retried. send_message
+    returns whether the message went out; other errors are logged and left
+    to the caller to retry later.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[int, str], Awaitable[object]],
+        global_rate: float = NOTIFY_GLOBAL_RATE,
+        chat_rate: float = NOTIFY_CHAT_RATE
+    ):
+        self.send = send
+        self.chat_rate = chat_rate
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._chats: Dict[int, _ChatBucket] = {}
+        self._resume_at = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+
+    def _chat_bucket(self, chat_id: int) -> _ChatBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle()}
+            bucket = self._chats[chat_id] = _ChatBucket(self.chat_rate)
+        return bucket
+
+    async def _wait_turn(self, chat_bucket: _ChatBucket):
+        while True:
+            pause = self._resume_at - time.monotonic()
+            if pause <= 0:
+                break
+            await asyncio.sleep(pause)
+        await self._global.acquire()
+        # Taken last, right before sending, so the chat's messages stay spaced out
+        await chat_bucket.acquire()
+
+    async def send_message(self, chat_id: int, text: str) -> bool:
+        chat_bucket = self._chat_bucket(chat_id)
+        async with chat_bucket.lock:
+            for _ in range(MAX_RETRY_AFTER_RETRIES + 1):
+                await self._wait_turn(chat_bucket)
+                try:
+                    await self.send(chat_id, text)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    retry_after = getattr(e, "retry_after", None)
+                    if retry_after is None:
+                        logger.warning("Could not send a notification to chat %s: %s", chat_id, e)
+                        self.failed += 1
+                        return False
+                    self.throttled += 1
+                    self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+                    continue
+                self.sent += 1
+                return True
+        self.failed += 1
+        return False
+
+    def stats(self) -> Dict[str, int]:
+        return {"sent": self.sent, "failed": self.failed, "throttled": self.throttled}
+
+def format_matches_message(matched_users: Iterable[dict]) -> str:
+    """HTML message announcing one or more new matches"""
+    names = []
+    for user in matched_users:
+        name = html.escape(user["first_name"])
+        if user.get("username"):
+            name += f" (@{html.escape(user['username'])})"
+        names.append(name)
+    if len(names) == 1:
+        return f"💕 <b>У вас новое совпадение!</b>\n\n{names[0]} тоже хочет жить с вами. Откройте приложение, чтобы познакомиться."
+    listed = "\n".join(f"• {name}" for name in names)
+    return f"💕 <b>Новые совпадения: {len(names)}</b>\n\n{listed}\n\nОткройте приложение, чтобы познакомиться."
+
+class NotificationWorker:
+    """Drains pending match notifications in batches.
+
+    Each event remembers which of its users were told, so a retried event
+    does not message the other user twice. Undelivered events are retried
+    with exponential backoff. Delivery is at least once: a crash between
+    sending and recording can repeat a message.
+    """
+
+    def __init__(
+        self,
+        sender: RateLimitedSender,
+        batch_size: int = NOTIFY_BATCH_SIZE,
+        poll_interval: float = NOTIFY_POLL_INTERVAL_SECONDS
+    ):
+        self.sender = sender
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        """Send one batch of pending events; returns how many events it read"""
+        collection = get_notifications_collection()
+        events = await collection.find(
+            {"status": "pending", "next_attempt_at": {"$lte": datetime.utcnow()}}
+        ).sort("next_attempt_at", 1).limit(self.batch_size).to_list(length=None)
+        if not events:
+            return 0
+
+        # Recipient -> events announcing one of their matches
+        events_by_recipient: Dict[str, List[dict]] = {}
+        for event in events:
+            for user_id in event["user_ids"]:
+                if user_id not in event["notified"]:
+                    events_by_recipient.setdefault(user_id, []).append(event)
+        user_ids = {user_id for event in events for user_id in event["user_ids"]}
+        users = await get_database().users.find(
+            {"id": {"$in": list(user_ids)}},
+            {"_id": 0, "id": 1, "telegram_id": 1, "first_name": 1, "username": 1}
+        ).to_list(length=None)
+        users_by_id = {user["id"]: user for user in users}
+
+        async def notify(recipient_id: str, recipient_events: List[dict]) -> bool:
+            recipient = users_by_id.get(recipient_id)
+            if recipient is None:
+                # Deleted account; nobody to tell
+                return True
+            matched_users = [
+                users_by_id[other_id]
+                for event in recipient_events
+                for other_id in event["user_ids"]
+                if other_id != recipient_id and other_id in users_by_id
+            ]
+            if not matched_users:
+                return True
+            return await self.sender.send_message(recipient["telegram_id"], format_matches_message(matched_users))
+
+        recipients = list(events_by_recipient)
+        delivered = await asyncio.gather(*(notify(user_id, events_by_recipient[user_id]) for user_id in recipients))
+
+        notified: Dict[str, List[str]] = {event["_id"]: list(event["notified"]) for event in events}
+        for user_id, ok in zip(recipients, delivered):
+            if ok:
+                for event in events_by_recipient[user_id]:
+                    notified[event["_id"]].append(user_id)
+        now = datetime.utcnow()
+        updates = []
+        for event in events:
+            done = set(notified[event["_id"]]) >= set(event["user_ids"])
+            attempts = event["attempts"] + 1
+            status = "sent" if done else ("failed" if attempts >= NOTIFY_MAX_ATTEMPTS else "pending")
+            updates.append(UpdateOne({"_id": event["_id"]}, {"$set": {
+                "notified": notified[event["_id"]],
+                "attempts": attempts,
+                "status": status,
+                "next_attempt_at": now + timedelta(seconds=NOTIFY_RETRY_DELAY_SECONDS * 2 ** (attempts - 1)),
+                "updated_at": now
+            }}))
+        await collection.bulk_write(updates, ordered=False)
+        return len(events)
+
+    async def _run(self):
+        while True:
+            try:
+                read = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Sending match notifications failed: %s", e)
+                read = 0
+            if read < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
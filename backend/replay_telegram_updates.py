@@ -0,0 +1,78 @@
+"""Post recorded Telegram updates to the bot's webhook, e.g. to try webhook mode locally.
+
+    TELEGRAM_BOT_MODE=webhook TELEGRAM_API_URL=http://localhost:8081 python telegram_bot.py
+    python replay_telegram_updates.py updates.jsonl --repeat 100 --concurrency 50
+
+The updates file holds one Update JSON object per line, as Telegram sends
+them. Replies the bot sends go to TELEGRAM_API_URL, so point it at a fake
+Bot API server rather than the real one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from typing import List
+
+from aiohttp import ClientSession
+
+from benchmark_stats import percentile
+from webhook import SECRET_TOKEN_HEADER
+
+DEFAULT_URL = "http://localhost:8080" + os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook")
+
+def load_updates(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+async def replay(url: str, updates: List[dict], repeat: int, concurrency: int, secret: str = None) -> dict:
+    headers = {SECRET_TOKEN_HEADER: secret} if secret else {}
+    queue: asyncio.Queue = asyncio.Queue()
+    # Every copy gets its own update_id, as Telegram's would
+    for copy in range(repeat):
+        for update in updates:
+            queue.put_nowait(dict(update, update_id=update.get("update_id", 0) + copy * len(updates)))
+    statuses = Counter()
+    latencies = []
+
+    async with ClientSession(headers=headers) as http:
+        async def worker():
+            while not queue.empty():
+                update = queue.get_nowait()
+                start = time.perf_counter()
+                async with http.post(url, json=update) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "updates": len(latencies),
+        "statuses": dict(statuses),
+        "elapsed_s": elapsed,
+        "updates_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Post recorded Telegram updates to the bot's webhook.")
+    parser.add_argument("path", help="JSONL file with one recorded update per line.")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Webhook URL of the bot.")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to send the whole file.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight at once.")
+    parser.add_argument("--secret", default=os.getenv("TELEGRAM_WEBHOOK_SECRET"), help="Webhook secret token.")
+    args = parser.parse_args()
+
+    report = await replay(args.url, load_updates(args.path), args.repeat, args.concurrency, args.secret)
+    print(f"📨 {report['updates']} updates in {report['elapsed_s']:.2f}s ({report['updates_per_s']:,.0f}/s)")
+    print(f"⏱️  p50 {report['p50_ms']:.1f} ms, p95 {report['p95_ms']:.1f} ms")
+    print(f"📊 Statuses: {report['statuses']}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+"""Mapping from MongoDB documents to API response models, and fast responses.
+
+Documents read from our own collections were validated when they were written,
+so responses are built with model_construct instead of being validated again
+field by field. FastJSONResponse then renders them with orjson straight from
+the models' field values, skipping FastAPI's response_model validation pass.
+Clients sending `Accept: application/msgpack` get the same data as MessagePack.
+"""
+from datetime import datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Mapping, Optional
+
+import msgpack
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from models import PropertyListing, PropertyResponse, User, UserResponse
+
+def _property_fields(doc: dict) -> dict:
+    coordinates = doc["location"]["coordinates"]
+    return {
+        "id": doc["id"],
+        "title": doc["title"],
+        "description": doc["description"],
+        "price": doc["price"],
+        "address": doc["address"],
+        "metro_station": doc["metro_station"],
+        "latitude": coordinates[1],
+        "longitude": coordinates[0],
+        "rooms": doc["rooms"],
+        "area": doc["area"],
+        "floor": doc["floor"],
+        "total_floors": doc["total_floors"],
+        "property_type": doc["property_type"],
+        "photos": doc.get("photos", []),
+        "amenities": doc.get("amenities", []),
+        "created_at": doc["created_at"]
+    }
+
+def property_listing_from_doc(doc: dict) -> PropertyListing:
+    """Build a PropertyListing from a properties document"""
+    return PropertyListing.model_construct(**_property_fields(doc))
+
+def property_response_from_doc(doc: dict, is_liked: bool = False) -> PropertyResponse:
+    """Build a PropertyResponse from a properties document"""
+    return PropertyResponse.model_construct(**_property_fields(doc), is_liked=is_liked)
+
+def user_response_from_doc(doc: dict, is_liked: bool = False) -> UserResponse:
+    """Build a UserResponse from a users document (or its USER_RESPONSE_PROJECTION)"""
+    coordinates = doc["location"]["coordinates"]
+    return UserResponse.model_construct(
+        id=doc["id"],
+        username=doc.get("username"),
+        first_name=doc["first_name"],
+        last_name=doc.get("last_name"),
+        profile_photo_url=doc.get("profile_photo_url"),
+        age=doc["age"],
+        gender=doc.get("gender"),
+        about=doc.get("about"),
+        price_range_min=doc["price_range_min"],
+        price_range_max=doc["price_range_max"],
+        metro_station=doc["metro_station"],
+        search_radius=doc["search_radius"],
+        latitude=coordinates[1],
+        longitude=coordinates[0],
+        created_at=doc["created_at"],
+        is_liked=is_liked
+    )
+
+def user_response_from_user(user: User) -> UserResponse:
+    """Build a UserResponse from an already validated User"""
+    return UserResponse.model_construct(
+        id=user.id,
+        username=user.username,
+        first_name=user.first_name,
+        last_name=user.last_name,
+        profile_photo_url=user.profile_photo_url,
+        age=user.age,
+        gender=user.gender,
+        about=user.about,
+        price_range_min=user.price_range_min,
+        price_range_max=user.price_range_max,
+        metro_station=user.metro_station,
+        search_radius=user.search_radius,
+        latitude=user.location.coordinates[1],
+        longitude=user.location.coordinates[0],
+        created_at=user.created_at,
+        is_liked=False
+    )
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """Serialize response models (and plain JSON data) with orjson"""
+    return orjson.dumps(content, default=_default)
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson.
+
+    Returning it from an endpoint bypasses response_model validation, so it
+    must only carry models built by this module or data of the same shape.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    # Same representations orjson uses, so both formats decode to equal data
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Type is not MessagePack serializable: {type(obj).__name__}")
+
+def packb(content: Any) -> bytes:
+    """Serialize response models (and plain JSON data) as MessagePack"""
+    return msgpack.packb(content, default=_msgpack_default)
+
+class MsgPackResponse(Response):
+    """MessagePack response; the same caveats as FastJSONResponse apply"""
+
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return packb(content)
+
+def wants_msgpack(accept: str) -> bool:
+    """Whether an Accept header asks for MessagePack"""
+    accept = accept or ""
+    return MSGPACK_MEDIA_TYPE in accept or "application/x-msgpack" in accept
+
+def negotiated_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Mapping[str, str]] = None
+) -> Response:
+    """MsgPackResponse if the client accepts MessagePack, else FastJSONResponse"""
+    response_class = MsgPackResponse if wants_msgpack(request.headers.get("accept")) else FastJSONResponse
+    response = response_class(content, status_code=status_code, headers=headers)
+    response.headers["Vary"] = "Accept"
+    return response
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Bytes of serialized records buffered before a chunk is written
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+async def _ndjson_chunks(items: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+    chunk = bytearray()
+    first = True
+    async for item in items:
+        chunk += dumps(item)
+        chunk += b"\n"
+        # The first record goes out at once so the client can start rendering
+        if first or len(chunk) >= NDJSON_CHUNK_BYTES:
+            yield bytes(chunk)
+            chunk.clear()
+            first = False
+    if chunk:
+        yield bytes(chunk)
+
+def wants_ndjson(accept: str) -> bool:
+    """Whether an Accept header asks for newline-delimited JSON"""
+    return NDJSON_MEDIA_TYPE in (accept or "")
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """Streams records from an async iterator as newline-delimited JSON.
+
+    Records are serialized as they arrive. The first is flushed on its own,
+    the rest in chunks of about NDJSON_CHUNK_BYTES, so memory use does not
+    grow with the result size.
+    """
+
+    media_type = NDJSON_MEDIA_TYPE
+
+    def __init__(self, items: AsyncIterator[Any], **kwargs):
+        super().__init__(_ndjson_chunks(items), **kwargs)
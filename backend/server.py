@@ -1,15 +1,16 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 # from contextlib import asynccontextmanager
 from typing import List, Optional
 import os
 import logging
+import secrets
 from dotenv import load_dotenv
 
 from database import (
     connect_to_mongo, 
     close_mongo_connection, 
-    create_indexes,
+    get_database,
     get_users_collection,
     get_properties_collection,
     get_likes_collection,
@@ -19,27 +20,60 @@ from models import (
     User, UserCreate, UserUpdate, UserResponse,
     Property, PropertyResponse,
     Like, Match,
-    Location
+    Location,
+    LikeBatchRequest, LikeBatchResponse,
+    PropertyClustersResponse,
+    PropertyListing,
+    LikeLookupRequest, LikeLookupResponse
 )
+from serialization import (
+    NDJSONStreamingResponse,
+    negotiated_response,
+    user_response_from_user,
+    wants_msgpack,
+    wants_ndjson
+)
+from spatial_index import start_property_index, stop_property_index
+from indexes import start_index_build, stop_index_build
+from like_buffer import like_buffer, start_like_buffer, stop_like_buffer
+from metrics import PrometheusMiddleware, render_metrics
+from slow_queries import slow_query_recorder
+from cache import liked_cache, profile_cache, cache_bus, start_cache_bus, stop_cache_bus
 from services import (
     create_user_service,
     get_user_by_telegram_id_service,
     update_user_service,
     get_properties_near_user_service,
+    get_properties_page_service,
+    stream_properties_near_user_service,
+    get_property_clusters_service,
+    get_properties_version,
+    get_properties_in_tile_service,
+    tile_bounds,
+    get_liked_ids_service,
     get_potential_matches_service,
+    stream_potential_matches_service,
     create_like_service,
+    create_likes_batch_service,
     check_match_service,
+    match_written_likes_service,
     get_user_matches_service,
-    get_user_liked_properties_service
+    get_user_liked_properties_service,
+    stream_user_liked_properties_service
 )
 
 load_dotenv()
 
+TILE_CACHE_CONTROL = os.getenv("TILE_CACHE_CONTROL", "public, max-age=30")
+# Required in the X-Admin-Token header by the cache and slow query endpoints;
+# they are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 # @asynccontextmanager
 # async def lifespan(app: FastAPI):
 #     # Startup
 #     await connect_to_mongo()
-#     await create_indexes()
+#     await start_index_build(get_database())
 #     yield
 #     # Shutdown
 #     await close_mongo_connection()
@@ -54,10 +88,17 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup_event():
     await connect_to_mongo()
-    await create_indexes()
+    await start_index_build(get_database())
+    await start_cache_bus()
+    await start_property_index(get_properties_collection())
+    await start_like_buffer(get_likes_collection(), on_written=match_written_likes_service)
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await stop_property_index()
+    await stop_like_buffer()
+    await stop_cache_bus()
+    await stop_index_build()
     await close_mongo_connection()
 
 # Configure CORS
@@ -67,11 +108,50 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+app.add_middleware(PrometheusMiddleware)
 
 @app.get("/api/health")
-async def health_check():
-    return {"status": "healthy", "message": "Roommate Finder API is running"}
+async def health_check(request: Request):
+    return negotiated_response(request, {"status": "healthy", "message": "Roommate Finder API is running"})
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Allow only requests carrying ADMIN_TOKEN"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/api/cache/stats", dependencies=[Depends(require_admin_token)])
+async def cache_stats(request: Request):
+    """Hit/miss counters and memory use of the in-process caches"""
+    return negotiated_response(request, {
+        "liked": liked_cache.stats(),
+        "profile": profile_cache.stats(),
+        "bus": cache_bus.stats(),
+        "like_buffer": like_buffer.stats()
+    })
+
+@app.get("/api/admin/slow-queries", dependencies=[Depends(require_admin_token)])
+async def slow_queries(request: Request, limit: int = Query(50, ge=1, le=500)):
+    """Recently recorded slow MongoDB commands with their query shapes and sampled plans"""
+    return negotiated_response(request, {
+        **slow_query_recorder.stats(),
+        "queries": slow_query_recorder.recent(limit)
+    })
+
+@app.delete("/api/admin/slow-queries", dependencies=[Depends(require_admin_token)])
+async def clear_slow_queries():
+    """Empty the slow query buffer, e.g. before a load test"""
+    slow_query_recorder.clear()
+    return {"status": "cleared"}
 
 @app.post("/api/users/test")
 async def test_create_user():
@@ -107,23 +187,7 @@ async def create_user(user_data: UserCreate):
         print(f"DEBUG: user_data fields: {list(user_data.__dict__.keys())}")
         
         user = await create_user_service(user_data)
-        return UserResponse(
-            id=user.id,
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            profile_photo_url=user.profile_photo_url,
-            age=user.age,
-            gender=user.gender,
-            about=user.about,
-            price_range_min=user.price_range_min,
-            price_range_max=user.price_range_max,
-            metro_station=user.metro_station,
-            search_radius=user.search_radius,
-            latitude=user.location.coordinates[1],
-            longitude=user.location.coordinates[0],
-            created_at=user.created_at
-        )
+        return user_response_from_user(user)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -132,29 +196,13 @@ async def create_user(user_data: UserCreate):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/api/users/me", response_model=UserResponse)
-async def get_current_user(telegram_id: int = Query(...)):
+async def get_current_user(request: Request, telegram_id: int = Query(...)):
     """Get current user profile by telegram_id"""
     user = await get_user_by_telegram_id_service(telegram_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return UserResponse(
-        id=user.id,
-        username=user.username,
-        first_name=user.first_name,
-        last_name=user.last_name,
-        profile_photo_url=user.profile_photo_url,
-        age=user.age,
-        gender=user.gender,
-        about=user.about,
-        price_range_min=user.price_range_min,
-        price_range_max=user.price_range_max,
-        metro_station=user.metro_station,
-        search_radius=user.search_radius,
-        latitude=user.location.coordinates[1],
-        longitude=user.location.coordinates[0],
-        created_at=user.created_at
-    )
+    return negotiated_response(request, user_response_from_user(user))
 
 @app.put("/api/users/me", response_model=UserResponse)
 async def update_current_user(user_update: UserUpdate):
@@ -164,41 +212,84 @@ async def update_current_user(user_update: UserUpdate):
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        return UserResponse(
-            id=user.id,
-            username=user.username,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            profile_photo_url=user.profile_photo_url,
-            age=user.age,
-            gender=user.gender,
-            about=user.about,
-            price_range_min=user.price_range_min,
-            price_range_max=user.price_range_max,
-            metro_station=user.metro_station,
-            search_radius=user.search_radius,
-            latitude=user.location.coordinates[1],
-            longitude=user.location.coordinates[0],
-            created_at=user.created_at
-        )
+        return user_response_from_user(user)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/api/properties", response_model=List[PropertyResponse])
-async def get_properties(telegram_id: int = Query(...)):
-    """Get properties near user based on their location and search radius"""
+async def get_properties(
+    request: Request,
+    telegram_id: int = Query(...),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = Query(None)
+):
+    """Get properties near user based on their location and search radius.
+
+    With `limit`, results are paged by distance; the cursor of the next page
+    is returned in the X-Next-Cursor header. Without it, clients sending
+    `Accept: application/x-ndjson` get the full result streamed one property
+    per line.
+    """
+    try:
+        if limit is None and wants_ndjson(request.headers.get("accept")):
+            return NDJSONStreamingResponse(stream_properties_near_user_service(telegram_id))
+        properties, next_cursor = await get_properties_page_service(telegram_id, limit=limit, cursor=cursor)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return negotiated_response(request, properties, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/api/properties/clusters", response_model=PropertyClustersResponse)
+async def get_property_clusters(
+    request: Request,
+    bbox: str = Query(..., description="min_lng,min_lat,max_lng,max_lat"),
+    zoom: int = Query(..., ge=0, le=22)
+):
+    """Get active properties in a bounding box grouped into map clusters"""
+    try:
+        return negotiated_response(request, await get_property_clusters_service(bbox, zoom))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/api/properties/tiles/{z}/{x}/{y}", response_model=List[PropertyListing])
+async def get_property_tile(z: int, x: int, y: int, request: Request):
+    """Get active properties in a slippy-map tile.
+
+    Tiles carry no per-user fields, so they can be cached by nginx and the
+    client; the ETag changes whenever property data does. Liked flags are
+    overlaid with POST /api/likes/lookup.
+    """
     try:
-        properties = await get_properties_near_user_service(telegram_id)
-        return properties
+        tile_bounds(z, x, y)  # validate before touching the database
+        version = await get_properties_version()
+        # Each representation needs its own strong ETag
+        suffix = "-mp" if wants_msgpack(request.headers.get("accept")) else ""
+        etag = f'"p{version}-{z}-{x}-{y}{suffix}"'
+        cache_headers = {"ETag": etag, "Cache-Control": TILE_CACHE_CONTROL, "Vary": "Accept"}
+        
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=cache_headers)
+        
+        properties = await get_properties_in_tile_service(z, x, y)
+        return negotiated_response(request, properties, headers=cache_headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/api/matches", response_model=List[UserResponse])
-async def get_matches(telegram_id: int = Query(...)):
-    """Get potential matches for user"""
+async def get_matches(request: Request, telegram_id: int = Query(...)):
+    """Get potential matches for user (streamed for `Accept: application/x-ndjson`)"""
     try:
+        if wants_ndjson(request.headers.get("accept")):
+            return NDJSONStreamingResponse(stream_potential_matches_service(telegram_id))
         matches = await get_potential_matches_service(telegram_id)
-        return matches
+        return negotiated_response(request, matches)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
@@ -232,21 +323,48 @@ async def create_like(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/api/likes/batch", response_model=LikeBatchResponse)
+async def create_likes_batch(batch: LikeBatchRequest):
+    """Create a batch of queued likes (users or properties) in one request"""
+    try:
+        user = await get_user_by_telegram_id_service(batch.telegram_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        return await create_likes_batch_service(user.id, batch.likes)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/api/likes/lookup", response_model=LikeLookupResponse)
+async def lookup_likes(request: Request, lookup: LikeLookupRequest):
+    """Get which of the given targets the user has liked"""
+    try:
+        liked_ids = await get_liked_ids_service(lookup.telegram_id, lookup.target_type, lookup.target_ids)
+        return negotiated_response(request, LikeLookupResponse(liked_ids=liked_ids))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @app.get("/api/user-matches", response_model=List[UserResponse])
-async def get_user_matches(telegram_id: int = Query(...)):
+async def get_user_matches(request: Request, telegram_id: int = Query(...)):
     """Get confirmed matches for user"""
     try:
         matches = await get_user_matches_service(telegram_id)
-        return matches
+        return negotiated_response(request, matches)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/api/liked-properties", response_model=List[PropertyResponse])
-async def get_liked_properties(telegram_id: int = Query(...)):
-    """Get properties liked by user"""
+async def get_liked_properties(request: Request, telegram_id: int = Query(...)):
+    """Get properties liked by user (streamed for `Accept: application/x-ndjson`)"""
     try:
+        if wants_ndjson(request.headers.get("accept")):
+            return NDJSONStreamingResponse(stream_user_liked_properties_service(telegram_id))
         properties = await get_user_liked_properties_service(telegram_id)
-        return properties
+        return negotiated_response(request, properties)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
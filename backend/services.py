@@ -1,9 +1,48 @@
-from typing import List, Optional
-from models import User, UserCreate, UserUpdate, UserResponse, Property, PropertyResponse, Like, Match, Location
-from database import get_users_collection, get_properties_collection, get_likes_collection, get_matches_collection
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+from models import (
+    User, UserCreate, UserUpdate, UserResponse, Property, PropertyResponse, Like, Match, Location,
+    LikeBatchItem, LikeBatchItemResult, LikeBatchResponse,
+    PropertyCluster, PropertyPoint, PropertyClustersResponse, PropertyListing
+)
+from database import (
+    get_users_collection, get_properties_collection, get_likes_collection, get_matches_collection,
+    get_meta_collection
+)
+from spatial_index import PropertySpatialIndex, get_property_index
+from serialization import property_listing_from_doc, property_response_from_doc, user_response_from_doc
+from cache import LIKE_TARGET_TYPES, liked_cache, profile_cache
+from like_buffer import like_buffer
+from notifications import enqueue_match_notification
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import uuid
+import asyncio
+import base64
+import json
+import math
+import os
+import time
 from datetime import datetime
 
+# Map clustering: grid cells per 256px map tile, the largest cell still sent
+# as individual points, and the most cells returned for one request
+CLUSTER_CELLS_PER_TILE = int(os.getenv("CLUSTER_CELLS_PER_TILE", "2"))
+CLUSTER_POINT_THRESHOLD = int(os.getenv("CLUSTER_POINT_THRESHOLD", "3"))
+CLUSTER_MAX_CELLS = int(os.getenv("CLUSTER_MAX_CELLS", "200"))
+# Widest piece a bounding box query polygon may cover, well under a
+# hemisphere, and the latitude its corners stay within, off the poles
+BBOX_MAX_PIECE_DEGREES = 90.0
+BBOX_MAX_POLYGON_LAT = 89.9
+
+# Property tiles are only served from this zoom on; lower zooms use clusters
+TILE_MIN_ZOOM = int(os.getenv("TILE_MIN_ZOOM", "12"))
+TILE_MAX_ZOOM = 22
+TILE_MAX_PROPERTIES = int(os.getenv("TILE_MAX_PROPERTIES", "500"))
+PROPERTIES_VERSION_TTL_SECONDS = float(os.getenv("PROPERTIES_VERSION_TTL_SECONDS", "5"))
+
+# Documents fetched per round trip by the streaming (NDJSON) services
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "200"))
+
 async def create_user_service(user_data: UserCreate) -> User:
     """Create a new user"""
     try:
@@ -41,6 +80,7 @@ async def create_user_service(user_data: UserCreate) -> User:
         # Insert to database
         print("DEBUG: Inserting to database...")
         await users_collection.insert_one(user.model_dump())
+        profile_cache.invalidate(user.telegram_id)
         print("DEBUG: Inserted successfully")
         return user
         
@@ -51,12 +91,26 @@ async def create_user_service(user_data: UserCreate) -> User:
         raise
 
 async def get_user_by_telegram_id_service(telegram_id: int) -> Optional[User]:
-    """Get user by telegram_id"""
+    """Get user by telegram_id.
+
+    Profiles are served from the in-process profile cache when possible; the
+    returned User is shared and must not be mutated.
+    """
+    user = profile_cache.get(telegram_id)
+    if user is not None:
+        return user
+    
     users_collection = get_users_collection()
-    user_data = await users_collection.find_one({"telegram_id": telegram_id})
-    if user_data:
-        return User(**user_data)
-    return None
+    generation = profile_cache.begin_load(telegram_id)
+    try:
+        user_data = await users_collection.find_one({"telegram_id": telegram_id})
+        if not user_data:
+            return None
+        user = User(**user_data)
+        profile_cache.put(telegram_id, user, generation)
+        return user
+    finally:
+        profile_cache.end_load(telegram_id)
 
 import logging
 
@@ -89,31 +143,371 @@ async def update_user_service(telegram_id: int, user_update: UserUpdate) -> Opti
             {"telegram_id": telegram_id},
             {"$set": update_data}
         )
+        profile_cache.invalidate(telegram_id)
     
     return await get_user_by_telegram_id_service(telegram_id)
 
+def encode_properties_cursor(distance: float, property_id: str) -> str:
+    """Encode the keyset position of the last property on a page into an opaque cursor"""
+    payload = json.dumps({"d": distance, "id": property_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_properties_cursor(cursor: str) -> Tuple[float, str]:
+    """Decode a cursor produced by encode_properties_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(payload["d"]), str(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def build_liked_lookup_stages(user_id: str, target_type: str) -> List[dict]:
+    """Aggregation stages that set `is_liked` on each result from the likes collection.
+
+    Each result probes the likes index for its own id, so the likes read
+    scale with the number of results rather than the user's like history.
+    """
+    return [
+        {
+            "$lookup": {
+                "from": "likes",
+                "localField": "id",
+                "foreignField": "target_id",
+                "pipeline": [
+                    {"$match": {"user_id": user_id, "target_type": target_type}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 1}}
+                ],
+                "as": "liked"
+            }
+        },
+        {"$addFields": {"is_liked": {"$gt": [{"$size": "$liked"}, 0]}}},
+        {"$project": {"liked": 0}}
+    ]
+
+def liked_flag(doc: dict, cached_ids: Optional[Set[str]], buffered_ids: Set[str]) -> bool:
+    """Whether a result is liked, from the user's cached liked ids if given.
+
+    Otherwise the result's `is_liked` from build_liked_lookup_stages() is
+    used; the $lookup only sees likes that are already written, so likes
+    still in the write-behind buffer are added.
+    """
+    if cached_ids is not None:
+        return doc["id"] in cached_ids
+    return doc["is_liked"] or doc["id"] in buffered_ids
+
+def merge_liked_flags(docs: Iterable[dict], cached_ids: Optional[Set[str]], buffered_ids: Set[str]):
+    """Set `is_liked` on each result with liked_flag()"""
+    for doc in docs:
+        doc["is_liked"] = liked_flag(doc, cached_ids, buffered_ids)
+
+async def get_liked_target_ids(
+    user_id: str,
+    target_type: str,
+    target_ids: List[str],
+    warm_cache: bool = False
+) -> set:
+    """Return which of the given targets the user has liked.
+
+    With `warm_cache`, a cache miss reads all the user's likes into the cache
+    instead of looking up just these targets.
+    """
+    if not target_ids:
+        return set()
+    cached = liked_cache.get(user_id, target_type)
+    if cached is None and warm_cache and liked_cache.needs_load(user_id, target_type):
+        cached = await load_liked_cache(user_id, target_type)
+    if cached is not None:
+        return cached.intersection(target_ids)
+    # Taken before the read: a like flushed meanwhile is in one or the other
+    buffered = like_buffer.liked_ids(user_id, target_type)
+    likes = await get_likes_collection().find({
+        "user_id": user_id,
+        "target_type": target_type,
+        "target_id": {"$in": target_ids}
+    }, {"_id": 0, "target_id": 1}).to_list(length=None)
+    return {like["target_id"] for like in likes} | buffered.intersection(target_ids)
+
+async def load_liked_cache(user_id: str, target_type: str) -> Optional[Set[str]]:
+    """Read the user's liked ids into the liked cache if they are not there yet.
+
+    Returns the ids read, or None if they were not cached: the user has too
+    many likes, or a like written meanwhile made the read stale.
+    """
+    if not liked_cache.needs_load(user_id, target_type):
+        return None
+    generation = liked_cache.begin_load(user_id, target_type)
+    try:
+        buffered = like_buffer.liked_ids(user_id, target_type)
+        # One more than the cap is enough to tell that the user is oversized
+        likes = await get_likes_collection().find(
+            {"user_id": user_id, "target_type": target_type},
+            {"_id": 0, "target_id": 1}
+        ).limit(liked_cache.max_items + 1).to_list(length=None)
+        liked_ids = buffered.union(like["target_id"] for like in likes)
+        return liked_ids if liked_cache.put(user_id, target_type, liked_ids, generation) else None
+    finally:
+        liked_cache.end_load(user_id, target_type)
+
+def build_properties_near_pipeline(
+    user: User,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    with_liked: bool = True,
+    at_distance: Optional[float] = None
+) -> List[dict]:
+    """Build the $geoNear pipeline for properties around a user.
+
+    Results are ordered by (distance, id). When a cursor is given, the search
+    resumes from its distance with a minDistance bound instead of skipping the
+    earlier pages. $geoNear yields results by distance, so the limit comes
+    right after it and a page reads about `limit` documents; only the page
+    itself is sorted to order ties by id. With `at_distance`, only the results
+    at exactly that distance are returned. With `with_liked`, each result also
+    gets `is_liked`.
+    """
+    search_radius_meters = user.search_radius * 1000  # Convert km to meters
+    
+    geo_near = {
+        "near": {
+            "type": "Point",
+            "coordinates": user.location.coordinates
+        },
+        # Named so the stage still plans while a second 2dsphere index exists
+        "key": "location",
+        "distanceField": "distance",
+        "maxDistance": search_radius_meters,
+        "query": {
+            "is_active": True,
+            "price": {
+                "$gte": user.price_range_min,
+                "$lte": user.price_range_max
+            }
+        },
+        "spherical": True
+    }
+    pipeline = [{"$geoNear": geo_near}]
+    
+    if at_distance is not None:
+        geo_near["minDistance"] = at_distance
+        geo_near["maxDistance"] = at_distance
+    
+    if cursor:
+        last_distance, last_id = decode_properties_cursor(cursor)
+        geo_near["minDistance"] = max(last_distance, geo_near.get("minDistance", 0))
+        # Only results at exactly the cursor's distance can be on an earlier page
+        pipeline.append({
+            "$match": {
+                "$or": [
+                    {"distance": {"$gt": last_distance}},
+                    {"distance": last_distance, "id": {"$gt": last_id}}
+                ]
+            }
+        })
+    
+    if limit is not None:
+        pipeline.append({"$limit": limit + 1})
+        # Ties on distance are broken by id so that the cursor is stable
+        pipeline.append({"$sort": {"distance": 1, "id": 1}})
+    
+    if with_liked:
+        pipeline.extend(build_liked_lookup_stages(user.id, "property"))
+    return pipeline
+
+async def _complete_distance_tie(
+    user: User,
+    cursor: Optional[str],
+    properties: List[dict],
+    with_liked: bool
+) -> List[dict]:
+    """Replace the results at the page's last distance with all of them, ordered by id.
+
+    A limited $geoNear returns ties on distance in no particular order, so
+    when the tie straddles the end of the page, the ones it cut off may sort
+    before those it kept. Reads only the results at that one distance.
+    """
+    tie_distance = properties[-1]["distance"]
+    pipeline = build_properties_near_pipeline(
+        user, cursor=cursor, with_liked=with_liked, at_distance=tie_distance
+    )
+    ties = await get_properties_collection().aggregate(pipeline).to_list(length=None)
+    ties.sort(key=lambda prop: prop["id"])
+    return [prop for prop in properties if prop["distance"] < tie_distance] + ties
+
+async def _search_property_index(
+    property_index: PropertySpatialIndex,
+    user: User,
+    limit: Optional[int],
+    cursor: Optional[str]
+) -> Tuple[List[dict], Optional[str]]:
+    """Search the in-process index, then load the matching documents by id"""
+    longitude, latitude = user.location.coordinates
+    hits = property_index.search(
+        longitude,
+        latitude,
+        user.search_radius * 1000,
+        user.price_range_min,
+        user.price_range_max,
+        limit=limit + 1 if limit is not None else None,
+        after=decode_properties_cursor(cursor) if cursor else None
+    )
+    
+    next_cursor = None
+    if limit is not None and len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_properties_cursor(*hits[-1])
+    
+    if not hits:
+        return [], next_cursor
+    
+    property_ids = [property_id for _, property_id in hits]
+    properties, liked_property_ids = await asyncio.gather(
+        get_properties_collection().find({
+            "id": {"$in": property_ids},
+            "is_active": True
+        }).to_list(length=None),
+        get_liked_target_ids(user.id, "property", property_ids, warm_cache=True)
+    )
+    properties_by_id = {prop["id"]: prop for prop in properties}
+    
+    # Keep the index order; listings deactivated since the snapshot are dropped
+    return [
+        dict(
+            properties_by_id[property_id],
+            distance=distance,
+            is_liked=property_id in liked_property_ids
+        )
+        for distance, property_id in hits
+        if property_id in properties_by_id
+    ], next_cursor
+
+async def get_properties_page_service(
+    telegram_id: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> Tuple[List[PropertyResponse], Optional[str]]:
+    """Get one page of properties near user, ordered by distance.
+
+    Returns the page and the cursor of the next page (None on the last page).
+    """
+    properties_collection = get_properties_collection()
+    
+    # Get user
+    user = await get_user_by_telegram_id_service(telegram_id)
+    if not user:
+        return [], None
+    
+    property_index = get_property_index()
+    if property_index is not None:
+        properties, next_cursor = await _search_property_index(property_index, user, limit, cursor)
+    else:
+        # Liked flags come from the cache, loaded alongside the query on a miss;
+        # only users with too many likes to cache get them from the query itself
+        liked_property_ids = liked_cache.get(user.id, "property")
+        warm_cache = liked_property_ids is None and liked_cache.needs_load(user.id, "property")
+        with_liked = liked_property_ids is None and not warm_cache
+        buffered_property_ids = like_buffer.liked_ids(user.id, "property")
+        
+        # MongoDB geospatial query
+        pipeline = build_properties_near_pipeline(user, limit=limit, cursor=cursor, with_liked=with_liked)
+        query = properties_collection.aggregate(pipeline).to_list(length=None)
+        if warm_cache:
+            properties, liked_property_ids = await asyncio.gather(query, load_liked_cache(user.id, "property"))
+        else:
+            properties = await query
+        if limit is not None and len(properties) > limit and properties[limit - 1]["distance"] == properties[-1]["distance"]:
+            properties = await _complete_distance_tie(user, cursor, properties, with_liked)
+        if liked_property_ids is None and not with_liked:
+            # The load was not cached; look up just this page
+            liked_property_ids = await get_liked_target_ids(user.id, "property", [prop["id"] for prop in properties])
+        merge_liked_flags(properties, liked_property_ids, buffered_property_ids)
+        
+        next_cursor = None
+        if limit is not None and len(properties) > limit:
+            properties = properties[:limit]
+            last = properties[-1]
+            next_cursor = encode_properties_cursor(last["distance"], last["id"])
+    
+    result = [property_response_from_doc(prop, is_liked=prop["is_liked"]) for prop in properties]
+    
+    return result, next_cursor
+
 async def get_properties_near_user_service(telegram_id: int) -> List[PropertyResponse]:
     """Get properties near user based on location and search radius"""
-    users_collection = get_users_collection()
+    properties, _ = await get_properties_page_service(telegram_id)
+    return properties
+
+async def stream_properties_near_user_service(telegram_id: int) -> AsyncIterator[PropertyResponse]:
+    """Yield properties near user as they are read, STREAM_BATCH_SIZE documents at a time"""
     properties_collection = get_properties_collection()
-    likes_collection = get_likes_collection()
     
-    # Get user
     user = await get_user_by_telegram_id_service(telegram_id)
     if not user:
-        return []
+        return
     
-    # Get user's liked properties
-    user_likes = await likes_collection.find({
-        "user_id": user.id,
-        "target_type": "property"
-    }).to_list(length=None)
-    liked_property_ids = {like["target_id"] for like in user_likes}
+    liked_property_ids = liked_cache.get(user.id, "property")
+    property_index = get_property_index()
     
-    # Find properties within user's search radius
-    search_radius_meters = user.search_radius * 1000  # Convert km to meters
+    if property_index is not None:
+        longitude, latitude = user.location.coordinates
+        hits = property_index.search(
+            longitude,
+            latitude,
+            user.search_radius * 1000,
+            user.price_range_min,
+            user.price_range_max
+        )
+        for start in range(0, len(hits), STREAM_BATCH_SIZE):
+            property_ids = [property_id for _, property_id in hits[start:start + STREAM_BATCH_SIZE]]
+            properties, batch_liked_ids = await asyncio.gather(
+                properties_collection.find({
+                    "id": {"$in": property_ids},
+                    "is_active": True
+                }).to_list(length=None),
+                get_liked_target_ids(user.id, "property", property_ids)
+            )
+            properties_by_id = {prop["id"]: prop for prop in properties}
+            for property_id in property_ids:
+                if property_id in properties_by_id:
+                    yield property_response_from_doc(
+                        properties_by_id[property_id],
+                        is_liked=property_id in batch_liked_ids
+                    )
+        return
+    
+    buffered_property_ids = like_buffer.liked_ids(user.id, "property")
+    pipeline = build_properties_near_pipeline(user, with_liked=liked_property_ids is None)
+    async for prop in properties_collection.aggregate(pipeline, batchSize=STREAM_BATCH_SIZE):
+        yield property_response_from_doc(prop, is_liked=liked_flag(prop, liked_property_ids, buffered_property_ids))
+
+# Fields of a user document needed to build a UserResponse
+USER_RESPONSE_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "username": 1,
+    "first_name": 1,
+    "last_name": 1,
+    "profile_photo_url": 1,
+    "age": 1,
+    "gender": 1,
+    "about": 1,
+    "price_range_min": 1,
+    "price_range_max": 1,
+    "metro_station": 1,
+    "search_radius": 1,
+    "location.coordinates": 1,
+    "created_at": 1
+}
+
+def build_potential_matches_pipeline(user: User, with_liked: bool = True) -> List[dict]:
+    """Build the $geoNear pipeline for users whose search areas overlap with the user's.
+
+    The reciprocal check (the other user's radius reaches back to this user)
+    runs in the database, so rejected users are never sent over the wire.
+    With `with_liked`, each result also gets `is_liked`.
+    """
+    search_radius_meters = user.search_radius * 1000
     
-    # MongoDB geospatial query
     pipeline = [
         {
             "$geoNear": {
@@ -121,192 +515,331 @@ async def get_properties_near_user_service(telegram_id: int) -> List[PropertyRes
                     "type": "Point",
                     "coordinates": user.location.coordinates
                 },
+                "key": "location",
                 "distanceField": "distance",
                 "maxDistance": search_radius_meters,
+                "query": {
+                    "telegram_id": {"$ne": user.telegram_id},
+                    "is_active": True,
+                    # Price range overlap
+                    "price_range_min": {"$lte": user.price_range_max},
+                    "price_range_max": {"$gte": user.price_range_min}
+                },
                 "spherical": True
             }
         },
         {
+            # Check if the other user's search radius also includes current user
             "$match": {
-                "is_active": True,
-                "price": {
-                    "$gte": user.price_range_min,
-                    "$lte": user.price_range_max
+                "$expr": {
+                    "$lte": ["$distance", {"$multiply": ["$search_radius", 1000]}]
                 }
             }
-        }
+        },
+        {"$project": USER_RESPONSE_PROJECTION}
     ]
-    
-    properties = await properties_collection.aggregate(pipeline).to_list(length=None)
-    
-    result = []
-    for prop in properties:
-        property_response = PropertyResponse(
-            id=prop["id"],
-            title=prop["title"],
-            description=prop["description"],
-            price=prop["price"],
-            address=prop["address"],
-            metro_station=prop["metro_station"],
-            latitude=prop["location"]["coordinates"][1],
-            longitude=prop["location"]["coordinates"][0],
-            rooms=prop["rooms"],
-            area=prop["area"],
-            floor=prop["floor"],
-            total_floors=prop["total_floors"],
-            property_type=prop["property_type"],
-            photos=prop.get("photos", []),
-            amenities=prop.get("amenities", []),
-            created_at=prop["created_at"],
-            is_liked=prop["id"] in liked_property_ids
-        )
-        result.append(property_response)
-    
-    return result
+    if with_liked:
+        pipeline.extend(build_liked_lookup_stages(user.id, "user"))
+    return pipeline
 
 async def get_potential_matches_service(telegram_id: int) -> List[UserResponse]:
     """Get potential matches for user (users with overlapping search areas)"""
     users_collection = get_users_collection()
-    likes_collection = get_likes_collection()
     
     # Get current user
     user = await get_user_by_telegram_id_service(telegram_id)
     if not user:
         return []
     
-    # Get user's likes
-    user_likes = await likes_collection.find({
-        "user_id": user.id,
-        "target_type": "user"
-    }).to_list(length=None)
-    liked_user_ids = {like["target_id"] for like in user_likes}
+    # Liked flags come from the cache, loaded alongside the query on a miss;
+    # only users with too many likes to cache get them from the query itself
+    liked_user_ids = liked_cache.get(user.id, "user")
+    warm_cache = liked_user_ids is None and liked_cache.needs_load(user.id, "user")
+    with_liked = liked_user_ids is None and not warm_cache
+    buffered_user_ids = like_buffer.liked_ids(user.id, "user")
     
     # Find users within search radius who also have overlapping search areas
-    search_radius_meters = user.search_radius * 1000
+    pipeline = build_potential_matches_pipeline(user, with_liked=with_liked)
+    query = users_collection.aggregate(pipeline).to_list(length=None)
+    if warm_cache:
+        potential_matches, liked_user_ids = await asyncio.gather(query, load_liked_cache(user.id, "user"))
+    else:
+        potential_matches = await query
+    if liked_user_ids is None and not with_liked:
+        # The load was not cached; look up just these users
+        liked_user_ids = await get_liked_target_ids(user.id, "user", [match_user["id"] for match_user in potential_matches])
+    merge_liked_flags(potential_matches, liked_user_ids, buffered_user_ids)
     
-    pipeline = [
-        {
-            "$geoNear": {
-                "near": {
-                    "type": "Point",
-                    "coordinates": user.location.coordinates
-                },
-                "distanceField": "distance",
-                "maxDistance": search_radius_meters,
-                "spherical": True
-            }
-        },
-        {
-            "$match": {
-                "telegram_id": {"$ne": user.telegram_id},
-                "is_active": True,
-                # Price range overlap
-                "$or": [
-                    {
-                        "price_range_min": {"$lte": user.price_range_max},
-                        "price_range_max": {"$gte": user.price_range_min}
-                    }
-                ]
-            }
-        }
+    result = [
+        user_response_from_doc(match_user, is_liked=match_user["is_liked"])
+        for match_user in potential_matches
     ]
     
-    potential_matches = await users_collection.aggregate(pipeline).to_list(length=None)
-    
-    result = []
-    for match_user in potential_matches:
-        # Check if the other user's search radius also includes current user
-        other_user_radius = match_user["search_radius"] * 1000
-        if match_user.get("distance", 0) <= other_user_radius:
-            user_response = UserResponse(
-                id=match_user["id"],
-                username=match_user.get("username"),
-                first_name=match_user["first_name"],
-                last_name=match_user.get("last_name"),
-                profile_photo_url=match_user.get("profile_photo_url"),
-                age=match_user["age"],
-                gender=match_user.get("gender"),
-                about=match_user.get("about"),
-                price_range_min=match_user["price_range_min"],
-                price_range_max=match_user["price_range_max"],
-                metro_station=match_user["metro_station"],
-                search_radius=match_user["search_radius"],
-                latitude=match_user["location"]["coordinates"][1],
-                longitude=match_user["location"]["coordinates"][0],
-                created_at=match_user["created_at"],
-                is_liked=match_user["id"] in liked_user_ids
-            )
-            result.append(user_response)
-    
     return result
 
+async def stream_potential_matches_service(telegram_id: int) -> AsyncIterator[UserResponse]:
+    """Yield potential matches as they are read, STREAM_BATCH_SIZE documents at a time"""
+    user = await get_user_by_telegram_id_service(telegram_id)
+    if not user:
+        return
+    
+    liked_user_ids = liked_cache.get(user.id, "user")
+    buffered_user_ids = like_buffer.liked_ids(user.id, "user")
+    pipeline = build_potential_matches_pipeline(user, with_liked=liked_user_ids is None)
+    async for match_user in get_users_collection().aggregate(pipeline, batchSize=STREAM_BATCH_SIZE):
+        yield user_response_from_doc(match_user, is_liked=liked_flag(match_user, liked_user_ids, buffered_user_ids))
+
+async def _like_exists(user_id: str, target_id: str, target_type: str) -> bool:
+    """Whether the like is stored, from the liked cache when the user's set is cached"""
+    cached = liked_cache.get(user_id, target_type)
+    if cached is not None:
+        return target_id in cached
+    like = await get_likes_collection().find_one(
+        {"user_id": user_id, "target_id": target_id, "target_type": target_type},
+        {"_id": 1}
+    )
+    return like is not None
+
 async def create_like_service(user_id: str, target_id: str, target_type: str) -> Like:
-    """Create a like"""
+    """Create a like.
+
+    The like is upserted against the unique (user_id, target_id, target_type)
+    index, so the duplicate check and the insert are one atomic round trip.
+    With the write-behind buffer enabled, the like is acknowledged once it is
+    buffered; the duplicate check is then a read of the liked cache or the
+    likes index.
+    """
     likes_collection = get_likes_collection()
     
-    # Check if like already exists
-    existing_like = await likes_collection.find_one({
-        "user_id": user_id,
-        "target_id": target_id,
-        "target_type": target_type
-    })
-    
-    if existing_like:
-        raise ValueError("Like already exists")
-    
     like = Like(
         user_id=user_id,
         target_id=target_id,
         target_type=target_type
     )
     
-    await likes_collection.insert_one(like.model_dump())
+    if like_buffer.enabled:
+        if like_buffer.contains(user_id, target_id, target_type) or await _like_exists(user_id, target_id, target_type):
+            raise ValueError("Like already exists")
+        if not await like_buffer.add(like):
+            # A concurrent request buffered the same like first
+            raise ValueError("Like already exists")
+        liked_cache.add(user_id, target_type, target_id)
+        return like
+    
+    try:
+        result = await likes_collection.update_one(
+            {"user_id": user_id, "target_id": target_id, "target_type": target_type},
+            {"$setOnInsert": like.model_dump()},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # A concurrent request inserted the same like first
+        raise ValueError("Like already exists")
+    
+    if result.upserted_id is None:
+        raise ValueError("Like already exists")
+    
+    liked_cache.add(user_id, target_type, target_id)
     return like
 
+def canonical_user_pair(user1_id: str, user2_id: str) -> Tuple[str, str]:
+    """Order a pair of user ids the way matches are stored"""
+    return (user1_id, user2_id) if user1_id <= user2_id else (user2_id, user1_id)
+
 async def check_match_service(user1_id: str, user2_id: str) -> Optional[Match]:
-    """Check if there's a mutual like and create match"""
+    """Check if there's a mutual like and create match.
+
+    Called right after user1 liked user2, so only the reciprocal like needs
+    checking. Matches are stored with the user ids in canonical order under
+    a unique index, so two users liking each other at the same moment still
+    get a single match.
+    """
     likes_collection = get_likes_collection()
     matches_collection = get_matches_collection()
     
-    # Check if both users liked each other
-    like1 = await likes_collection.find_one({
-        "user_id": user1_id,
-        "target_id": user2_id,
-        "target_type": "user"
-    })
+    # Check if user2 liked user1, among likes not yet flushed or in one indexed read
+    if not like_buffer.contains(user2_id, user1_id, "user") and not await likes_collection.find_one(
+        {"user_id": user2_id, "target_id": user1_id, "target_type": "user"},
+        {"_id": 1}
+    ):
+        return None
+    
+    first_id, second_id = canonical_user_pair(user1_id, user2_id)
+    match = Match(user1_id=first_id, user2_id=second_id)
+    try:
+        match_data = await matches_collection.find_one_and_update(
+            {"user1_id": first_id, "user2_id": second_id},
+            {"$setOnInsert": match.model_dump()},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Lost the race against the other user's like; read the winner's match
+        match_data = await matches_collection.find_one({"user1_id": first_id, "user2_id": second_id})
+    
+    if match_data["id"] == match.id:
+        # This call created the match; the bot tells both users
+        await enqueue_match_notification(match.id, first_id, second_id)
+    return Match(**match_data)
+
+async def _upsert_matches(pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+    """Create the matches of canonical user pairs in one bulk upsert.
+
+    Returns the stored match id of each pair, including matches created
+    earlier or concurrently elsewhere. Only the matches this call created
+    are queued for the bot to announce.
+    """
+    matches_collection = get_matches_collection()
+    matches = {pair: Match(user1_id=pair[0], user2_id=pair[1]) for pair in pairs}
+    if not matches:
+        return {}
+    match_requests = [
+        UpdateOne(
+            {"user1_id": match.user1_id, "user2_id": match.user2_id},
+            {"$setOnInsert": match.model_dump()},
+            upsert=True
+        )
+        for match in matches.values()
+    ]
+    try:
+        await matches_collection.bulk_write(match_requests, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+    
+    # Read back the match ids, including matches created concurrently elsewhere
+    stored = await matches_collection.find(
+        {"$or": [{"user1_id": match.user1_id, "user2_id": match.user2_id} for match in matches.values()]},
+        {"_id": 0, "id": 1, "user1_id": 1, "user2_id": 1}
+    ).to_list(length=None)
+    stored_ids = {(match["user1_id"], match["user2_id"]): match["id"] for match in stored}
+    
+    # Matches whose stored id is ours were created here; the bot tells both users
+    await asyncio.gather(*(
+        enqueue_match_notification(match.id, match.user1_id, match.user2_id)
+        for pair, match in matches.items()
+        if stored_ids.get(pair) == match.id
+    ))
+    return stored_ids
+
+async def match_written_likes_service(likes: List[Like]):
+    """Create the matches completed by user likes the write-behind buffer just wrote.
+
+    The request that buffered a like only checked its own worker's buffer and
+    the database, so it misses the reciprocal like when that one is buffered
+    by another worker or written after the check. Once both likes are written,
+    the later of the two flushes finds the pair here.
+    """
+    user_likes = [like for like in likes if like.target_type == "user"]
+    if not user_likes:
+        return
+    reciprocal = await get_likes_collection().find(
+        {"$or": [
+            {"user_id": like.target_id, "target_id": like.user_id, "target_type": "user"}
+            for like in user_likes
+        ]},
+        {"_id": 0, "user_id": 1, "target_id": 1}
+    ).to_list(length=None)
+    await _upsert_matches({canonical_user_pair(like["user_id"], like["target_id"]) for like in reciprocal})
+
+async def create_likes_batch_service(user_id: str, items: List[LikeBatchItem]) -> LikeBatchResponse:
+    """Create many likes at once and detect the matches they complete.
+
+    Likes are written with one unordered bulk upsert, reciprocal likes for all
+    new user likes are found with one query, and the resulting matches are
+    upserted in one more bulk write.
+    """
+    likes_collection = get_likes_collection()
+    
+    results = [
+        LikeBatchItemResult(
+            target_id=item.target_id,
+            target_type=item.target_type,
+            status="created" if item.target_type in LIKE_TARGET_TYPES else "invalid"
+        )
+        for item in items
+    ]
+    
+    # Write each distinct like once; repeats in the batch share its result
+    pending = {}
+    for result in results:
+        if result.status == "invalid":
+            continue
+        key = (result.target_id, result.target_type)
+        if like_buffer.contains(user_id, *key):
+            # Acknowledged by create_like_service and waiting to be flushed
+            result.status = "exists"
+            continue
+        pending.setdefault(key, []).append(result)
+    if not pending:
+        return LikeBatchResponse(results=results)
+    
+    likes = [Like(user_id=user_id, target_id=target_id, target_type=target_type) for target_id, target_type in pending]
+    requests = [
+        UpdateOne(
+            {"user_id": user_id, "target_id": like.target_id, "target_type": like.target_type},
+            {"$setOnInsert": like.model_dump()},
+            upsert=True
+        )
+        for like in likes
+    ]
+    try:
+        write_result = await likes_collection.bulk_write(requests, ordered=False)
+        upserted = set(write_result.upserted_ids)
+    except BulkWriteError as e:
+        # Duplicate-key errors come from concurrent requests liking the same target
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        upserted = {item["index"] for item in e.details["upserted"]}
+    
+    new_user_targets = []
+    for index, like in enumerate(likes):
+        created = index in upserted
+        for result in pending[(like.target_id, like.target_type)]:
+            result.status = "created" if created else "exists"
+            result.like_id = like.id if created else None
+        if created:
+            liked_cache.add(user_id, like.target_type, like.target_id)
+            if like.target_type == "user":
+                new_user_targets.append(like.target_id)
+    
+    if not new_user_targets:
+        return LikeBatchResponse(results=results)
     
-    like2 = await likes_collection.find_one({
-        "user_id": user2_id,
-        "target_id": user1_id,
+    # Which of the newly liked users already liked this user
+    likers = like_buffer.likers_of(new_user_targets, user_id, "user")
+    reciprocal = await likes_collection.find({
+        "user_id": {"$in": new_user_targets},
+        "target_id": user_id,
         "target_type": "user"
-    })
+    }, {"_id": 0, "user_id": 1}).to_list(length=None)
+    likers.update(like["user_id"] for like in reciprocal)
+    mutual_ids = [target_id for target_id in new_user_targets if target_id in likers]
+    if not mutual_ids:
+        return LikeBatchResponse(results=results)
     
-    if like1 and like2:
-        # Check if match already exists
-        existing_match = await matches_collection.find_one({
-            "$or": [
-                {"user1_id": user1_id, "user2_id": user2_id},
-                {"user1_id": user2_id, "user2_id": user1_id}
-            ]
-        })
-        
-        if not existing_match:
-            match = Match(
-                user1_id=user1_id,
-                user2_id=user2_id
-            )
-            await matches_collection.insert_one(match.model_dump())
-            return match
-        else:
-            return Match(**existing_match)
+    stored_ids = await _upsert_matches(canonical_user_pair(user_id, other_id) for other_id in mutual_ids)
+    match_ids = {
+        other_id: stored_ids[canonical_user_pair(user_id, other_id)]
+        for other_id in mutual_ids
+        if canonical_user_pair(user_id, other_id) in stored_ids
+    }
+    
+    for other_id in mutual_ids:
+        match_id = match_ids.get(other_id)
+        for result in pending[(other_id, "user")]:
+            result.match = match_id
+            result.is_match = match_id is not None
     
-    return None
+    return LikeBatchResponse(
+        results=results,
+        matches=[match_ids[other_id] for other_id in mutual_ids if other_id in match_ids]
+    )
 
 async def get_user_matches_service(telegram_id: int) -> List[UserResponse]:
     """Get confirmed matches for user"""
     users_collection = get_users_collection()
     matches_collection = get_matches_collection()
-    likes_collection = get_likes_collection()
     
     # Get user
     user = await get_user_by_telegram_id_service(telegram_id)
@@ -320,42 +853,31 @@ async def get_user_matches_service(telegram_id: int) -> List[UserResponse]:
             {"user2_id": user.id}
         ],
         "is_active": True
-    }).to_list(length=None)
+    }, {"user1_id": 1, "user2_id": 1}).to_list(length=None)
     
-    # Get user's likes for matched users
-    user_likes = await likes_collection.find({
-        "user_id": user.id,
-        "target_type": "user"
-    }).to_list(length=None)
-    liked_user_ids = {like["target_id"] for like in user_likes}
+    # Get the other users' IDs
+    other_user_ids = [
+        match["user2_id"] if match["user1_id"] == user.id else match["user1_id"]
+        for match in matches
+    ]
+    if not other_user_ids:
+        return []
+    
+    # Get other users' data and which of them the user liked, concurrently
+    other_users, liked_user_ids = await asyncio.gather(
+        users_collection.find(
+            {"id": {"$in": other_user_ids}},
+            USER_RESPONSE_PROJECTION
+        ).to_list(length=None),
+        get_liked_target_ids(user.id, "user", other_user_ids, warm_cache=True)
+    )
+    other_users_by_id = {other_user["id"]: other_user for other_user in other_users}
     
     result = []
-    for match in matches:
-        # Get the other user's ID
-        other_user_id = match["user2_id"] if match["user1_id"] == user.id else match["user1_id"]
-        
-        # Get other user's data
-        other_user_data = await users_collection.find_one({"id": other_user_id})
+    for other_user_id in other_user_ids:
+        other_user_data = other_users_by_id.get(other_user_id)
         if other_user_data:
-            user_response = UserResponse(
-                id=other_user_data["id"],
-                username=other_user_data.get("username"),
-                first_name=other_user_data["first_name"],
-                last_name=other_user_data.get("last_name"),
-                profile_photo_url=other_user_data.get("profile_photo_url"),
-                age=other_user_data["age"],
-                gender=other_user_data.get("gender"),
-                about=other_user_data.get("about"),
-                price_range_min=other_user_data["price_range_min"],
-                price_range_max=other_user_data["price_range_max"],
-                metro_station=other_user_data["metro_station"],
-                search_radius=other_user_data["search_radius"],
-                latitude=other_user_data["location"]["coordinates"][1],
-                longitude=other_user_data["location"]["coordinates"][0],
-                created_at=other_user_data["created_at"],
-                is_liked=other_user_data["id"] in liked_user_ids
-            )
-            result.append(user_response)
+            result.append(user_response_from_doc(other_user_data, is_liked=other_user_id in liked_user_ids))
     
     return result
 
@@ -370,12 +892,25 @@ async def get_user_liked_properties_service(telegram_id: int) -> List[PropertyRe
         return []
     
     # Get liked properties
-    likes = await likes_collection.find({
-        "user_id": user.id,
-        "target_type": "property"
-    }).to_list(length=None)
-    
-    property_ids = [like["target_id"] for like in likes]
+    liked_property_ids = liked_cache.get(user.id, "property")
+    if liked_property_ids is not None:
+        property_ids = list(liked_property_ids)
+    else:
+        fill_cache = liked_cache.needs_load(user.id, "property")
+        if fill_cache:
+            generation = liked_cache.begin_load(user.id, "property")
+        try:
+            buffered = like_buffer.liked_ids(user.id, "property")
+            likes = await likes_collection.find({
+                "user_id": user.id,
+                "target_type": "property"
+            }, {"_id": 0, "target_id": 1}).to_list(length=None)
+            property_ids = list(buffered.union(like["target_id"] for like in likes))
+            if fill_cache:
+                liked_cache.put(user.id, "property", property_ids, generation)
+        finally:
+            if fill_cache:
+                liked_cache.end_load(user.id, "property")
     
     if not property_ids:
         return []
@@ -386,27 +921,218 @@ async def get_user_liked_properties_service(telegram_id: int) -> List[PropertyRe
         "is_active": True
     }).to_list(length=None)
     
-    result = []
-    for prop in properties:
-        property_response = PropertyResponse(
-            id=prop["id"],
-            title=prop["title"],
-            description=prop["description"],
-            price=prop["price"],
-            address=prop["address"],
-            metro_station=prop["metro_station"],
-            latitude=prop["location"]["coordinates"][1],
-            longitude=prop["location"]["coordinates"][0],
-            rooms=prop["rooms"],
-            area=prop["area"],
-            floor=prop["floor"],
-            total_floors=prop["total_floors"],
-            property_type=prop["property_type"],
-            photos=prop.get("photos", []),
-            amenities=prop.get("amenities", []),
-            created_at=prop["created_at"],
-            is_liked=True
-        )
-        result.append(property_response)
+    result = [property_response_from_doc(prop, is_liked=True) for prop in properties]
+    
+    return result
+
+async def stream_user_liked_properties_service(telegram_id: int) -> AsyncIterator[PropertyResponse]:
+    """Yield properties liked by user, reading likes and properties STREAM_BATCH_SIZE at a time"""
+    properties_collection = get_properties_collection()
+    
+    user = await get_user_by_telegram_id_service(telegram_id)
+    if not user:
+        return
+    
+    async def liked_id_batches():
+        liked_property_ids = liked_cache.get(user.id, "property")
+        if liked_property_ids is not None:
+            property_ids = list(liked_property_ids)
+            for start in range(0, len(property_ids), STREAM_BATCH_SIZE):
+                yield property_ids[start:start + STREAM_BATCH_SIZE]
+            return
+        # Buffered likes not met in the database are sent at the end
+        buffered = like_buffer.liked_ids(user.id, "property")
+        batch = []
+        async for like in get_likes_collection().find(
+            {"user_id": user.id, "target_type": "property"},
+            {"_id": 0, "target_id": 1},
+            batch_size=STREAM_BATCH_SIZE
+        ):
+            buffered.discard(like["target_id"])
+            batch.append(like["target_id"])
+            if len(batch) == STREAM_BATCH_SIZE:
+                yield batch
+                batch = []
+        batch.extend(buffered)
+        for start in range(0, len(batch), STREAM_BATCH_SIZE):
+            yield batch[start:start + STREAM_BATCH_SIZE]
+    
+    async for property_ids in liked_id_batches():
+        properties = await properties_collection.find({
+            "id": {"$in": property_ids},
+            "is_active": True
+        }).to_list(length=None)
+        for prop in properties:
+            yield property_response_from_doc(prop, is_liked=True)
+
+def parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """Parse a "min_lng,min_lat,max_lng,max_lat" bounding box"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    if not (-180 <= min_lng < max_lng <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise ValueError("Invalid bbox")
+    return min_lng, min_lat, max_lng, max_lat
+
+def _bbox_polygon(min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> dict:
+    """GeoJSON polygon covering a box at most BBOX_MAX_PIECE_DEGREES wide.
+
+    Polygon edges are geodesics, which bow towards the pole between two
+    corners at the same latitude. The corners of an edge that would bow into
+    the box are moved away from it just enough for the edge to clear it.
+    """
+    cos_half_width = math.cos(math.radians(max_lng - min_lng) / 2)
+    
+    def clear_lat(lat: float) -> float:
+        return math.degrees(math.atan(math.tan(math.radians(lat)) * cos_half_width))
+    
+    south = max(clear_lat(min_lat) if min_lat > 0 else min_lat, -BBOX_MAX_POLYGON_LAT)
+    north = min(clear_lat(max_lat) if max_lat < 0 else max_lat, BBOX_MAX_POLYGON_LAT)
+    return {
+        "type": "Polygon",
+        "coordinates": [[
+            [min_lng, south],
+            [max_lng, south],
+            [max_lng, north],
+            [min_lng, north],
+            [min_lng, south]
+        ]]
+    }
+
+def bbox_filter(min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> dict:
+    """Filter for active properties inside a longitude/latitude bounding box.
+
+    $geoWithin reads a polygon larger than a hemisphere as its complement, so
+    wide boxes are split into narrower pieces. The pieces cover a little more
+    than the box; the coordinate ranges trim the matches back to it.
+    """
+    pieces = max(1, math.ceil((max_lng - min_lng) / BBOX_MAX_PIECE_DEGREES))
+    width = (max_lng - min_lng) / pieces
+    within = [
+        {"location": {"$geoWithin": {"$geometry": _bbox_polygon(
+            min_lng + i * width, min_lat, min_lng + (i + 1) * width, max_lat
+        )}}}
+        for i in range(pieces)
+    ]
+    query = within[0] if pieces == 1 else {"$or": within}
+    query.update({
+        "location.coordinates.0": {"$gte": min_lng, "$lte": max_lng},
+        "location.coordinates.1": {"$gte": min_lat, "$lte": max_lat},
+        "is_active": True
+    })
+    return query
+
+def cluster_cell_size(zoom: int) -> float:
+    """Grid cell size in degrees for a map zoom level"""
+    return 360.0 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+
+async def get_property_clusters_service(bbox: str, zoom: int) -> PropertyClustersResponse:
+    """Group active properties inside a bounding box into grid cells for a zoom level.
+
+    The grid is aligned to fixed multiples of the cell size so clusters do not
+    shift while the map pans. Cells with at most CLUSTER_POINT_THRESHOLD
+    listings are returned as individual points.
+    """
+    properties_collection = get_properties_collection()
+    min_lng, min_lat, max_lng, max_lat = parse_bbox(bbox)
+    cell_size = cluster_cell_size(zoom)
     
-    return result
\ No newline at end of file
+    pipeline = [
+        {
+            "$match": bbox_filter(min_lng, min_lat, max_lng, max_lat)
+        },
+        {
+            "$group": {
+                "_id": {
+                    "x": {"$floor": {"$divide": [{"$arrayElemAt": ["$location.coordinates", 0]}, cell_size]}},
+                    "y": {"$floor": {"$divide": [{"$arrayElemAt": ["$location.coordinates", 1]}, cell_size]}}
+                },
+                "count": {"$sum": 1},
+                "longitude": {"$avg": {"$arrayElemAt": ["$location.coordinates", 0]}},
+                "latitude": {"$avg": {"$arrayElemAt": ["$location.coordinates", 1]}},
+                "min_price": {"$min": "$price"},
+                "max_price": {"$max": "$price"},
+                "points": {
+                    "$firstN": {
+                        "input": {"id": "$id", "coordinates": "$location.coordinates", "price": "$price"},
+                        "n": CLUSTER_POINT_THRESHOLD
+                    }
+                }
+            }
+        },
+        {"$sort": {"count": -1}},
+        {"$limit": CLUSTER_MAX_CELLS}
+    ]
+    
+    cells = await properties_collection.aggregate(pipeline).to_list(length=None)
+    
+    clusters = []
+    points = []
+    for cell in cells:
+        if cell["count"] <= CLUSTER_POINT_THRESHOLD:
+            for point in cell["points"]:
+                points.append(PropertyPoint(
+                    id=point["id"],
+                    latitude=point["coordinates"][1],
+                    longitude=point["coordinates"][0],
+                    price=point["price"]
+                ))
+        else:
+            clusters.append(PropertyCluster(
+                latitude=cell["latitude"],
+                longitude=cell["longitude"],
+                count=cell["count"],
+                min_price=cell["min_price"],
+                max_price=cell["max_price"]
+            ))
+    
+    return PropertyClustersResponse(zoom=zoom, cell_size=cell_size, clusters=clusters, points=points)
+
+_properties_version = (0, 0.0)  # (version, monotonic time it was read)
+
+async def get_properties_version() -> int:
+    """Current version of the property data, re-read at most every few seconds"""
+    global _properties_version
+    version, read_at = _properties_version
+    now = time.monotonic()
+    if read_at and now - read_at < PROPERTIES_VERSION_TTL_SECONDS:
+        return version
+    meta = await get_meta_collection().find_one({"_id": "properties"})
+    version = meta["version"] if meta else 0
+    _properties_version = (version, now)
+    return version
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(min_lng, min_lat, max_lng, max_lat) of a slippy-map tile"""
+    if not (TILE_MIN_ZOOM <= z <= TILE_MAX_ZOOM):
+        raise ValueError(f"Tile zoom must be between {TILE_MIN_ZOOM} and {TILE_MAX_ZOOM}")
+    tiles = 2 ** z
+    if not (0 <= x < tiles and 0 <= y < tiles):
+        raise ValueError("Tile coordinates out of range")
+    
+    def tile_lat(tile_y: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / tiles))))
+    
+    return x / tiles * 360.0 - 180.0, tile_lat(y + 1), (x + 1) / tiles * 360.0 - 180.0, tile_lat(y)
+
+async def get_properties_in_tile_service(z: int, x: int, y: int) -> List[PropertyListing]:
+    """Get active properties inside a map tile, the same for every user"""
+    properties_collection = get_properties_collection()
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(z, x, y)
+    
+    properties = await properties_collection.find(bbox_filter(min_lng, min_lat, max_lng, max_lat)).limit(TILE_MAX_PROPERTIES).to_list(length=None)
+    
+    result = [property_listing_from_doc(prop) for prop in properties]
+    
+    return result
+
+async def get_liked_ids_service(telegram_id: int, target_type: str, target_ids: List[str]) -> List[str]:
+    """Get which of the given targets the user has liked, to overlay on shared data"""
+    if target_type not in LIKE_TARGET_TYPES:
+        raise ValueError(f"target_type must be one of: {', '.join(LIKE_TARGET_TYPES)}")
+    user = await get_user_by_telegram_id_service(telegram_id)
+    if not user:
+        return []
+    liked_ids = await get_liked_target_ids(user.id, target_type, target_ids)
+    return [target_id for target_id in target_ids if target_id in liked_ids]
@@ -0,0 +1,249 @@
+"""Recorder for slow MongoDB commands.
+
+Commands slower than SLOW_QUERY_THRESHOLD_MS are kept in a ring buffer with
+their shape: the command with every literal replaced by "?", so queries that
+differ only in their values (and no user data) look the same. A sample of
+them is explained in the background with the queryPlanner verbosity, which
+plans the query without running it again, so missing indexes show up as
+COLLSCAN stages in the winning plan.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from metrics import command_collection
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "200"))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0.1"))
+# A shape explained within this window is not explained again
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS", "300"))
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Session, cluster and write-concern fields that are not part of the query
+IGNORED_FIELDS = {
+    "$db", "lsid", "$clusterTime", "$readPreference", "txnNumber", "autocommit",
+    "startTransaction", "readConcern", "writeConcern", "ordered", "bypassDocumentValidation"
+}
+# Statement lists of bulk writes; one statement is enough to explain
+STATEMENT_FIELDS = {"update": "updates", "delete": "deletes"}
+MAX_PENDING_EXPLAINS = 100
+
+def normalize_shape(value: Any) -> Any:
+    """Replace literals with "?", keeping field names, operators and pipeline stages"""
+    if isinstance(value, dict):
+        return {key: normalize_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if all(not isinstance(item, (dict, list)) for item in value):
+            return ["?"] if value else []
+        shapes = []
+        for item in value:
+            shape = normalize_shape(item)
+            if not shapes or shapes[-1] != shape:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+def _explainable(command_name: str, command: dict) -> dict:
+    explainable = {key: value for key, value in command.items() if key not in IGNORED_FIELDS}
+    statements_field = STATEMENT_FIELDS.get(command_name)
+    if statements_field and explainable.get(statements_field):
+        explainable[statements_field] = explainable[statements_field][:1]
+    return explainable
+
+def _find_key(value: Any, key: str) -> Optional[Any]:
+    if isinstance(value, dict):
+        if key in value:
+            return value[key]
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            found = _find_key(item, key)
+            if found is not None:
+                return found
+    return None
+
+PLAN_CHILD_FIELDS = ("inputStage", "outerStage", "innerStage")
+
+def _compact_plan(node: dict, stages: List[str], indexes: List[str]) -> dict:
+    """Plan tree without filters and index bounds, which carry query literals"""
+    compact = {"stage": node.get("stage")}
+    stages.append(node.get("stage"))
+    if "indexName" in node:
+        compact["index"] = node["indexName"]
+        compact["key_pattern"] = node.get("keyPattern")
+        indexes.append(node["indexName"])
+    children = [node[field] for field in PLAN_CHILD_FIELDS if field in node]
+    children.extend(node.get("inputStages", []))
+    if children:
+        compact["inputs"] = [_compact_plan(child, stages, indexes) for child in children]
+    return compact
+
+def summarize_plan(explain: dict) -> Dict[str, Any]:
+    """Stages and indexes of the winning plan, wherever the server nests it"""
+    query_planner = _find_key(explain, "queryPlanner") or {}
+    winning_plan = query_planner.get("winningPlan") or {}
+    # Slot-based execution wraps the classic plan tree in queryPlan
+    plan = winning_plan.get("queryPlan", winning_plan)
+
+    stages: List[str] = []
+    indexes: List[str] = []
+    compact = _compact_plan(plan, stages, indexes) if plan else None
+    return {
+        "collscan": "COLLSCAN" in stages,
+        "stages": stages,
+        "indexes": indexes,
+        "winning_plan": compact
+    }
+
+class SlowQueryRecorder(monitoring.CommandListener):
+    """CommandListener that records slow commands and explains a sample of them.
+
+    Listener callbacks run on pymongo's threads, so explains are handed to an
+    asyncio task on the event loop the client was attached from.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+        buffer_size: int = SLOW_QUERY_BUFFER_SIZE,
+        explain_sample_rate: float = SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self._records: "deque[Dict[str, Any]]" = deque(maxlen=buffer_size)
+        self._pending: Dict[Tuple[object, int], Tuple[str, dict]] = {}
+        self._explained_at: Dict[str, float] = {}
+        self._sequence = 0
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.explained = 0
+
+    def attach(self, client):
+        """Start explaining sampled records through `client` (a Motor client)"""
+        self._client = client
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=MAX_PENDING_EXPLAINS)
+        self._worker = asyncio.create_task(self._explain_worker())
+
+    async def detach(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._client = None
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        self._pending[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, "error")
+
+    def _finish(self, event, status: str):
+        database_name, command = self._pending.pop((event.connection_id, event.request_id), (None, None))
+        duration_ms = event.duration_micros / 1000
+        if command is None or duration_ms < self.threshold_ms:
+            return
+
+        command_name = event.command_name
+        shape = normalize_shape({
+            key: value for key, value in command.items()
+            if key not in IGNORED_FIELDS and key != command_name
+        })
+        self._sequence += 1
+        record = {
+            "id": self._sequence,
+            "at": datetime.utcnow().isoformat(),
+            "database": database_name,
+            "collection": command_collection(command_name, command),
+            "command": command_name,
+            "duration_ms": round(duration_ms, 3),
+            "status": status,
+            "shape": shape,
+            "explain": None
+        }
+        self._records.append(record)
+        self.recorded += 1
+        logger.warning(
+            "Slow MongoDB %s on %s.%s took %.1f ms: %s",
+            command_name, database_name, record["collection"], duration_ms, json.dumps(shape)
+        )
+
+        loop = self._loop
+        if loop is not None and command_name in EXPLAINABLE_COMMANDS and self._should_explain(shape):
+            explainable = _explainable(command_name, command)
+            loop.call_soon_threadsafe(self._enqueue, (record, database_name, explainable))
+
+    def _should_explain(self, shape: Any) -> bool:
+        if random.random() >= self.explain_sample_rate:
+            return False
+        key = json.dumps(shape, sort_keys=True)
+        now = time.monotonic()
+        explained_at = self._explained_at.get(key)
+        if explained_at is not None and now - explained_at < SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS:
+            return False
+        if len(self._explained_at) >= SLOW_QUERY_BUFFER_SIZE:
+            self._explained_at.clear()
+        self._explained_at[key] = now
+        return True
+
+    def _enqueue(self, item):
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            pass
+
+    async def _explain_worker(self):
+        while True:
+            record, database_name, command = await self._queue.get()
+            try:
+                explain = await self._client[database_name].command(
+                    {"explain": command, "verbosity": "queryPlanner"}
+                )
+                record["explain"] = summarize_plan(explain)
+                self.explained += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                record["explain"] = {"error": str(e)}
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        """Most recent records first"""
+        return list(self._records)[::-1][:limit]
+
+    def clear(self):
+        self._records.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "explain_sample_rate": self.explain_sample_rate,
+            "buffered": len(self._records),
+            "recorded": self.recorded,
+            "explained": self.explained
+        }
+
+slow_query_recorder = SlowQueryRecorder()
@@ -0,0 +1,333 @@
+"""In-process spatial index for property search.
+
+Holds an array-backed snapshot of active properties (coordinates, price and
+integer-interned ids) bucketed into a uniform lat/lng grid, and answers
+radius + price queries with vectorized distance math. The snapshot is kept
+fresh from a MongoDB change stream when the deployment supports it, and by
+periodic reloads otherwise. Requires NumPy; without it the services keep
+using the MongoDB $geoNear path.
+"""
+import asyncio
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+SPATIAL_INDEX_ENABLED = os.getenv("SPATIAL_INDEX_ENABLED", "false").lower() == "true"
+SPATIAL_INDEX_CELL_DEGREES = float(os.getenv("SPATIAL_INDEX_CELL_DEGREES", "0.01"))
+SPATIAL_INDEX_RELOAD_SECONDS = float(os.getenv("SPATIAL_INDEX_RELOAD_SECONDS", "60"))
+
+# Same Earth radius as MongoDB uses for spherical distances, so distances
+# (and therefore pagination cursors) agree with the $geoNear path
+EARTH_RADIUS_METERS = 6378100.0
+
+# Fraction of the snapshot that may sit outside the grid before it is rebuilt
+PENDING_REBUILD_RATIO = 0.05
+PENDING_REBUILD_MIN = 1024
+
+# Server error code for $changeStream on a standalone mongod
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+SNAPSHOT_PROJECTION = {"_id": 0, "id": 1, "location.coordinates": 1, "price": 1, "is_active": 1}
+
+class PropertySpatialIndex:
+    """Grid-bucketed snapshot of active properties"""
+
+    def __init__(self, cell_degrees: float = SPATIAL_INDEX_CELL_DEGREES):
+        if np is None:
+            raise RuntimeError("NumPy is required for the in-process spatial index")
+        self.cell_degrees = cell_degrees
+        self._reset(0)
+
+    def _reset(self, capacity: int):
+        self._ids: List[str] = []
+        self._slots: Dict[str, int] = {}
+        self._lng = np.empty(capacity, dtype=np.float64)
+        self._lat = np.empty(capacity, dtype=np.float64)
+        self._price = np.empty(capacity, dtype=np.int64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._size = 0
+        # Grid over slots [0, self._indexed); later slots are scanned linearly
+        self._indexed = 0
+        self._order = np.empty(0, dtype=np.int64)
+        self._cell_starts = np.zeros(1, dtype=np.int64)
+        self._lat0 = 0.0
+        self._lng0 = 0.0
+        self._rows = 0
+        self._cols = 0
+
+    def __len__(self) -> int:
+        return int(self._active[:self._size].sum())
+
+    def _grow(self, capacity: int):
+        if capacity <= len(self._lng):
+            return
+        capacity = max(capacity, 2 * len(self._lng), 1024)
+        for name in ("_lng", "_lat", "_price", "_active"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _append(self, property_id: str, lng: float, lat: float, price: int) -> int:
+        self._grow(self._size + 1)
+        slot = self._size
+        self._lng[slot] = lng
+        self._lat[slot] = lat
+        self._price[slot] = price
+        self._active[slot] = True
+        self._ids.append(property_id)
+        self._slots[property_id] = slot
+        self._size += 1
+        return slot
+
+    def load(self, docs: List[dict]):
+        """Replace the snapshot with the given property documents"""
+        self._reset(len(docs))
+        for doc in docs:
+            if doc.get("is_active", True):
+                lng, lat = doc["location"]["coordinates"]
+                self._append(doc["id"], lng, lat, doc["price"])
+        self.rebuild()
+
+    def rebuild(self):
+        """Drop inactive slots and re-bucket every property into the grid"""
+        live = np.nonzero(self._active[:self._size])[0]
+        ids = [self._ids[slot] for slot in live]
+        lng = self._lng[live]
+        lat = self._lat[live]
+        price = self._price[live]
+
+        self._ids = ids
+        self._slots = {property_id: slot for slot, property_id in enumerate(ids)}
+        self._lng, self._lat, self._price = lng, lat, price
+        self._active = np.ones(len(ids), dtype=bool)
+        self._size = self._indexed = len(ids)
+
+        if not ids:
+            self._order = np.empty(0, dtype=np.int64)
+            self._cell_starts = np.zeros(1, dtype=np.int64)
+            self._rows = self._cols = 0
+            return
+
+        self._lat0 = float(lat.min())
+        self._lng0 = float(lng.min())
+        self._rows = int((lat.max() - self._lat0) // self.cell_degrees) + 1
+        self._cols = int((lng.max() - self._lng0) // self.cell_degrees) + 1
+        cells = self._cells(lat, lng)
+        self._order = np.argsort(cells, kind="stable")
+        counts = np.bincount(cells, minlength=self._rows * self._cols)
+        self._cell_starts = np.concatenate(([0], np.cumsum(counts)))
+
+    def _cells(self, lat, lng):
+        rows = ((lat - self._lat0) // self.cell_degrees).astype(np.int64)
+        cols = ((lng - self._lng0) // self.cell_degrees).astype(np.int64)
+        return rows * self._cols + cols
+
+    def upsert(self, doc: dict):
+        """Apply an inserted or updated property document"""
+        property_id = doc["id"]
+        slot = self._slots.get(property_id)
+        lng, lat = doc["location"]["coordinates"]
+        active = doc.get("is_active", True)
+
+        if slot is not None and self._lng[slot] == lng and self._lat[slot] == lat:
+            self._price[slot] = doc["price"]
+            self._active[slot] = active
+            return
+
+        if slot is not None:
+            # Moved: retire the old grid slot and append a fresh one
+            self._active[slot] = False
+            del self._slots[property_id]
+        if active:
+            self._append(property_id, lng, lat, doc["price"])
+        self._maybe_rebuild()
+
+    def remove(self, property_id: str):
+        """Drop a property from the snapshot"""
+        slot = self._slots.pop(property_id, None)
+        if slot is not None:
+            self._active[slot] = False
+            self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        pending = self._size - self._indexed
+        retired = self._size - len(self._slots)
+        threshold = max(PENDING_REBUILD_MIN, int(self._size * PENDING_REBUILD_RATIO))
+        if pending > threshold or retired > threshold:
+            self.rebuild()
+
+    def _candidates(self, lng: float, lat: float, radius_meters: float):
+        """Slots in grid cells overlapping the bounding box of the search circle"""
+        parts = []
+        if self._indexed:
+            dlat = math.degrees(radius_meters / EARTH_RADIUS_METERS)
+            cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+            dlng = min(dlat / cos_lat, 180.0)
+            row0 = max(int((lat - dlat - self._lat0) // self.cell_degrees), 0)
+            row1 = min(int((lat + dlat - self._lat0) // self.cell_degrees), self._rows - 1)
+            col0 = max(int((lng - dlng - self._lng0) // self.cell_degrees), 0)
+            col1 = min(int((lng + dlng - self._lng0) // self.cell_degrees), self._cols - 1)
+            if row0 <= row1 and col0 <= col1:
+                for row in range(row0, row1 + 1):
+                    # Cells of one row are contiguous in the sorted order
+                    start = self._cell_starts[row * self._cols + col0]
+                    end = self._cell_starts[row * self._cols + col1 + 1]
+                    if end > start:
+                        parts.append(self._order[start:end])
+        if self._size > self._indexed:
+            parts.append(np.arange(self._indexed, self._size, dtype=np.int64))
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(parts)
+
+    def _search_disk(self, lng, lat, radius_meters, price_min, price_max, after):
+        slots = self._candidates(lng, lat, radius_meters)
+        slots = slots[
+            self._active[slots]
+            & (self._price[slots] >= price_min)
+            & (self._price[slots] <= price_max)
+        ]
+
+        # Haversine distance
+        lat1 = math.radians(lat)
+        lat2 = np.radians(self._lat[slots])
+        dlat = lat2 - lat1
+        dlng = np.radians(self._lng[slots] - lng)
+        a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+        distances = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        keep = distances <= radius_meters
+        if after is not None:
+            last_distance, last_id = after
+            keep &= distances >= last_distance
+            for position in np.nonzero(keep & (distances == last_distance))[0]:
+                if self._ids[slots[position]] <= last_id:
+                    keep[position] = False
+        return slots[keep], distances[keep]
+
+    def search(
+        self,
+        lng: float,
+        lat: float,
+        radius_meters: float,
+        price_min: int,
+        price_max: int,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[float, str]] = None
+    ) -> List[Tuple[float, str]]:
+        """Find active properties within a radius and price range.
+
+        Returns (distance in meters, property id) pairs ordered by distance,
+        then id. `after` resumes from the keyset position of a previous page.
+        With a limit, the search starts one grid cell out and doubles the
+        radius until enough properties are found, so a page only touches the
+        cells around it.
+        """
+        if limit is None:
+            slots, distances = self._search_disk(lng, lat, radius_meters, price_min, price_max, after)
+            order = np.argsort(distances, kind="stable")
+            return list(zip(distances[order].tolist(), [self._ids[slot] for slot in slots[order].tolist()]))
+
+        start = after[0] if after is not None else 0.0
+        step = math.radians(self.cell_degrees) * EARTH_RADIUS_METERS
+        while True:
+            ring_radius = min(start + step, radius_meters)
+            slots, distances = self._search_disk(lng, lat, ring_radius, price_min, price_max, after)
+            if len(slots) >= limit or ring_radius >= radius_meters:
+                break
+            step *= 2
+
+        if len(slots) > limit:
+            # Partition on the limit-th distance, keeping every tie with it
+            bound = np.partition(distances, limit - 1)[limit - 1]
+            nearest = distances <= bound
+            slots = slots[nearest]
+            distances = distances[nearest]
+
+        hits = sorted(zip(distances.tolist(), [self._ids[slot] for slot in slots.tolist()]))
+        return hits[:limit]
+
+property_index: Optional[PropertySpatialIndex] = None
+_property_index_ready = False
+_refresh_task: Optional[asyncio.Task] = None
+
+def get_property_index() -> Optional[PropertySpatialIndex]:
+    """Return the in-process property index, or None when searches should use MongoDB"""
+    if property_index is not None and _property_index_ready:
+        return property_index
+    return None
+
+async def _reload(collection):
+    global _property_index_ready
+    docs = await collection.find({"is_active": True}, SNAPSHOT_PROJECTION).to_list(length=None)
+    property_index.load(docs)
+    _property_index_ready = True
+    logger.info("Property index loaded %d listings", len(property_index))
+
+async def _follow_changes(collection):
+    """Keep the snapshot current from a change stream, or by polling without one"""
+    global _property_index_ready
+    while True:
+        try:
+            async with collection.watch(full_document="updateLookup") as stream:
+                # Reload once the stream is open so no change is missed
+                await _reload(collection)
+                async for change in stream:
+                    operation = change["operationType"]
+                    if operation in ("insert", "update", "replace") and change.get("fullDocument"):
+                        property_index.upsert(change["fullDocument"])
+                    elif operation == "delete":
+                        # Delete events carry only _id; resync the snapshot
+                        await _reload(collection)
+                    elif operation in ("drop", "invalidate"):
+                        break
+        except PyMongoError as e:
+            if not (isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_UNSUPPORTED):
+                # Serve from MongoDB until the next reload succeeds
+                _property_index_ready = False
+                logger.warning("Property index change stream failed: %s", e)
+                await asyncio.sleep(SPATIAL_INDEX_RELOAD_SECONDS)
+                continue
+            logger.info("Change streams unavailable; reloading property index every %ss", SPATIAL_INDEX_RELOAD_SECONDS)
+            while True:
+                try:
+                    await _reload(collection)
+                except PyMongoError as reload_error:
+                    _property_index_ready = False
+                    logger.warning("Property index reload failed: %s", reload_error)
+                await asyncio.sleep(SPATIAL_INDEX_RELOAD_SECONDS)
+
+async def start_property_index(collection):
+    """Build the property index and keep it refreshed in the background"""
+    global property_index, _refresh_task
+    if not SPATIAL_INDEX_ENABLED:
+        return
+    if np is None:
+        logger.warning("SPATIAL_INDEX_ENABLED is set but NumPy is not installed; using MongoDB for property search")
+        return
+    property_index = PropertySpatialIndex()
+    _refresh_task = asyncio.create_task(_follow_changes(collection))
+
+async def stop_property_index():
+    """Stop refreshing the property index and fall back to MongoDB"""
+    global property_index, _property_index_ready, _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
+    property_index = None
+    _property_index_ready = False
@@ -1,11 +1,21 @@
 import asyncio
+import html
 import logging
 import os
+import signal
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import CommandStart
 from aiogram.types import WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton
+from aiohttp import web
 from dotenv import load_dotenv
 
+import database
+from database import close_mongo_connection, connect_to_mongo
+from notifications import NotificationWorker, RateLimitedSender
+from webhook import UpdateWebhook
+
 load_dotenv()
 
 # Configure logging
@@ -15,46 +25,79 @@ logger = logging.getLogger(__name__)
 # Bot token from environment
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 WEB_APP_URL = os.getenv('WEB_APP_URL', 'https://your-app-domain.com')
+# Another Bot API server, e.g. a local fake one for tests
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# "polling" (default) or "webhook"
+BOT_MODE = os.getenv('TELEGRAM_BOT_MODE', 'polling')
+# Public base URL Telegram posts updates to; without it the webhook is served but not registered
+WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', '/telegram/webhook')
+WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+WEBHOOK_HOST = os.getenv('TELEGRAM_WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('TELEGRAM_WEBHOOK_PORT', '8080'))
 
 if not BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable is required")
 
 # Initialize bot and dispatcher
-bot = Bot(token=BOT_TOKEN)
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session)
 dp = Dispatcher()
 
-@dp.message(CommandStart())
-async def start_command(message: types.Message):
-    """Handle /start command"""
-    user = message.from_user
-    
-    # Create Web App button
-    web_app = WebAppInfo(url=WEB_APP_URL)
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="🏠 Открыть приложение",
-                    web_app=web_app
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    text="ℹ️ О приложении",
-                    callback_data="about"
-                )
-            ]
+# Keyboards and texts are the same for everyone, so they are built once
+open_app_button = InlineKeyboardButton(
+    text="🏠 Открыть приложение",
+    web_app=WebAppInfo(url=WEB_APP_URL)
+)
+
+start_keyboard = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [open_app_button],
+        [
+            InlineKeyboardButton(
+                text="ℹ️ О приложении",
+                callback_data="about"
+            )
         ]
-    )
-    
-    welcome_text = f"""
+    ]
+)
+
+about_keyboard = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [open_app_button],
+        [
+            InlineKeyboardButton(
+                text="◀️ Назад",
+                callback_data="back_to_start"
+            )
+        ]
+    ]
+)
+
+open_app_keyboard = InlineKeyboardMarkup(inline_keyboard=[[open_app_button]])
+
+# Attached to match notifications
+notification_keyboard = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="💕 Посмотреть совпадения",
+                web_app=WebAppInfo(url=WEB_APP_URL)
+            )
+        ]
+    ]
+)
+
+# Filled in with the user's first name
+WELCOME_TEXT = """
 🏠 <b>Добро пожаловать в поиск соседей по квартире!</b>
 
-Привет, {user.first_name}! 👋
+Привет, {first_name}! 👋
 
 Наше приложение поможет вам:
 • 🗺️ Найти квартиры в вашем районе
-• 👥 Познакомиться с потенциальными соседами
+• 👥 Познакомиться с потенциальными соседями
 • 💕 Найти совпадения по интересам и бюджету
 • ❤️ Сохранить понравившиеся объявления
 
@@ -66,17 +109,8 @@ async def start_command(message: types.Message):
 
 Нажмите кнопку ниже, чтобы начать! 👇
     """
-    
-    await message.answer(
-        welcome_text,
-        reply_markup=keyboard,
-        parse_mode="HTML"
-    )
 
-@dp.callback_query(lambda c: c.data == "about")
-async def about_callback(callback_query: types.CallbackQuery):
-    """Handle about button"""
-    about_text = """
+ABOUT_TEXT = """
 <b>📱 О приложении "Поиск соседей"</b>
 
 <b>🎯 Цель:</b>
@@ -97,110 +131,109 @@ async def about_callback(callback_query: types.CallbackQuery):
 
 Удачи в поиске идеального жилья! 🏠
     """
-    
-    # Return to main menu button
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="🏠 Открыть приложение",
-                    web_app=WebAppInfo(url=WEB_APP_URL)
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    text="◀️ Назад",
-                    callback_data="back_to_start"
-                )
-            ]
-        ]
+
+def welcome_text(user: types.User) -> str:
+    return WELCOME_TEXT.format(first_name=html.escape(user.first_name))
+
+@dp.message(CommandStart())
+async def start_command(message: types.Message):
+    """Handle /start command"""
+    await message.answer(
+        welcome_text(message.from_user),
+        reply_markup=start_keyboard,
+        parse_mode="HTML"
     )
-    
+
+@dp.callback_query(lambda c: c.data == "about")
+async def about_callback(callback_query: types.CallbackQuery):
+    """Handle about button"""
     await callback_query.message.edit_text(
-        about_text,
-        reply_markup=keyboard,
+        ABOUT_TEXT,
+        reply_markup=about_keyboard,
         parse_mode="HTML"
     )
 
 @dp.callback_query(lambda c: c.data == "back_to_start")
 async def back_to_start_callback(callback_query: types.CallbackQuery):
     """Handle back to start button"""
-    user = callback_query.from_user
-    
-    web_app = WebAppInfo(url=WEB_APP_URL)
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="🏠 Открыть приложение",
-                    web_app=web_app
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    text="ℹ️ О приложении",
-                    callback_data="about"
-                )
-            ]
-        ]
-    )
-    
-    welcome_text = f"""
-🏠 <b>Добро пожаловать в поиск соседей по квартире!</b>
-
-Привет, {user.first_name}! 👋
-
-Наше приложение поможет вам:
-• 🗺️ Найти квартиры в вашем районе
-• 👥 Познакомиться с потенциальными соседями
-• 💕 Найти совпадения по интересам и бюджету
-• ❤️ Сохранить понравившиеся объявления
-
-<b>Как это работает:</b>
-1. Создайте профиль с вашими предпочтениями
-2. Ищите квартиры на карте в нужном районе
-3. Знакомьтесь с другими арендаторами
-4. Обменивайтесь контактами при взаимных лайках
-
-Нажмите кнопку ниже, чтобы начать! 👇
-    """
-    
     await callback_query.message.edit_text(
-        welcome_text,
-        reply_markup=keyboard,
+        welcome_text(callback_query.from_user),
+        reply_markup=start_keyboard,
         parse_mode="HTML"
     )
 
 @dp.message()
 async def handle_other_messages(message: types.Message):
     """Handle any other messages"""
-    web_app = WebAppInfo(url=WEB_APP_URL)
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="🏠 Открыть приложение",
-                    web_app=web_app
-                )
-            ]
-        ]
-    )
-    
     await message.answer(
         "Для использования всех функций откройте Web App 👆",
-        reply_markup=keyboard
+        reply_markup=open_app_keyboard
     )
 
+async def send_notification(chat_id: int, text: str):
+    await bot.send_message(
+        chat_id,
+        text,
+        reply_markup=notification_keyboard,
+        parse_mode="HTML"
+    )
+
+async def feed_update(update: dict):
+    await dp.feed_update(bot, types.Update.model_validate(update, context={"bot": bot}))
+
+async def run_webhook():
+    """Serve updates over HTTP until SIGINT/SIGTERM, then drain the ones in flight"""
+    webhook = UpdateWebhook(feed_update, secret_token=WEBHOOK_SECRET)
+    app = web.Application()
+    webhook.setup(app, WEBHOOK_PATH)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logger.info(f"Serving webhook updates on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=min(webhook.max_in_flight, 100),
+            allowed_updates=dp.resolve_used_update_types()
+        )
+    else:
+        logger.warning("TELEGRAM_WEBHOOK_URL is not set; the webhook is not registered with Telegram")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+
+    # Stops accepting connections, then drains the webhook
+    await runner.cleanup()
+    logger.info(f"Webhook stopped: {webhook.stats()}")
+
 async def main():
     """Main function to run the bot"""
-    logger.info("Starting Telegram Bot...")
-    
+    logger.info(f"Starting Telegram Bot in {BOT_MODE} mode...")
+
+    # Match notifications are read from MongoDB; the bot still answers without it
+    await connect_to_mongo()
+    notification_worker = NotificationWorker(RateLimitedSender(send_notification))
+    if database.client is not None:
+        notification_worker.start()
+
     try:
-        # Start polling
-        await dp.start_polling(bot)
+        if BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            # A webhook left over from webhook mode would keep updates from polling
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Error in bot: {e}")
     finally:
+        await notification_worker.stop()
+        await close_mongo_connection()
         await bot.session.close()
 
 if __name__ == '__main__':
@@ -209,4 +242,4 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
\ No newline at end of file
+        logger.error(f"Unexpected error: {e}")
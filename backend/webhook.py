@@ -0,0 +1,100 @@
+"""aiohttp endpoint receiving Telegram updates by webhook.
+
+Every POSTed update is handed to `feed` in its own task and acknowledged
+straight away, so slow handlers do not hold up Telegram's connection. At most
+`max_in_flight` updates are handled at once; beyond that a request waits for
+a free slot before it is acknowledged, which makes Telegram slow down. On
+shutdown new updates are refused (Telegram delivers them again later) and the
+ones in flight get `drain_timeout` seconds to finish.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("TELEGRAM_WEBHOOK_MAX_IN_FLIGHT", "100"))
+WEBHOOK_DRAIN_TIMEOUT_SECONDS = float(os.getenv("TELEGRAM_WEBHOOK_DRAIN_TIMEOUT_SECONDS", "10"))
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class UpdateWebhook:
+    """Feeds updates POSTed by Telegram to `feed`, a coroutine function taking the update as a dict"""
+
+    def __init__(
+        self,
+        feed: Callable[[Dict[str, Any]], Awaitable[object]],
+        secret_token: Optional[str] = None,
+        max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT,
+        drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT_SECONDS
+    ):
+        self.feed = feed
+        self.secret_token = secret_token
+        self.max_in_flight = max_in_flight
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: Set[asyncio.Task] = set()
+        self._draining = False
+        self.received = 0
+        self.failed = 0
+        self.refused = 0
+
+    def setup(self, app: web.Application, path: str):
+        """Serve the webhook at `path` and drain it when the app shuts down"""
+        app.router.add_post(path, self.handle)
+
+        async def on_shutdown(app: web.Application):
+            await self.drain()
+
+        app.on_shutdown.append(on_shutdown)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret_token and request.headers.get(SECRET_TOKEN_HEADER) != self.secret_token:
+            return web.Response(status=401)
+        if self._draining:
+            self.refused += 1
+            return web.Response(status=503)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        await self._slots.acquire()
+        self.received += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Dict[str, Any]):
+        try:
+            await self.feed(update)
+        except Exception:
+            self.failed += 1
+            logger.exception("Handling update %s failed", update.get("update_id"))
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        """Refuse new updates and wait for the ones being handled"""
+        self._draining = True
+        if not self._tasks:
+            return
+        logger.info("Waiting for %d updates in flight", len(self._tasks))
+        _, pending = await asyncio.wait(set(self._tasks), timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            logger.warning("Cancelled %d updates still in flight after %ss", len(pending), self.drain_timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "received": self.received,
+            "in_flight": len(self._tasks),
+            "failed": self.failed,
+            "refused": self.refused
+        }
@@ -2,14 +2,29 @@
 """
 Comprehensive Backend API Testing for Roommate Finder App
 Tests all backend endpoints with realistic data
+
+Run without arguments for the correctness checks, or with `load` to replay
+realistic user sessions against a local backend seeded by
+backend/generate_test_data.py:
+
+    python backend_test.py load --users 200 --rps 150 --duration 120 --output run.json
 """
 
+import argparse
 import asyncio
 import aiohttp
 import json
+import math
 import os
+import random
+import sys
+import time
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from benchmark_stats import percentile
 
 # Test configuration - Use internal backend URL since ngrok is misconfigured
 BASE_URL = "http://localhost:8001/api"  # Direct backend connection
@@ -46,6 +61,12 @@ TEST_USERS = [
     }
 ]
 
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters, on the sphere $geoNear uses"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6378100 * math.asin(math.sqrt(a))
+
 class BackendTester:
     def __init__(self):
         self.session = None
@@ -215,6 +236,93 @@ class BackendTester:
             self.log_result(f"Get Properties {telegram_id}", False, f"Exception: {str(e)}")
             return False
     
+    async def test_get_properties_paged(self, user_data: Dict[str, Any], limit: int = 3) -> bool:
+        """Test walking every page of properties near user with limit/cursor"""
+        telegram_id = user_data["telegram_id"]
+        test_name = f"Get Properties Paged {telegram_id}"
+        try:
+            async with self.session.get(f"{BASE_URL}/properties", params={"telegram_id": telegram_id}) as response:
+                if response.status != 200:
+                    self.log_result(test_name, False, f"Unpaged list: HTTP {response.status}")
+                    return False
+                unpaged = await response.json()
+            
+            paged = []
+            cursor = None
+            for _ in range(len(unpaged) // limit + 2):
+                params = {"telegram_id": telegram_id, "limit": limit}
+                if cursor:
+                    params["cursor"] = cursor
+                async with self.session.get(f"{BASE_URL}/properties", params=params) as response:
+                    if response.status != 200:
+                        self.log_result(test_name, False, f"Page {len(paged) // limit + 1}: HTTP {response.status}")
+                        return False
+                    page = await response.json()
+                    cursor = response.headers.get("X-Next-Cursor")
+                if len(page) > limit:
+                    self.log_result(test_name, False, f"Page of {len(page)} properties exceeds limit {limit}")
+                    return False
+                paged.extend(page)
+                if not cursor:
+                    break
+            else:
+                self.log_result(test_name, False, "X-Next-Cursor still set after the last page")
+                return False
+            
+            paged_ids = [prop["id"] for prop in paged]
+            distances = [
+                distance_m(user_data["latitude"], user_data["longitude"], prop["latitude"], prop["longitude"])
+                for prop in paged
+            ]
+            if len(paged_ids) != len(set(paged_ids)):
+                self.log_result(test_name, False, "Duplicate properties across pages")
+                return False
+            if set(paged_ids) != {prop["id"] for prop in unpaged}:
+                self.log_result(test_name, False, f"Paged {len(paged_ids)} properties, unpaged {len(unpaged)}")
+                return False
+            # Responses carry no distance, so it is recomputed; allow for rounding
+            if any(later < earlier - 0.01 for earlier, later in zip(distances, distances[1:])):
+                self.log_result(test_name, False, "Distances decrease across pages")
+                return False
+            
+            params = {"telegram_id": telegram_id, "limit": limit, "cursor": "not-a-cursor"}
+            async with self.session.get(f"{BASE_URL}/properties", params=params) as response:
+                if response.status != 400:
+                    self.log_result(test_name, False, f"Invalid cursor: expected HTTP 400, got {response.status}")
+                    return False
+            
+            self.log_result(test_name, True, f"{len(paged)} properties in pages of {limit}")
+            return True
+        except Exception as e:
+            self.log_result(test_name, False, f"Exception: {str(e)}")
+            return False
+    
+    async def test_property_tile(self, user_data: Dict[str, Any], zoom: int = 14) -> bool:
+        """Test that a property tile carries an ETag and revalidates with 304"""
+        # The slippy-map tile holding the user's location
+        lat = math.radians(user_data["latitude"])
+        x = int((user_data["longitude"] + 180) / 360 * 2 ** zoom)
+        y = int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * 2 ** zoom)
+        url = f"{BASE_URL}/properties/tiles/{zoom}/{x}/{y}"
+        try:
+            async with self.session.get(url) as response:
+                etag = response.headers.get("ETag")
+                if response.status != 200 or not etag:
+                    self.log_result(f"Property Tile {user_data['telegram_id']}", False, f"HTTP {response.status}, ETag: {etag}")
+                    return False
+                properties = await response.json()
+            
+            async with self.session.get(url, headers={"If-None-Match": etag}) as response:
+                if response.status != 304:
+                    self.log_result(f"Property Tile {user_data['telegram_id']}", False, f"Revalidation returned HTTP {response.status}, expected 304")
+                    return False
+            
+            self.log_result(f"Property Tile {user_data['telegram_id']}", True, f"{len(properties)} properties, ETag {etag} revalidated with 304")
+            return True
+        except Exception as e:
+            self.log_result(f"Property Tile {user_data['telegram_id']}", False, f"Exception: {str(e)}")
+            return False
+    
     async def test_get_matches(self, telegram_id: int) -> bool:
         """Test get potential matches"""
         try:
@@ -323,6 +431,202 @@ class BackendTester:
             self.log_result(f"Get Liked Properties {telegram_id}", False, f"Exception: {str(e)}")
             return False
     
+    async def create_temp_users(self, count: int) -> List[Dict[str, Any]]:
+        """Create users with fresh random telegram ids, for tests that need no prior likes"""
+        users = []
+        for index in range(count):
+            telegram_id = random.randrange(10**10, 10**11)
+            user_data = dict(
+                TEST_USERS[index % len(TEST_USERS)],
+                telegram_id=telegram_id,
+                username=f"test_{telegram_id}"
+            )
+            async with self.session.post(f"{BASE_URL}/users", json=user_data) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"Creating temporary user: HTTP {response.status}: {await response.text()}")
+                users.append(dict(await response.json(), telegram_id=telegram_id))
+        return users
+    
+    async def get_user_match_ids(self, telegram_id: int, expected: int, timeout: float = 5.0) -> List[str]:
+        """Ids of the user's confirmed matches, polling until `expected` appear or time runs out.
+
+        With LIKE_WRITE_BEHIND the match of buffered likes is only created
+        after they are flushed.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            async with self.session.get(f"{BASE_URL}/user-matches", params={"telegram_id": telegram_id}) as response:
+                response.raise_for_status()
+                match_ids = [match_user["id"] for match_user in await response.json()]
+            if len(match_ids) >= expected or time.monotonic() >= deadline:
+                return match_ids
+            await asyncio.sleep(0.2)
+    
+    async def test_concurrent_mutual_likes(self) -> bool:
+        """Test that two users liking each other at the same moment get a single match"""
+        try:
+            user_a, user_b = await self.create_temp_users(2)
+            
+            async def like(liker: Dict[str, Any], liked: Dict[str, Any]) -> Dict[str, Any]:
+                params = {"telegram_id": liker["telegram_id"], "target_id": liked["id"], "target_type": "user"}
+                async with self.session.post(f"{BASE_URL}/likes", params=params) as response:
+                    response.raise_for_status()
+                    return await response.json()
+            
+            results = await asyncio.gather(like(user_a, user_b), like(user_b, user_a))
+            reported = {result["match"] for result in results if result["is_match"]}
+            match_ids = await self.get_user_match_ids(user_a["telegram_id"], expected=1)
+            
+            if len(reported) > 1:
+                self.log_result("Concurrent Mutual Likes", False, f"Likes reported different matches: {reported}")
+                return False
+            if match_ids != [user_b["id"]]:
+                self.log_result("Concurrent Mutual Likes", False,
+                              f"Expected one match with {user_b['id']}, got: {match_ids}")
+                return False
+            self.log_result("Concurrent Mutual Likes", True, f"Single match, reported by {len(reported)} like(s)")
+            return True
+        except Exception as e:
+            self.log_result("Concurrent Mutual Likes", False, f"Exception: {str(e)}")
+            return False
+    
+    async def test_like_batch(self) -> bool:
+        """Test per-item statuses of a like batch and the match it completes"""
+        try:
+            user, liker, liked = await self.create_temp_users(3)
+            for sender, target in ((liker, user), (user, liked)):
+                params = {"telegram_id": sender["telegram_id"], "target_id": target["id"], "target_type": "user"}
+                async with self.session.post(f"{BASE_URL}/likes", params=params) as response:
+                    response.raise_for_status()
+            
+            batch = {
+                "telegram_id": user["telegram_id"],
+                "likes": [
+                    {"target_id": liker["id"], "target_type": "user"},  # completes a mutual pair
+                    {"target_id": liker["id"], "target_type": "user"},  # repeated in the batch
+                    {"target_id": liked["id"], "target_type": "user"},  # liked before the batch
+                    {"target_id": liked["id"], "target_type": "flat"}   # unknown target type
+                ]
+            }
+            async with self.session.post(f"{BASE_URL}/likes/batch", json=batch) as response:
+                if response.status != 200:
+                    self.log_result("Like Batch", False, f"HTTP {response.status}: {await response.text()}")
+                    return False
+                data = await response.json()
+            
+            first, repeated, existing, invalid = data["results"]
+            problems = []
+            if first["status"] != "created" or not first["like_id"] or not first["is_match"]:
+                problems.append(f"mutual like: {first}")
+            if (repeated["status"], repeated["like_id"], repeated["match"]) != (first["status"], first["like_id"], first["match"]):
+                problems.append(f"repeated like differs from the first: {repeated}")
+            if existing["status"] != "exists" or existing["like_id"] or existing["is_match"]:
+                problems.append(f"existing like: {existing}")
+            if invalid["status"] != "invalid":
+                problems.append(f"invalid like: {invalid}")
+            if data["matches"] != [first["match"]]:
+                problems.append(f"expected one match {first['match']}, got: {data['matches']}")
+            match_ids = await self.get_user_match_ids(user["telegram_id"], expected=1)
+            if match_ids != [liker["id"]]:
+                problems.append(f"expected one confirmed match with {liker['id']}, got: {match_ids}")
+            
+            if problems:
+                self.log_result("Like Batch", False, "; ".join(problems))
+                return False
+            self.log_result("Like Batch", True, f"Statuses: {[result['status'] for result in data['results']]}")
+            return True
+        except Exception as e:
+            self.log_result("Like Batch", False, f"Exception: {str(e)}")
+            return False
+    
+    async def test_like_lookup(self) -> bool:
+        """Test that /likes/lookup reflects a new like and rejects unknown target types"""
+        try:
+            user, target, other = await self.create_temp_users(3)
+            
+            async def lookup(target_type: str) -> aiohttp.ClientResponse:
+                body = {"telegram_id": user["telegram_id"], "target_type": target_type, "target_ids": [target["id"], other["id"]]}
+                async with self.session.post(f"{BASE_URL}/likes/lookup", json=body) as response:
+                    await response.read()
+                    return response
+            
+            before = await lookup("user")
+            params = {"telegram_id": user["telegram_id"], "target_id": target["id"], "target_type": "user"}
+            async with self.session.post(f"{BASE_URL}/likes", params=params) as response:
+                response.raise_for_status()
+            after = await lookup("user")
+            invalid = await lookup("flat")
+            
+            if before.status != 200 or (await before.json())["liked_ids"] != []:
+                self.log_result("Like Lookup", False, f"Before the like: HTTP {before.status}: {await before.text()}")
+                return False
+            if after.status != 200 or (await after.json())["liked_ids"] != [target["id"]]:
+                self.log_result("Like Lookup", False, f"After the like: HTTP {after.status}: {await after.text()}")
+                return False
+            if invalid.status != 400:
+                self.log_result("Like Lookup", False, f"Unknown target type returned HTTP {invalid.status}, expected 400")
+                return False
+            self.log_result("Like Lookup", True, "Lookup reflects the new like; unknown target type rejected")
+            return True
+        except Exception as e:
+            self.log_result("Like Lookup", False, f"Exception: {str(e)}")
+            return False
+    
+    async def test_likes_reflected(self) -> bool:
+        """Test that new likes show in is_liked at once and a mutual pair still matches.
+
+        Run the server with LIKE_WRITE_BEHIND=true as well: the likes are then
+        acknowledged from the write buffer before they are written, and the
+        match is only created by the flush.
+        """
+        try:
+            user, other = await self.create_temp_users(2)
+            
+            async def like(liker: Dict[str, Any], target_id: str, target_type: str):
+                params = {"telegram_id": liker["telegram_id"], "target_id": target_id, "target_type": target_type}
+                async with self.session.post(f"{BASE_URL}/likes", params=params) as response:
+                    response.raise_for_status()
+            
+            async def liked_ids(path: str, stream: bool) -> List[str]:
+                headers = {"Accept": "application/x-ndjson"} if stream else {}
+                async with self.session.get(f"{BASE_URL}/{path}", params={"telegram_id": user["telegram_id"]}, headers=headers) as response:
+                    response.raise_for_status()
+                    if stream:
+                        items = [json.loads(line) for line in (await response.text()).splitlines() if line]
+                    else:
+                        items = await response.json()
+                return [item["id"] for item in items if item["is_liked"]]
+            
+            async with self.session.get(f"{BASE_URL}/properties", params={"telegram_id": user["telegram_id"], "limit": 1}) as response:
+                response.raise_for_status()
+                nearest = await response.json()
+            if not nearest:
+                self.log_result("Likes Reflected", False, "No property near the test user to like")
+                return False
+            
+            await like(user, nearest[0]["id"], "property")
+            await like(user, other["id"], "user")
+            problems = []
+            for path, expected in (("properties", nearest[0]["id"]), ("matches", other["id"])):
+                for stream in (False, True):
+                    found = await liked_ids(path, stream)
+                    if found != [expected]:
+                        problems.append(f"/{path}{' (ndjson)' if stream else ''} liked {found}, expected [{expected}]")
+            
+            await like(other, user["id"], "user")
+            match_ids = await self.get_user_match_ids(user["telegram_id"], expected=1)
+            if match_ids != [other["id"]]:
+                problems.append(f"expected one confirmed match with {other['id']}, got: {match_ids}")
+            
+            if problems:
+                self.log_result("Likes Reflected", False, "; ".join(problems))
+                return False
+            self.log_result("Likes Reflected", True, "Likes shown in is_liked at once; mutual pair matched")
+            return True
+        except Exception as e:
+            self.log_result("Likes Reflected", False, f"Exception: {str(e)}")
+            return False
+    
     async def test_invalid_data(self) -> bool:
         """Test API with invalid data"""
         invalid_user = {
@@ -390,6 +694,8 @@ class BackendTester:
         # 5. Properties Tests
         for user_data in TEST_USERS:
             await self.test_get_properties(user_data["telegram_id"])
+            await self.test_get_properties_paged(user_data)
+            await self.test_property_tile(user_data)
         
         # 6. Matches Tests
         for user_data in TEST_USERS:
@@ -409,6 +715,11 @@ class BackendTester:
             if user2_actual_id:
                 await self.test_create_like(user1_id, user2_actual_id, "user")
         
+        await self.test_concurrent_mutual_likes()
+        await self.test_like_batch()
+        await self.test_like_lookup()
+        await self.test_likes_reflected()
+        
         # 8. User Matches Tests
         for user_data in TEST_USERS:
             await self.test_get_user_matches(user_data["telegram_id"])
@@ -447,8 +758,246 @@ class BackendTester:
         for result in self.test_results:
             print(f"   {result['status']}: {result['test']}")
 
+class RatePacer:
+    """Spaces requests from all virtual users evenly to reach a target RPS"""
+    
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self.next_slot = time.monotonic()
+    
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+class LoadTester(BackendTester):
+    """Load generator that replays user sessions through the same API as the checks.
+    
+    Every virtual user is a seeded user that loops through a session script
+    (open map, browse matches, swipe, check matches) until the run ends.
+    Requests are labelled by route, so results compare across runs.
+    """
+    
+    # Statuses that are a normal outcome for a route, e.g. swiping a target twice
+    EXPECTED_STATUSES = {"POST /likes": {400}}
+    
+    def __init__(self, users: int, rps: float, duration: float, think_time: float, seed: int):
+        super().__init__()
+        self.num_users = users
+        self.rps = rps
+        self.duration = duration
+        self.think_time = think_time
+        self.seed = seed
+        self.pacer = RatePacer(rps)
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.deadline = 0.0
+    
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=max(100, self.num_users))
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+        return self
+    
+    async def load_seeded_users(self) -> List[Dict[str, Any]]:
+        """Sample users created by generate_test_data.py from the local mongod"""
+        from motor.motor_asyncio import AsyncIOMotorClient
+        
+        mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+        db_name = os.getenv("MONGODB_DB_NAME", "roommate_app")
+        client = AsyncIOMotorClient(mongo_url)
+        try:
+            # telegram_ids grow with the generated row index, and low rows
+            # get the most likes. Ids are hashes of the row index, so the
+            # lowest ids are a random sample that stays the same between runs
+            return await client[db_name].users.find(
+                {"is_active": True},
+                {"_id": 0, "telegram_id": 1, "location": 1}
+            ).sort("id", 1).limit(self.num_users).to_list(length=None)
+        finally:
+            client.close()
+    
+    async def request(self, label: str, method: str, path: str, **kwargs) -> Optional[Any]:
+        """Send one paced request and record its latency under `label`"""
+        await self.pacer.wait()
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, f"{BASE_URL}{path}", **kwargs) as response:
+                body = await response.read()
+                status = response.status
+        except Exception:
+            status, body = None, None
+        self.latencies.setdefault(label, []).append(time.perf_counter() - start)
+        
+        if status is None or (status >= 400 and status not in self.EXPECTED_STATUSES.get(label, ())):
+            self.errors[label] = self.errors.get(label, 0) + 1
+            return None
+        return json.loads(body) if status == 200 and body else None
+    
+    async def think(self, rng: random.Random):
+        if self.think_time:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * self.think_time)
+    
+    async def run_session(self, user: Dict[str, Any], rng: random.Random):
+        """One visit to the web app"""
+        telegram_id = user["telegram_id"]
+        lng, lat = user["location"]["coordinates"]
+        
+        # Open the map: clusters around the user, then the first page of listings
+        bbox = f"{lng - 0.05},{lat - 0.03},{lng + 0.05},{lat + 0.03}"
+        await self.request("GET /properties/clusters", "GET", "/properties/clusters",
+                           params={"bbox": bbox, "zoom": 13})
+        properties = await self.request("GET /properties", "GET", "/properties",
+                                        params={"telegram_id": telegram_id, "limit": 20}) or []
+        await self.think(rng)
+        
+        # Browse matches and swipe through some of them and of the listings
+        candidates = await self.request("GET /matches", "GET", "/matches",
+                                        params={"telegram_id": telegram_id}) or []
+        await self.think(rng)
+        swipes = [(match["id"], "user") for match in rng.sample(candidates, min(5, len(candidates)))]
+        swipes += [(prop["id"], "property") for prop in rng.sample(properties, min(3, len(properties)))]
+        for target_id, target_type in swipes:
+            if time.monotonic() >= self.deadline:
+                return
+            await self.request("POST /likes", "POST", "/likes", params={
+                "telegram_id": telegram_id,
+                "target_id": target_id,
+                "target_type": target_type
+            })
+            await self.think(rng)
+        
+        # Check what came of it
+        await self.request("GET /user-matches", "GET", "/user-matches",
+                           params={"telegram_id": telegram_id})
+        await self.request("GET /liked-properties", "GET", "/liked-properties",
+                           params={"telegram_id": telegram_id})
+        await self.think(rng)
+    
+    async def virtual_user(self, user: Dict[str, Any], index: int):
+        rng = random.Random(self.seed + index)
+        # Stagger session starts so users do not move in lockstep
+        await asyncio.sleep(rng.uniform(0, self.think_time or 0))
+        while time.monotonic() < self.deadline:
+            await self.run_session(user, rng)
+    
+    async def run_load(self) -> Dict[str, Any]:
+        users = await self.load_seeded_users()
+        if not users:
+            raise RuntimeError("No users found; seed the database with backend/generate_test_data.py first")
+        
+        print("🚀 Starting load test")
+        print(f"📍 Base URL: {BASE_URL}")
+        print(f"👥 {len(users)} virtual users, target {self.rps:g} RPS for {self.duration:g}s")
+        
+        started_at = datetime.now().isoformat()
+        start = time.monotonic()
+        self.deadline = start + self.duration
+        await asyncio.gather(*(self.virtual_user(user, i) for i, user in enumerate(users)))
+        elapsed = time.monotonic() - start
+        
+        return self.build_report(started_at, elapsed, len(users))
+    
+    def build_report(self, started_at: str, elapsed: float, num_users: int) -> Dict[str, Any]:
+        endpoints = {}
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            errors = self.errors.get(label, 0)
+            endpoints[label] = {
+                "requests": len(values),
+                "errors": errors,
+                "error_rate": errors / len(values),
+                "rps": len(values) / elapsed,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": values[-1] * 1000
+            }
+        
+        total_requests = sum(endpoint["requests"] for endpoint in endpoints.values())
+        total_errors = sum(endpoint["errors"] for endpoint in endpoints.values())
+        all_values = sorted(value for values in self.latencies.values() for value in values)
+        return {
+            "base_url": BASE_URL,
+            "started_at": started_at,
+            "config": {
+                "users": num_users,
+                "target_rps": self.rps,
+                "duration_s": self.duration,
+                "think_time_s": self.think_time,
+                "seed": self.seed
+            },
+            "elapsed_s": elapsed,
+            "total": {
+                "requests": total_requests,
+                "errors": total_errors,
+                "error_rate": total_errors / total_requests if total_requests else 0.0,
+                "rps": total_requests / elapsed,
+                "p50_ms": percentile(all_values, 50) * 1000,
+                "p95_ms": percentile(all_values, 95) * 1000,
+                "p99_ms": percentile(all_values, 99) * 1000
+            },
+            "endpoints": endpoints
+        }
+
+def print_load_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    """Print per-endpoint latency and errors, with p95 change against a baseline run"""
+    print("\n" + "=" * 96)
+    print("📊 LOAD TEST SUMMARY")
+    print("=" * 96)
+    print(f"{'endpoint':<28}{'requests':>9}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>9}{'p95 vs base':>13}")
+    
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for label, stats in rows:
+        change = ""
+        if baseline is not None:
+            base = baseline["total"] if label == "TOTAL" else baseline["endpoints"].get(label)
+            if base and base["p95_ms"]:
+                change = f"{(stats['p95_ms'] / base['p95_ms'] - 1) * 100:+.1f}%"
+        print(
+            f"{label:<28}{stats['requests']:>9}{stats['rps']:>8.1f}{stats['p50_ms']:>9.1f}"
+            f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['error_rate'] * 100:>8.2f}%{change:>13}"
+        )
+
+async def run_load_test(args):
+    async with LoadTester(args.users, args.rps, args.duration, args.think_time, args.seed) as tester:
+        report = await tester.run_load()
+    
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_load_report(report, baseline)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
 async def main():
     """Main test runner"""
+    parser = argparse.ArgumentParser(description="Backend API checks and load testing.")
+    subparsers = parser.add_subparsers(dest="mode")
+    load_parser = subparsers.add_parser("load", help="Replay concurrent user sessions and report latency.")
+    load_parser.add_argument("--users", type=int, default=100, help="Number of concurrent virtual users.")
+    load_parser.add_argument("--rps", type=float, default=50, help="Target requests per second (0 = unpaced).")
+    load_parser.add_argument("--duration", type=float, default=60, help="Test duration in seconds.")
+    load_parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between user actions in seconds.")
+    load_parser.add_argument("--seed", type=int, default=42, help="Seed for swipe choices and think times.")
+    load_parser.add_argument("--output", help="Write machine-readable results to this JSON file.")
+    load_parser.add_argument("--baseline", help="Results JSON of an earlier run to compare p95 latency with.")
+    args = parser.parse_args()
+    
+    if args.mode == "load":
+        await run_load_test(args)
+        return
+    
     async with BackendTester() as tester:
         await tester.run_all_tests()
 
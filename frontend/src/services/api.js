@@ -1,12 +1,36 @@
 import axios from 'axios';
+import { decode } from '@msgpack/msgpack';
 
 const BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+const MSGPACK_MEDIA_TYPE = 'application/msgpack';
+
+// Ask for MessagePack instead of JSON; responses decode to the same objects
+const USE_MSGPACK = process.env.REACT_APP_USE_MSGPACK === 'true';
 
 const api = axios.create({
   baseURL: BASE_URL,
   timeout: 10000,
+  ...(USE_MSGPACK
+    ? { headers: { Accept: `${MSGPACK_MEDIA_TYPE}, application/json` }, responseType: 'arraybuffer' }
+    : {})
 });
 
+// With responseType 'arraybuffer' axios leaves bodies undecoded, including
+// JSON error responses
+const decodeBody = (response) => {
+  if (!(response.data instanceof ArrayBuffer)) {
+    return response.data;
+  }
+  if (response.data.byteLength === 0) {
+    return '';
+  }
+  const contentType = response.headers['content-type'] || '';
+  if (contentType.includes(MSGPACK_MEDIA_TYPE)) {
+    return decode(new Uint8Array(response.data));
+  }
+  return JSON.parse(new TextDecoder().decode(response.data));
+};
+
 // Request interceptor
 api.interceptors.request.use(
   (config) => {
@@ -20,9 +44,13 @@ api.interceptors.request.use(
 // Response interceptor
 api.interceptors.response.use(
   (response) => {
+    response.data = decodeBody(response);
     return response;
   },
   (error) => {
+    if (error.response) {
+      error.response.data = decodeBody(error.response);
+    }
     console.error('API Error:', error.response?.data || error.message);
     return Promise.reject(error);
   }
@@ -57,6 +85,74 @@ export const apiService = {
     return response.data;
   },
 
+  async getPropertiesPage(telegramId, limit, cursor = null) {
+    const response = await api.get('/api/properties', {
+      params: {
+        telegram_id: telegramId,
+        limit,
+        ...(cursor ? { cursor } : {})
+      }
+    });
+    return {
+      items: response.data,
+      nextCursor: response.headers['x-next-cursor'] || null
+    };
+  },
+
+  // Streams the full list one item at a time; path is one of
+  // /api/properties, /api/matches or /api/liked-properties.
+  async streamList(path, telegramId, onItem) {
+    const response = await fetch(`${BASE_URL}${path}?telegram_id=${telegramId}`, {
+      headers: { Accept: 'application/x-ndjson' }
+    });
+    if (!response.ok) {
+      throw new Error(`Request failed with status ${response.status}`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      lines.filter(Boolean).forEach((line) => onItem(JSON.parse(line)));
+      if (done) {
+        break;
+      }
+    }
+  },
+
+  // bbox: [minLng, minLat, maxLng, maxLat]
+  async getPropertyClusters(bbox, zoom) {
+    const response = await api.get('/api/properties/clusters', {
+      params: { bbox: bbox.join(','), zoom }
+    });
+    return response.data;
+  },
+
+  // Tiles are shared between users; pass the previous ETag to revalidate.
+  // Resolves to null when the cached tile is still current (HTTP 304).
+  async getPropertyTile(z, x, y, etag = null) {
+    const response = await api.get(`/api/properties/tiles/${z}/${x}/${y}`, {
+      headers: etag ? { 'If-None-Match': etag } : {},
+      validateStatus: (status) => status === 200 || status === 304
+    });
+    if (response.status === 304) {
+      return null;
+    }
+    return { items: response.data, etag: response.headers.etag || null };
+  },
+
+  async getLikedIds(telegramId, targetType, targetIds) {
+    const response = await api.post('/api/likes/lookup', {
+      telegram_id: telegramId,
+      target_type: targetType,
+      target_ids: targetIds
+    });
+    return response.data.liked_ids;
+  },
+
   async getLikedProperties(telegramId) {
     const response = await api.get(`/api/liked-properties?telegram_id=${telegramId}`);
     return response.data;
@@ -82,6 +178,15 @@ export const apiService = {
       }
     });
     return response.data;
+  },
+
+  // likes: [{ target_id, target_type }], e.g. swipes queued since the last flush
+  async createLikesBatch(telegramId, likes) {
+    const response = await api.post('/api/likes/batch', {
+      telegram_id: telegramId,
+      likes
+    });
+    return response.data;
   }
 };
 